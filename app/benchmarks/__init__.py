@@ -0,0 +1,9 @@
+""" A reproducible benchmark of the annotation pipeline on generated documents (see generator.py), cpu only and offline:
+the model of the named entity recognition is stubbed (see stub_model.py).
+
+    python -m app.benchmarks --scale medium --output results.json
+    python -m app.benchmarks --scale medium --output results.json --baseline baseline.json
+
+The results (json) of a run can be used as the baseline of the next runs on the same machine, a regression of a
+benchmark (by default 10 % slower) lets the run fail.
+"""
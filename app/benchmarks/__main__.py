@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+
+# The shards are processed by other processes without the stub of the model, the benchmarks run serially
+os.environ.setdefault('SHARD_WORKERS', '0')
+
+from .end_to_end import run_end_to_end_benchmarks
+from .generator import SCALES, generate_document
+from .micro import MICRO_BENCHMARKS, run_micro_benchmarks
+from .results import create_results, save_results, load_results, compare_results, format_results, \
+    format_comparison
+from .stub_model import stubbed_model
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m app.benchmarks', description=sys.modules[__package__].__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=list(SCALES), default='medium', help="The size of the generated document.")
+    parser.add_argument('--density', type=float, default=None,
+                        help="The share of the sentences with an entity (default of the scale).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help="The measured runs per benchmark.")
+    parser.add_argument('--only', choices=['micro', 'end_to_end'], default=None)
+    parser.add_argument('--benchmark', action='append', choices=list(MICRO_BENCHMARKS), default=None,
+                        help="Runs only the micro-benchmark (can be repeated).")
+    parser.add_argument('--output', help="The json file of the results.")
+    parser.add_argument('--baseline', help="The json file of the results to compare with.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="A benchmark slower than its baseline by this ratio is a regression.")
+    parser.add_argument('--statistic', choices=['median', 'min'], default='median',
+                        help="The statistic of the runs compared with the baseline.")
+    args = parser.parse_args()
+
+    parameters = dict(SCALES[args.scale], scale=args.scale, seed=args.seed, repeat=args.repeat)
+    if args.density is not None:
+        parameters['density'] = args.density
+    document = generate_document('__benchmark__', seed=args.seed,
+                                 **{_: parameters[_] for _ in SCALES[args.scale]})
+
+    benchmarks = {}
+    with stubbed_model():
+        if args.only in [None, 'micro']:
+            benchmarks.update(run_micro_benchmarks(document, args.repeat, args.benchmark))
+        if args.only in [None, 'end_to_end']:
+            benchmarks.update(run_end_to_end_benchmarks(document, args.repeat))
+    results = create_results(parameters, benchmarks)
+    print(format_results(results))
+    if args.output:
+        save_results(results, args.output)
+
+    if not args.baseline:
+        return 0
+    baseline = load_results(args.baseline)
+    if baseline['parameters'] != results['parameters']:
+        print(f"The parameters differ from the baseline: {baseline['parameters']}", file=sys.stderr)
+    comparison = compare_results(results, baseline, args.threshold, args.statistic)
+    print()
+    print(format_comparison(comparison))
+    return 1 if any([verdict == 'regression' for *_, verdict in comparison]) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+""" The end-to-end benchmark: the whole pipeline on a generated document, per backend of the named entity recognition
+(the model is stubbed, see stub_model.py), and the resubmission of an unchanged document (incremental annotation). """
+from typing import Dict
+
+from app.core.annotation_modul.apis.annotation_cache import ANNOTATION_CACHES
+from app.core.annotation_modul.processing_context import PROCESSING_CONTEXTS
+from app.core.schemas.datamodel import Document
+from app.core.task_api import Task, TaskSettings
+
+from .generator import count_words
+from .results import measure
+
+BACKENDS = ['flair', 'gazetteer', 'cascade']
+
+
+def process_document(document: Dict, keep_cache: bool = False) -> Document:
+    """ Runs the pipeline on the document as a task of the scheduler does and returns the processed document.
+    Nothing of the document is kept, only the cache of the incremental annotation if keep_cache is set. """
+    task_settings = TaskSettings.create(client='benchmark', document=Document.from_json(document))
+    try:
+        Task.execute_annotation(task_settings)
+    finally:
+        PROCESSING_CONTEXTS.pop(document['id'], None)
+        if not keep_cache:
+            ANNOTATION_CACHES.pop(document['id'], None)
+    return task_settings.data
+
+
+def run_end_to_end_benchmarks(document: Dict, repeat: int = 5) -> Dict[str, Dict]:
+    res = {}
+    words = count_words(document)
+    for backend in BACKENDS:
+        settings = dict(document, ner_backend=backend, incremental=False)
+        res[f'end_to_end.{backend}'] = measure(lambda _: process_document(settings), repeat=repeat)
+
+    # The document is processed once before every run, the run reuses its tokens and annotations
+    settings = dict(document, ner_backend='flair', incremental=True)
+    res['end_to_end.resubmission'] = measure(lambda _: process_document(settings, keep_cache=True),
+                                             setup=lambda: process_document(settings, keep_cache=True), repeat=repeat)
+    ANNOTATION_CACHES.pop(document['id'], None)
+
+    for result in res.values():
+        result['words'] = words
+        result['words_per_second'] = words / result['median']
+    return res
@@ -0,0 +1,96 @@
+""" Synthetic documents for the benchmarks, in the format of the request body of /annotation/extract_annotations.
+
+A document is generated from a seed, the same parameters always give the same document. The vocabulary is fixed here
+(and not read from the resources), so a change of the gazetteer does not change the benchmark documents.
+The annotation density is the share of the sentences that mention an entity: a parameter with a value and a unit
+(gazetteer), an acronym in brackets or a material (found by the stubbed model, see stub_model.py). The other sentences
+are filler without any entity.
+"""
+import random
+from typing import Dict, List
+
+# The parameters of the documents per scale
+SCALES = {
+    'small': dict(chapters=2, paragraphs=3, sentences=4, tables=1, table_rows=4, table_columns=3, density=0.3),
+    'medium': dict(chapters=8, paragraphs=5, sentences=6, tables=3, table_rows=10, table_columns=4, density=0.3),
+    'large': dict(chapters=24, paragraphs=8, sentences=8, tables=6, table_rows=25, table_columns=5, density=0.3)
+}
+
+# The parameters of the experiments with their unit and the range of their values (gazetteer and units)
+PARAMETERS = [
+    ('normal load', 'N', (1, 100)),
+    ('Hertzian Pressure', 'GPa', (0.1, 3.0)),
+    ('relative Humidity', '%', (5, 95)),
+    ('Temperature', '°C', (20, 400)),
+    ('Frequency', 'Hz', (1, 50)),
+    ('sliding speed', 'mm/s', (1, 200)),
+    ('sliding distance', 'm', (10, 1000))
+]
+# The materials are the entities of the stubbed model
+MATERIALS = ['MXene', 'Graphene', 'Molybdenum disulfide', 'Titanium nitride', 'Steel', 'Polytetrafluoroethylene',
+             'Alumina', 'Tungsten carbide', 'Silicon nitride', 'Copper']
+ACRONYMS = [('coefficient of friction', 'COF'), ('diamond-like carbon', 'DLC'), ('scanning electron microscopy', 'SEM'),
+            ('physical vapour deposition', 'PVD'), ('wear rate', 'WR')]
+ENTITY_TEMPLATES = [
+    'The {parameter} was set to {value} {unit} for all samples.',
+    'At a {parameter} of {value} {unit} the {material} coating showed a lower wear.',
+    'The {long_form} ({acronym}) of {material} decreased at a {parameter} of {value} {unit}.',
+    'The {acronym} of the {material} samples was measured after the tests.',
+    'Samples of {material} were tested against {material} at {value} {unit}.'
+]
+FILLER_WORDS = ['the', 'results', 'were', 'compared', 'with', 'reference', 'samples', 'in', 'following', 'section',
+                'surface', 'was', 'analysed', 'after', 'each', 'test', 'and', 'a', 'clear', 'trend', 'observed',
+                'between', 'both', 'series', 'of', 'experiments', 'which', 'is', 'discussed', 'below', 'further',
+                'investigations', 'are', 'necessary', 'to', 'explain', 'this', 'behaviour', 'under', 'dry', 'conditions']
+
+
+def generate_sentence(rng: random.Random, density: float) -> str:
+    if rng.random() >= density:
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(8, 20))]
+        return ' '.join(words).capitalize() + '.'
+    parameter, unit, (low, high) = rng.choice(PARAMETERS)
+    long_form, acronym = rng.choice(ACRONYMS)
+    return rng.choice(ENTITY_TEMPLATES).format(parameter=parameter, unit=unit, value=round(rng.uniform(low, high), 2),
+                                               material=rng.choice(MATERIALS), long_form=long_form, acronym=acronym)
+
+
+def generate_paragraphs(rng: random.Random, paragraphs: int, sentences: int, density: float) -> List[Dict]:
+    return [{'sentences': [{'text': generate_sentence(rng, density)} for _ in range(sentences)]}
+            for _ in range(paragraphs)]
+
+
+def generate_table(rng: random.Random, rows: int, columns: int) -> Dict:
+    """ Returns a table with a header row (the material and some parameters) and a row per sample. """
+    parameters = rng.sample(PARAMETERS, min(columns - 1, len(PARAMETERS)))
+    header = ['Material'] + [f"{parameter.capitalize()} in {unit}" for parameter, unit, _ in parameters]
+    lines = [header]
+    for _ in range(rows):
+        lines.append([rng.choice(MATERIALS)] + [str(round(rng.uniform(low, high), 2)) for _, _, (low, high) in parameters])
+    return {
+        'table_header': {'cells': [{'text': _} for _ in header], 'type': 'row'},
+        'rows': [{'cells': [{'text': _} for _ in line], 'type': 'row'} for line in lines],
+        'columns': [{'cells': [{'text': line[column]} for line in lines], 'type': 'column'}
+                    for column in range(len(header))]
+    }
+
+
+def generate_document(document_id: str = 'benchmark', chapters: int = 2, paragraphs: int = 3, sentences: int = 4,
+                      tables: int = 1, table_rows: int = 4, table_columns: int = 3, density: float = 0.3,
+                      seed: int = 0) -> Dict:
+    """ Generates a document with chapters * paragraphs * sentences sentences (and an abstract of one paragraph)
+    and tables with table_rows rows of table_columns cells. """
+    rng = random.Random(seed)
+    return {
+        'id': document_id,
+        'metadata': {'abstract': {'paragraphs': generate_paragraphs(rng, 1, sentences, density)}},
+        'text': {'chapters': [{'paragraphs': generate_paragraphs(rng, paragraphs, sentences, density)}
+                              for _ in range(chapters)]},
+        'tables': [generate_table(rng, table_rows, table_columns) for _ in range(tables)]
+    }
+
+
+def count_words(document: Dict) -> int:
+    """ Returns the number of words (split by whitespace) of the sentences of the document. """
+    chapters = document['text']['chapters'] + [document['metadata']['abstract']]
+    return sum([len(sentence['text'].split()) for chapter in chapters for paragraph in chapter['paragraphs']
+                for sentence in paragraph['sentences']])
@@ -0,0 +1,154 @@
+""" The micro-benchmarks of the stages of the pipeline on the sentences and tables of a generated document.
+
+Every benchmark returns the setup (not measured, e.g. new sentences without annotations) and the run of the stage.
+The ids are allocated by a context of the benchmark, as in a task.
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from app.core.annotation_modul.apis import AnnotationStrategy
+from app.core.annotation_modul.apis.ner_backends import get_ner_backend
+from app.core.annotation_modul.datamodels.knowledge_object_model import KnowledgeObject
+from app.core.annotation_modul.datamodels.text_models import Sentence
+from app.core.annotation_modul.processing_context import ProcessingContext, CURRENT_CONTEXT
+from app.core.schemas.datamodel import Document
+
+from .end_to_end import process_document
+from .results import measure
+
+Benchmark = Tuple[Callable[[], object], Callable[[object], object]]
+
+
+@contextmanager
+def benchmark_context():
+    """ A context without deadline for the ids of the objects created by the benchmarks. """
+    token = CURRENT_CONTEXT.set(ProcessingContext('__benchmark__', deadline=0))
+    try:
+        yield
+    finally:
+        CURRENT_CONTEXT.reset(token)
+
+
+def get_texts(document: Dict) -> List[str]:
+    chapters = document['text']['chapters'] + [document['metadata']['abstract']]
+    return [sentence['text'] for chapter in chapters for paragraph in chapter['paragraphs']
+            for sentence in paragraph['sentences']]
+
+
+def create_sentences(texts: List[str]) -> List[Sentence]:
+    return [Sentence({'text': _}, None) for _ in texts]
+
+
+def annotate_sentences(texts: List[str]) -> List[Sentence]:
+    """ Returns new sentences annotated by the model and the gazetteer, as by the AnnotationStrategy. """
+    sentences = create_sentences(texts)
+    annotationAPI = AnnotationStrategy()
+    annotationAPI.annotate_with_model(64, sentences, True, get_ner_backend('flair'))
+    annotationAPI.annotate_with_pattern_matching(sentences)
+    return sentences
+
+
+def set_words(texts: List[str], processed: Document) -> Benchmark:
+    sentences = create_sentences(texts)
+
+    def setup():
+        for sentence in sentences:
+            sentence.words = []
+        return sentences
+
+    def run(sentences: List[Sentence]):
+        for sentence in sentences:
+            sentence.setWords()
+
+    return setup, run
+
+
+def normalize_word(texts: List[str], processed: Document) -> Benchmark:
+    words = [word for sentence in create_sentences(texts) for word in sentence.words]
+
+    def run(_):
+        for word in words:
+            word._normalize_word(word.word)
+
+    return None, run
+
+
+def set_manual_annotation(texts: List[str], processed: Document) -> Benchmark:
+    annotationAPI = AnnotationStrategy()
+
+    def run(sentences: List[Sentence]):
+        for sentence in sentences:
+            annotationAPI.set_manual_annotation(sentence)
+
+    return lambda: create_sentences(texts), run
+
+
+def annotate_with_pattern_matching(texts: List[str], processed: Document) -> Benchmark:
+    annotationAPI = AnnotationStrategy()
+    return lambda: create_sentences(texts), annotationAPI.annotate_with_pattern_matching
+
+
+def add_additional_annotations(texts: List[str], processed: Document) -> Benchmark:
+    """ Builds the KnowledgeObjects of the annotations of the text as get_knowledgeObjects_for_text does, without the
+    adjustment of the annotations. """
+
+    def setup():
+        return list(dict.fromkeys(AnnotationStrategy().get_annotations(annotate_sentences(texts))))
+
+    def run(annotations):
+        while annotations:
+            annotation = annotations.pop(0)
+            added = KnowledgeObject(annotation).add_additional_annotations(annotations)
+            annotations = [_ for _ in annotations if _ not in added]
+
+    return setup, run
+
+
+def annotate_cells(texts: List[str], processed: Document) -> Benchmark:
+    def setup():
+        for table in processed.tables:
+            for line in table.lines + [table.table_header]:
+                for cell in line.cells:
+                    cell.annotations = []
+                    cell.knowledgeObject = []
+        return processed.tables
+
+    def run(tables):
+        for table in tables:
+            table.annotate_cells()
+
+    return setup, run
+
+
+def to_output_model(texts: List[str], processed: Document) -> Benchmark:
+    return None, lambda _: processed.to_output_model()
+
+
+def to_output_json(texts: List[str], processed: Document) -> Benchmark:
+    return None, lambda _: processed.to_output_json()
+
+
+MICRO_BENCHMARKS = {
+    'Sentence.setWords': set_words,
+    'Word._normalize_word': normalize_word,
+    'AnnotationStrategy.set_manual_annotation': set_manual_annotation,
+    'AnnotationStrategy.annotate_with_pattern_matching': annotate_with_pattern_matching,
+    'KnowledgeObject.add_additional_annotations': add_additional_annotations,
+    'Table.annotate_cells': annotate_cells,
+    'Document.to_output_model': to_output_model,
+    'Document.to_output_json': to_output_json
+}
+
+
+def run_micro_benchmarks(document: Dict, repeat: int = 5, names: List[str] = None) -> Dict[str, Dict]:
+    """ Runs the micro-benchmarks (all or the given names) on the document, the model has to be stubbed. """
+    texts = get_texts(document)
+    processed = process_document(dict(document, ner_backend='flair', incremental=False))
+    res = {}
+    with benchmark_context():
+        for name, benchmark in MICRO_BENCHMARKS.items():
+            if names is not None and name not in names:
+                continue
+            setup, run = benchmark(texts, processed)
+            res[f'micro.{name}'] = measure(run, setup, repeat=repeat)
+    return res
@@ -0,0 +1,128 @@
+""" The measurement of the benchmarks and their results as json, compared with a baseline.
+
+Every benchmark is run repeat times after a warm-up run, the garbage collector is disabled during a run (as timeit
+does). The median (or the minimum, which is less affected by a busy machine) of the runs is compared with the
+baseline: a benchmark is a regression if it is more than the threshold (a ratio, e.g. 0.1 for 10 %) slower than in the
+baseline.
+"""
+import gc
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Callable, Dict, List, Tuple
+
+import orjson
+
+RESULTS_VERSION = 1
+
+
+def measure(run: Callable[[object], object], setup: Callable[[], object] = None, repeat: int = 5,
+            warm_up: int = 1) -> Dict:
+    """ Measures the seconds of run(setup()), setup is called before every run and is not measured. """
+    times = []
+    for number in range(warm_up + repeat):
+        state = setup() if setup is not None else None
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(state)
+            seconds = time.perf_counter() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if number >= warm_up:
+            times.append(seconds)
+    return {
+        'runs': len(times),
+        'median': statistics.median(times),
+        'min': min(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0
+    }
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def get_environment() -> Dict:
+    """ The environment of the results, the results of different machines are not comparable. """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'commit': get_git_commit()
+    }
+
+
+def create_results(parameters: Dict, benchmarks: Dict[str, Dict]) -> Dict:
+    return {
+        'version': RESULTS_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': get_environment(),
+        'parameters': parameters,
+        'benchmarks': benchmarks
+    }
+
+
+def save_results(results: Dict, path: str) -> None:
+    with open(path, 'wb') as file:
+        file.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+
+
+def load_results(path: str) -> Dict:
+    with open(path, 'rb') as file:
+        return orjson.loads(file.read())
+
+
+def compare_results(results: Dict, baseline: Dict, threshold: float = 0.1,
+                    statistic: str = 'median') -> List[Tuple[str, float, float, str]]:
+    """ Compares the statistic (median or min) of the benchmarks with the baseline. Returns (name, baseline, current,
+    verdict) per benchmark, the verdict is regression, improvement, unchanged, new or missing. """
+    res = []
+    current_benchmarks = results['benchmarks']
+    baseline_benchmarks = baseline['benchmarks']
+    for name in sorted(set(current_benchmarks) | set(baseline_benchmarks)):
+        if name not in baseline_benchmarks:
+            res.append((name, None, current_benchmarks[name][statistic], 'new'))
+            continue
+        if name not in current_benchmarks:
+            res.append((name, baseline_benchmarks[name][statistic], None, 'missing'))
+            continue
+        before = baseline_benchmarks[name][statistic]
+        after = current_benchmarks[name][statistic]
+        if after > before * (1 + threshold):
+            verdict = 'regression'
+        elif after < before * (1 - threshold):
+            verdict = 'improvement'
+        else:
+            verdict = 'unchanged'
+        res.append((name, before, after, verdict))
+    return res
+
+
+def format_results(results: Dict) -> str:
+    lines = [f"{'benchmark':<56}{'median ms':>12}{'min ms':>12}{'stdev ms':>12}"]
+    for name, result in results['benchmarks'].items():
+        lines.append(f"{name:<56}{result['median'] * 1000:>12.3f}{result['min'] * 1000:>12.3f}"
+                     f"{result['stdev'] * 1000:>12.3f}")
+    return '\n'.join(lines)
+
+
+def format_comparison(comparison: List[Tuple[str, float, float, str]]) -> str:
+    lines = [f"{'benchmark':<56}{'baseline ms':>12}{'current ms':>12}{'change':>9}  verdict"]
+    for name, before, after, verdict in comparison:
+        change = f"{(after / before - 1) * 100:>+8.1f}%" if before and after is not None else f"{'':>9}"
+        lines.append(f"{name:<56}" + ''.join([f"{_ * 1000:>12.3f}" if _ is not None else f"{'':>12}"
+                                               for _ in [before, after]]) + f"{change}  {verdict}")
+    return '\n'.join(lines)
@@ -0,0 +1,43 @@
+""" A stub of the named entity recognition model, so the benchmarks run on a cpu without the model file.
+
+The stub predicts the materials of the generator as entities. It goes through the lean inference of FlairBackend
+(batches, spans, annotations), only the prediction of the model itself is replaced.
+"""
+import re
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from app.core.annotation_modul.apis import ner_backends
+from app.core.annotation_modul.apis.ner_backends import FlairBackend, CascadeBackend
+from app.core.annotation_modul.datamodels.text_models import Sentence
+
+from .generator import MATERIALS
+
+MATERIAL_PATTERN = re.compile(r'\b(?:' + '|'.join([re.escape(_) for _ in MATERIALS]) + r')\b')
+
+
+class StubModelBackend(FlairBackend):
+    """ The backend of the model with a prediction by a regular expression instead of the model. """
+    TAG = 'Material'
+    SCORE = 0.95
+
+    def annotate(self, sentences: List[Sentence], batchsize: int = 64, batchOfSentences: bool = True) -> None:
+        self.lean_batch_annotations(sentences, batchsize if batchOfSentences else 1)
+
+    def predict_spans(self, texts: List[str]) -> List[List[Tuple[int, int, str, float]]]:
+        return [[(_.start(), _.end(), self.TAG, self.SCORE) for _ in MATERIAL_PATTERN.finditer(text)] for text in texts]
+
+
+@contextmanager
+def stubbed_model():
+    """ Replaces the model in the backends flair and cascade by the stub for the block. """
+    stub = StubModelBackend()
+    backends = dict(ner_backends.NER_BACKENDS)
+    ner_backends.NER_BACKENDS.update({
+        'flair': stub,
+        'cascade': CascadeBackend(ner_backends.GAZETTEER_BACKEND, stub)
+    })
+    try:
+        yield stub
+    finally:
+        ner_backends.NER_BACKENDS.update(backends)
@@ -2,5 +2,6 @@ from .text_api import TextStrategy
 from .table_api import TableStrategy
 from .annotation_api import AnnotationStrategy
 from .knowledgeObject_api import KnowledgeObjectStrategy
+from .sharding_api import ShardingStrategy
 
 
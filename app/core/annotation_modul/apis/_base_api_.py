@@ -1,9 +1,65 @@
+import logging
+import time
+import tracemalloc
 from abc import ABC, abstractmethod
+from functools import wraps
 
 from ..annotation_model import DocumentAnalysis
+from ..processing_context import CURRENT_CONTEXT
+from app.core.config import STAGE_TIMINGS
+from app.core.memory_accounting import start_peak, get_peak
+from app.core.metrics import STAGE_DURATION, STAGE_MEMORY_PEAK
+
+logger = logging.getLogger(__name__)
+
+PHASES = ['preprocess_data', 'process_data', 'postprocess_data']
+# The objects produced by a phase, counted by the ids the document allocated
+PRODUCED_OBJECTS = {'sentences': 'sentence', 'words': 'word', 'annotations': 'annotation',
+                    'knowledgeObjects': 'knowledgeObject'}
+
+
+def timed(strategy: str, phase: str, method):
+    """ Measures the seconds of the phase of a strategy and the objects it produced, the timing is added to the
+    context of the document (see ProcessingContext.add_timing) and to the metric STAGE_DURATION. While tracemalloc
+    traces, the peak memory of the phase is measured as well (see memory_accounting). """
+
+    @wraps(method)
+    def wrapper(self, data: DocumentAnalysis) -> None:
+        context = CURRENT_CONTEXT.get()
+        if context is None or not STAGE_TIMINGS:
+            return method(self, data)
+        ids = dict(context.ids)
+        memory_start = start_peak() if tracemalloc.is_tracing() else None
+        start = time.monotonic()
+        failed = True
+        try:
+            res = method(self, data)
+            failed = False
+            return res
+        finally:
+            seconds = time.monotonic() - start
+            memory_peak = get_peak(memory_start) if memory_start is not None else None
+            produced = {name: context.ids[kind] - ids[kind] for name, kind in PRODUCED_OBJECTS.items()}
+            timing = context.add_timing(strategy, phase.replace('_data', ''), seconds, produced, failed, memory_peak)
+            STAGE_DURATION.observe(timing['seconds'], strategy=strategy, phase=timing['phase'])
+            if memory_peak is not None:
+                STAGE_MEMORY_PEAK.observe(memory_peak, strategy=strategy, phase=timing['phase'])
+            logger.debug("stage document=%s strategy=%s phase=%s seconds=%.6f sentences=%s words=%s annotations=%s "
+                         "knowledgeObjects=%s memory_peak=%s failed=%s", context.document_id, timing['strategy'],
+                         timing['phase'], timing['seconds'], *[produced[_] for _ in PRODUCED_OBJECTS], memory_peak,
+                         failed, extra={'timing': timing})
+
+    return wrapper
 
 
 class TransformationStrategy(ABC):
+    """ A stage of the pipeline in three phases. The phases of every strategy are timed (STAGE_TIMINGS), see timed. """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for phase in PHASES:
+            if phase in cls.__dict__:
+                setattr(cls, phase, timed(cls.__name__, phase, cls.__dict__[phase]))
 
     @abstractmethod
     def preprocess_data(self, data: DocumentAnalysis) -> None:
@@ -15,4 +71,4 @@ class TransformationStrategy(ABC):
 
     @abstractmethod
     def postprocess_data(self, data: DocumentAnalysis) -> None:
-        ''' Abstract method to refine the data in some kind. '''
\ No newline at end of file
+        ''' Abstract method to refine the data in some kind. '''
@@ -1,17 +1,24 @@
 from ._base_api_ import TransformationStrategy
-from flair.data import Sentence as fdSentence
-from flair.models import SequenceTagger
 from ..annotation_model import DocumentAnalysis
-from .util_functions import MANUAL_NER_TAGS
+from .util_functions import get_memory_usage, reset_peak_memory_usage
+from .ner_backends import NERBackend, get_ner_backend
+from .prefilter import PREFILTER, filter_model_sentences
+from .annotation_cache import AnnotationCache, ShardResults, get_annotation_cache, get_shard_results
+from ..processing_context import checkpoint, get_processing_context
+from ..resources import get_resources
+import logging
 import re
 from ..datamodels.annotation_model import Annotation
 from ..datamodels.text_models import Sentence, Word, Text
-from typing import List, Tuple
-from ..apis.util_functions import NAMED_ENTITY_RECOGNITION_MODEL_PATH, TOKENIZER
-from app.core.config import ANNOTATION_SCORE
+from typing import List
+from app.core.config import PIPELINE_PROFILES, NER_PREFILTER, SCHEDULER_WORKERS
+from app.core.metrics import SENTENCES, CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
 
 class AnnotationStrategy(TransformationStrategy):
-    NAMED_ENTITY_RECOGNITION_MODEL = SequenceTagger.load(NAMED_ENTITY_RECOGNITION_MODEL_PATH)
+
     def preprocess_data(self, data: DocumentAnalysis) -> None:
         pass
 
@@ -19,8 +26,29 @@ class AnnotationStrategy(TransformationStrategy):
         pass
 
     def process_data(self, data: DocumentAnalysis) -> None:
-        self.annotate_text(data.text)
-        self.annotate_tables(data.tables)
+        stages = PIPELINE_PROFILES[data.profile]
+        backend = get_ner_backend(data.ner_backend)
+        cache = get_annotation_cache(data.id)
+        shards = get_shard_results(data.id)
+
+        # The peak memory is measured for the whole process. It is only reset, and so only the peak of the document,
+        # with a single worker, a reset by one task would clear the peaks of the tasks running in parallel. With more
+        # workers the high-water mark of the process is logged
+        per_document = SCHEDULER_WORKERS == 1
+        if per_document:
+            reset_peak_memory_usage()
+        rss_before, _ = get_memory_usage()
+
+        self.annotate_text(data.text, stages=stages, backend=backend, cache=cache, shards=shards)
+        self.annotate_tables(data.tables, stages=stages, backend=backend, cache=cache, shards=shards)
+
+        _, peak_rss = get_memory_usage()
+        if per_document:
+            logger.info("Annotated document %s: peak RSS %.1f MB (%.1f MB above the start of the annotation)",
+                        data.id, peak_rss / 2 ** 20, max(peak_rss - rss_before, 0) / 2 ** 20)
+        else:
+            logger.info("Annotated document %s: peak RSS of the process %.1f MB (since its start, the documents "
+                        "annotated in parallel included)", data.id, peak_rss / 2 ** 20)
 
         data.annotations = self.get_annotations_from_data(data)
 
@@ -39,12 +67,16 @@ class AnnotationStrategy(TransformationStrategy):
         return annotations
 
 
-    def annotate_text(self, text: Text, batchOfSentences: bool = True, batchsize: int = 64) -> None:
+    def annotate_text(self, text: Text, batchOfSentences: bool = True, batchsize: int = 64,
+                      stages: List[str] = None, backend: NERBackend = None, cache: AnnotationCache = None,
+                      shards: ShardResults = None) -> None:
         '''
         Annotates the data with Entities through the model given in the settings.py file
 
         :param batchOfSentences: True for annotating batches of Sentences instead of single sentences.
                                  It reduces the time needed for the task
+        :param stages: The annotation stages ('model', 'gazetteer') to execute. None executes all of them.
+        :param backend: The backend for the named entity recognition. None uses the backend of the deployment.
         :return: None
         '''
         if batchsize < 1 and batchOfSentences and not isinstance(batchsize, int):
@@ -57,14 +89,18 @@ class AnnotationStrategy(TransformationStrategy):
             for paragraph in chapter.paragraphs:
                 sentences.extend(paragraph.sentences)
 
-        self.annotate_sentences(sentences, batchOfSentences, batchsize)
+        self.annotate_sentences(sentences, batchOfSentences, batchsize, stages, backend, cache, shards)
 
-    def annotate_tables(self, tables, batchOfSentences: bool = True, batchsize: int = 64) -> None:
+    def annotate_tables(self, tables, batchOfSentences: bool = True, batchsize: int = 64,
+                        stages: List[str] = None, backend: NERBackend = None, cache: AnnotationCache = None,
+                        shards: ShardResults = None) -> None:
         '''
         Annotates the data with Entities through the model given in the settings.py file
 
         :param batchOfSentences: True for annotating batches of Sentences instead of single sentences.
                                  It reduces the time needed for the task
+        :param stages: The annotation stages ('model', 'gazetteer') to execute. None executes all of them.
+        :param backend: The backend for the named entity recognition. None uses the backend of the deployment.
         :return: None
         '''
         sentences: List[Sentence] = []
@@ -75,20 +111,27 @@ class AnnotationStrategy(TransformationStrategy):
             print("Sorry you did something wrong. Check your batchsize (size > 0 and int) and if you want to use a "
                   "batch of sentences for the annotation task (True).")
 
-        self.annotate_sentences(sentences, batchOfSentences, batchsize)
+        self.annotate_sentences(sentences, batchOfSentences, batchsize, stages, backend, cache, shards)
 
-    def annotate_sentences(self, sentences: List[Sentence], state: bool, batchsize: int):
+    def annotate_sentences(self, sentences: List[Sentence], state: bool, batchsize: int, stages: List[str] = None,
+                           backend: NERBackend = None, cache: AnnotationCache = None, shards: ShardResults = None):
         '''
 
         :param state: Using single sentence annotation (False) or batch sentence annotations (True)
         :param batchsize: size of the Batch
+        :param stages: The annotation stages ('model', 'gazetteer') to execute. None executes all of them.
+        :param backend: The backend for the named entity recognition. None uses the backend of the deployment.
+        :param cache: The annotations of the previous version of the document. Only the changed sentences are
+                      annotated by the backend.
+        :param shards: The tokens and annotations of the sentences computed in parallel by the shards of the document.
         :return:
         '''
 
+        if stages is None or 'model' in stages:
+            self.annotate_with_model(batchsize, sentences, state, backend, cache, shards)
 
-        self.annotate_with_model(batchsize, sentences, state)
-
-        self.annotate_with_pattern_matching(sentences)
+        if stages is None or 'gazetteer' in stages:
+            self.annotate_with_pattern_matching(sentences, shards)
 
     def get_annotations(self, sentences: List[Sentence]) -> List[Annotation]:
         res = []
@@ -96,13 +139,17 @@ class AnnotationStrategy(TransformationStrategy):
             res.extend(sentence.annotations)
         return res
 
-    def annotate_with_pattern_matching(self, sentences: List[Sentence]):
-        # Use known names for annotations
+    def annotate_with_pattern_matching(self, sentences: List[Sentence], shards: ShardResults = None):
+        get_processing_context().enter_stage('gazetteer', len(sentences))
+        # Use known names for annotations, a sharded sentence got them from its shard
         for sentence in sentences:
-            self.set_manual_annotation(sentence)
+            if shards is None or not shards.add_gazetteer_annotations(sentence):
+                self.set_manual_annotation(sentence)
+            checkpoint(1)
 
 
         # Identify Acornyms
+        get_processing_context().enter_stage('acronyms')
         found = 1
         while found != 0:
             annotations = self.get_annotations(sentences)
@@ -113,11 +160,15 @@ class AnnotationStrategy(TransformationStrategy):
                 annotations = self.get_acronyms(sentence)
                 sentence.annotations.extend(annotations)
                 found += len(annotations)
+                checkpoint()
 
             # Check if in any other sentence the acronym was used
             for annotation in annotations:
                 for sentence in sentences:
                     found += self._pattern_matching(sentence, annotation)
+                checkpoint()
+            # One round of the search for acronyms and their usages is done
+            checkpoint(1)
 
     def _pattern_matching_for_textual_strings(self, sentence: Sentence, annotation: Annotation,
                                               inNormalizedForm: bool = True):
@@ -135,14 +186,11 @@ class AnnotationStrategy(TransformationStrategy):
                 for match in re.finditer(re.escape(label), sentence.getText(inNormalizedForm)):
                     words = sentence.get_words_of_span((match.start(), match.end()), useNormalizedForm=True)
 
-                    if any([_.hasAnnotation for _ in words]): continue
+                    if len(words) == 0 or any([_.has_annotation for _ in words]): continue
 
                     label = " ".join([word.word for word in words])
-                    try:
-                        startPosition = min([_.startPos for _ in words])
-                        endPosition = max([_.endPos for _ in words])
-                    except:
-                        print("ok")
+                    startPosition = min([_.start_pos for _ in words])
+                    endPosition = max([_.end_pos for _ in words])
                     # Adds a new Annotation
                     anno = Annotation.create_manual_annotation(label, startPosition, endPosition,
                                                                annotation.category,
@@ -160,18 +208,18 @@ class AnnotationStrategy(TransformationStrategy):
 
                 regex = "( |^)" + re.escape(label) + "(?=(\.|,|\(|\[| |;))"
 
-                for match in re.finditer(regex, sentence.textInSentence.lower()):
+                for match in re.finditer(regex, sentence.text_in_sentence.lower()):
                     start = match.start()
                     end = match.end()
                     if match.group()[0] == " ":
                         start += 1
                     words = sentence.get_words_of_span((start, end), useNormalizedForm=False)
                     # Checks if the words are already part of an annotation
-                    if any([_.hasAnnotation for _ in words]): continue
+                    if len(words) == 0 or any([_.has_annotation for _ in words]): continue
 
                     label = " ".join([word.word for word in words])
-                    startPos = min([word.startPos for word in words])
-                    endPos = max([word.endPos for word in words])
+                    startPos = min([word.start_pos for word in words])
+                    endPos = max([word.end_pos for word in words])
                     # Adds a new Annotation
                     anno = Annotation.create_manual_annotation(label, startPos, endPos, annotation.category,
                                                                annotation.specificCategory, words)
@@ -186,101 +234,61 @@ class AnnotationStrategy(TransformationStrategy):
 
         return found_matches
 
-    def annotate_with_model(self, batchsize, sentences, state):
-        if state:
-            self.batch_annotations(sentences, batchsize)
-        else:
-            self.single_annotations(sentences)
-
-    def batch_annotations(self, sentences: List[Sentence], batch_size: int = 64):
-        '''
-        Creates Batches of Sentences that will be parallel analysed by the
-        model.
-        :param batch_size: Number of Sentences parallel analysed
-        :return: by the Model annotated Sentences
-        '''
-
-        batch = []
-        counter = 0
-
-        for num, sentence in enumerate(sentences, 1):
-            if num % batch_size == 0:
-                AnnotationStrategy.NAMED_ENTITY_RECOGNITION_MODEL.predict(batch)
-                for annotatedSentence in batch:
-                    self.set_annotation_from_model(sentences[counter], annotatedSentence)
-                    counter += 1
-                batch = []
-
-            batch.append(fdSentence(sentence.text_in_sentence, use_tokenizer=TOKENIZER))
-
-        if len(batch) > 0:
-            AnnotationStrategy.NAMED_ENTITY_RECOGNITION_MODEL.predict(batch)
-            for annotatedSentence in batch:
-                self.set_annotation_from_model(sentences[counter], annotatedSentence)
-                counter += 1
-
-    def single_annotations(self, sentences):
-        for sentence in sentences:
-            annotatedSentence = fdSentence(sentence.textInSentence, use_tokenizer=TOKENIZER)
-            AnnotationStrategy.NAMED_ENTITY_RECOGNITION_MODEL.predict(annotatedSentence)
-            self.set_annotation_from_model(sentence, annotatedSentence)
-
+    def annotate_with_model(self, batchsize, sentences, state, backend: NERBackend = None,
+                            cache: AnnotationCache = None, shards: ShardResults = None):
+        if backend is None:
+            backend = get_ner_backend()
+
+        # The unchanged sentences of a resubmitted document get the annotations of the previous version
+        if cache is not None:
+            known_sentences, sentences = cache.split(sentences)
+            cache.reuse_annotations(known_sentences)
+            if cache.previous is not None:
+                CACHE_LOOKUPS.inc(len(known_sentences), cache='incremental', result='hit')
+                CACHE_LOOKUPS.inc(len(sentences), cache='incremental', result='miss')
+            SENTENCES.inc(len(known_sentences), source='cache')
+        changed_sentences = sentences
+
+        # The sentences of the shards were annotated in parallel, their annotations are added in the serial order
+        if shards is not None:
+            sharded_sentences, sentences = shards.split(sentences)
+            shards.add_annotations(sharded_sentences)
+            SENTENCES.inc(len(sharded_sentences), source='shards')
+
+        # Sentences without any signal for an entity are not send to the model, a backend without a model (or the
+        # cheap pass of the cascade) annotates every sentence
+        if backend.uses_model:
+            sentences = filter_model_sentences(sentences)
+
+        get_processing_context().enter_stage('model', len(sentences))
+        backend.annotate(sentences, batchsize, state)
+        SENTENCES.inc(len(sentences), source='model')
+
+        if NER_PREFILTER == 'evaluate' and backend.uses_model:
+            PREFILTER.evaluate(sentences)
+
+        if cache is not None:
+            cache.add_annotations(changed_sentences)
 
-    def set_annotation_from_model(self, sentence: Sentence, flair_sentence: fdSentence) -> None:
-        def delete_paranthesis(span, wordList: List[Word]):
-            "/(){}[]\\"
-            special_chars = ["(", ")", "{", "}", "[", "]", "\\"]
-            first_word = wordList[0]
-            last_word = wordList[-1]
-
-            if first_word.word in special_chars:
-                wordList.remove(first_word)
-            if last_word.word in special_chars:
-                wordList.remove(last_word)
-
-            return span, wordList
-
-        def delete_figures_and_tables(span, wordList: List[Word]):
-            for word in wordList:
-                if word.word.lower() in ["tab.", "tab", "table", "fig", "fig.", "figure"]:
-                    return [], []
-            return span, wordList
-
-        for span in flair_sentence.get_spans('ner'):
-            if span.score > ANNOTATION_SCORE:
-
-                locationSpan: Tuple[int, int] = (min([x.start_pos for x in span.tokens]),
-                                                 max([x.end_pos for x in span.tokens]))
-                wordList = sentence.get_words_of_span(locationSpan)
-                span, wordList = delete_paranthesis(span, wordList)
-                span, wordList = delete_figures_and_tables(span, wordList)
-
-                if len(wordList) == 0:
-                    continue
+    def set_manual_annotation(self, sentence: Sentence) -> None:
+        text = sentence.text_in_sentence.lower()
+        for pattern, category, specific_category in get_resources().manual_patterns:
+            for match in pattern.finditer(text):
+                try:
+                    words = sentence.get_words_of_span(match.span())
+                    # Checks if the words are already part of an annotation
+                    if any([_.has_annotation for _ in words]): break
 
-                anno = Annotation.create_model_annotation(span, wordList)
-                sentence.annotations.append(anno)
+                    label = " ".join([word.word for word in words])
+                    startPos = min([word.start_pos for word in words])
+                    endPos = max([word.end_pos for word in words])
 
-    def set_manual_annotation(self, sentence: Sentence) -> None:
-        for tag, attribute in MANUAL_NER_TAGS.items():
-            for synonym in attribute["tags"]:
-                for match in re.finditer(re.escape(synonym.lower()), sentence.text_in_sentence.lower()):
-                    try:
-                        words = sentence.get_words_of_span(match.span())
-                        # Checks if the words are already part of an annotation
-                        if any([_.has_annotation for _ in words]): break
-
-                        label = " ".join([word.word for word in words])
-                        startPos = min([word.start_pos for word in words])
-                        endPos = max([word.end_pos for word in words])
-
-                        # Adds a new Annotation
-                        anno = Annotation.create_manual_annotation(label, startPos, endPos,
-                                                                   attribute["category"],
-                                                                   attribute["specific_category"], words)
-                        sentence.annotations.append(anno)
-                    except:
-                        words = sentence.get_words_of_span(match.span())
+                    # Adds a new Annotation
+                    anno = Annotation.create_manual_annotation(label, startPos, endPos, category, specific_category,
+                                                               words)
+                    sentence.annotations.append(anno)
+                except:
+                    words = sentence.get_words_of_span(match.span())
 
     def get_acronyms(self, sentence: Sentence) -> List[Annotation]:
         '''
@@ -0,0 +1,194 @@
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from typing import List, Dict, Tuple
+
+from ..datamodels.annotation_model import Annotation
+from ..datamodels.text_models import Sentence
+from .util_functions import TOKENIZER
+from ..resources import get_resource_version
+from app.core.config import DEFAULT_NER_BACKEND, INCREMENTAL_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+Token = namedtuple('Token', ['text', 'start_pos', 'end_pos', 'whitespace_after'])
+
+# An annotation of the named entity recognition with the positions of its words in the sentence
+AnnotationRecord = Tuple[str, int, int, str, str, float, bool, List[int]]
+
+
+class AnnotationCache:
+    """ The tokens and the annotations of the named entity recognition of every sentence (of the text and the
+    tables) of a document, keyed by the text of the sentence.
+
+    When a document is submitted again (e.g. after a curator fixed a few sentences), only the changed sentences are
+    tokenized and annotated by the backend, the unchanged sentences get the tokens and annotations of the previous
+    version. The stages that depend on the whole document (propagation of the annotations, acronyms and the
+    KnowledgeObjects) are executed as usual, so the result is equal to a full run. The annotations depend on the
+    resources (gazetteer, units, ...), after a reload of the resources only the tokens are reused. """
+
+    def __init__(self, document_id: str, ner_backend: str, previous: 'AnnotationCache' = None,
+                 resource_version: str = None):
+        self.document_id: str = document_id
+        self.ner_backend: str = ner_backend
+        self.resource_version: str = resource_version
+        self.tokens: Dict[str, List[Token]] = {}
+        self.annotations: Dict[str, List[AnnotationRecord]] = {}
+        self.previous: AnnotationCache = previous
+        self.reused_sentences: int = 0
+
+    def tokenize(self, text: str) -> List[Token]:
+        """ Returns the tokens of the text, the text is only tokenized if it is not known from the previous version. """
+        if text not in self.tokens:
+            if self.previous is not None and text in self.previous.tokens:
+                self.tokens[text] = self.previous.tokens[text]
+            else:
+                self.tokens[text] = [Token(_.text, _.start_pos, _.end_pos, _.whitespace_after)
+                                     for _ in TOKENIZER.tokenize(text)]
+        return self.tokens[text]
+
+    def split(self, sentences: List[Sentence]) -> Tuple[List[Sentence], List[Sentence]]:
+        """ Splits the sentences in the sentences known from the previous version and the changed sentences. """
+        if self.previous is None:
+            return [], sentences
+        known = [_ for _ in sentences if _.text_in_sentence in self.previous.annotations]
+        changed = [_ for _ in sentences if _.text_in_sentence not in self.previous.annotations]
+        return known, changed
+
+    def reuse_annotations(self, sentences: List[Sentence]) -> None:
+        """ Adds the annotations of the previous version to the (unchanged) sentences. """
+        for sentence in sentences:
+            add_annotation_records(sentence, self.previous.annotations[sentence.text_in_sentence])
+        self.reused_sentences += len(sentences)
+        self.add_annotations(sentences)
+
+    def add_annotations(self, sentences: List[Sentence]) -> None:
+        """ Stores the annotations of the named entity recognition of the sentences. """
+        for sentence in sentences:
+            self.annotations[sentence.text_in_sentence] = get_annotation_records(sentence)
+
+    def finish(self) -> None:
+        """ Drops the previous version, only the entries of the current version are kept for the next one. """
+        if self.previous is not None:
+            logger.info("Reused the annotations of %s sentences of the previous version of document %s",
+                        self.reused_sentences, self.document_id)
+        self.previous = None
+
+
+class ShardResults:
+    """ The tokens and the annotations of the sentences of a document, computed in advance by the shards of the
+    document (see ShardingStrategy), keyed by the text of the sentence.
+    The annotations of the named entity recognition and of the gazetteer are kept apart, as they are added to the
+    sentences in different stages. The annotations of the named entity recognition are kept per pass of the backend
+    (e.g. the cheap and the expensive backend of the cascade). The pipeline builds the words and annotations from them
+    in the serial order, so the ids are the same as without sharding. """
+
+    def __init__(self, document_id: str, tokenizer=TOKENIZER):
+        self.document_id: str = document_id
+        self.tokenizer = tokenizer
+        self.tokens: Dict[str, List[Token]] = {}
+        self.annotations: Dict[str, List[List[AnnotationRecord]]] = {}
+        self.gazetteer_annotations: Dict[str, List[AnnotationRecord]] = {}
+
+    def update(self, tokens: Dict[str, List[Token]], annotations: Dict[str, List[List[AnnotationRecord]]],
+               gazetteer_annotations: Dict[str, List[AnnotationRecord]]) -> None:
+        """ Merges the results of a shard. """
+        self.tokens.update(tokens)
+        self.annotations.update(annotations)
+        self.gazetteer_annotations.update(gazetteer_annotations)
+
+    def tokenize(self, text: str) -> List[Token]:
+        """ Returns the tokens of the shard, a text that was not part of any shard is tokenized as usual. """
+        if text in self.tokens:
+            return self.tokens[text]
+        return self.tokenizer.tokenize(text)
+
+    def split(self, sentences: List[Sentence]) -> Tuple[List[Sentence], List[Sentence]]:
+        """ Splits the sentences in the sentences annotated by a shard and the remaining ones. """
+        annotated = [_ for _ in sentences if _.text_in_sentence in self.annotations]
+        remaining = [_ for _ in sentences if _.text_in_sentence not in self.annotations]
+        return annotated, remaining
+
+    def add_annotations(self, sentences: List[Sentence]) -> None:
+        """ Adds the annotations of the named entity recognition to the sentences, pass by pass like the backend. """
+        passes = max([len(self.annotations[_.text_in_sentence]) for _ in sentences], default=0)
+        for number in range(passes):
+            for sentence in sentences:
+                records = self.annotations[sentence.text_in_sentence]
+                if number < len(records):
+                    add_annotation_records(sentence, records[number])
+
+    def add_gazetteer_annotations(self, sentence: Sentence) -> bool:
+        """ Adds the annotations of the gazetteer to the sentence. Returns False if the sentence was not part of a
+        shard. """
+        if sentence.text_in_sentence not in self.gazetteer_annotations:
+            return False
+        add_annotation_records(sentence, self.gazetteer_annotations[sentence.text_in_sentence])
+        return True
+
+
+def get_annotation_records(sentence: Sentence) -> List[AnnotationRecord]:
+    """ Returns the annotations of the sentence as records, the words are referenced by their position. """
+    positions = {word.id: position for position, word in enumerate(sentence.words)}
+    return [(_.label, _.startPos, _.endPos, _.category, _.specificCategory, _.confidence, _.typeOfAnnotation,
+             [positions[word.id] for word in _.wordList])
+            for _ in sentence.annotations]
+
+
+def add_annotation_records(sentence: Sentence, records: List[AnnotationRecord]) -> None:
+    """ Creates the annotations of the records (see get_annotation_records) for the words of the sentence. """
+    for label, startPos, endPos, category, specificCategory, confidence, typeOfAnnotation, positions in records:
+        words = [sentence.words[_] for _ in positions]
+        anno = Annotation(label, startPos, endPos, category, specificCategory, confidence, typeOfAnnotation,
+                          None if typeOfAnnotation else words, words if typeOfAnnotation else None)
+        sentence.annotations.append(anno)
+
+
+ANNOTATION_CACHES: Dict[str, AnnotationCache] = OrderedDict()
+# The documents are processed by several threads, the order of the caches is changed under the lock
+ANNOTATION_CACHES_LOCK = threading.Lock()
+# The results of the shards per document id, only while the document is processed
+SHARD_RESULTS: Dict[str, ShardResults] = {}
+
+
+def start_annotation_cache(document) -> AnnotationCache:
+    """ Creates the cache for a run of the pipeline on the document. In the incremental mode the cache of the
+    previous run of the same document id (with the same backend) is reused. Returns None if the cache is disabled. """
+    if INCREMENTAL_CACHE_SIZE <= 0:
+        return None
+    ner_backend = document.ner_backend or DEFAULT_NER_BACKEND
+    resource_version = get_resource_version()
+    with ANNOTATION_CACHES_LOCK:
+        previous = ANNOTATION_CACHES.pop(document.id, None)
+        if previous is not None and (not document.incremental or previous.ner_backend != ner_backend):
+            previous = None
+        if previous is not None and previous.resource_version != resource_version:
+            # The resources were reloaded, the tokens are still valid
+            previous.annotations = {}
+
+        cache = AnnotationCache(document.id, ner_backend, previous, resource_version)
+        ANNOTATION_CACHES[document.id] = cache
+        # The least recently submitted documents are dropped
+        while len(ANNOTATION_CACHES) > INCREMENTAL_CACHE_SIZE:
+            ANNOTATION_CACHES.popitem(last=False)
+    return cache
+
+
+def get_annotation_cache(document_id: str) -> AnnotationCache:
+    """ Returns the cache of the document or None. """
+    return ANNOTATION_CACHES.get(document_id)
+
+
+def get_shard_results(document_id: str) -> ShardResults:
+    """ Returns the results of the shards of the document or None, if it was not sharded. """
+    return SHARD_RESULTS.get(document_id)
+
+
+def get_tokenizer(document_id: str):
+    """ Returns the tokenizer for the sentences of the document: the results of its shards, the cache of the document
+    or the tokenizer of the pipeline. """
+    shard_results = get_shard_results(document_id)
+    if shard_results is not None:
+        return shard_results
+    cache = get_annotation_cache(document_id)
+    return cache if cache is not None else TOKENIZER
@@ -2,6 +2,7 @@ from ._base_api_ import TransformationStrategy
 from ..annotation_model import DocumentAnalysis
 from ..datamodels.annotation_model import Annotation
 from ..datamodels.knowledge_object_model import KnowledgeObject
+from ..processing_context import checkpoint, get_processing_context
 import copy
 from typing import List
 class KnowledgeObjectStrategy(TransformationStrategy):
@@ -39,6 +40,7 @@ class KnowledgeObjectStrategy(TransformationStrategy):
         kObjs = self.get_knowledgeObjects_for_tables(data)
 
     def get_knowledgeObjects_for_text(self, annotations):
+        get_processing_context().enter_stage('knowledgeObjects', len(annotations))
         res = []
         while annotations:
             annotation: Annotation = annotations.pop(0)
@@ -47,12 +49,17 @@ class KnowledgeObjectStrategy(TransformationStrategy):
             listOfAnnotationToRemove = knowObj.add_additional_annotations(annotations)
 
             annotation.adjustInformation()
-            annotations = [_ for _ in annotations if _ not in listOfAnnotationToRemove]
+            remaining_annotations = [_ for _ in annotations if _ not in listOfAnnotationToRemove]
+            # The annotation and the annotations added to its KnowledgeObject are processed
+            checkpoint(len(annotations) - len(remaining_annotations) + 1)
+            annotations = remaining_annotations
             res.append(knowObj)
         return res
 
     def get_knowledgeObjects_for_tables(self, data) -> List[KnowledgeObject]:
+        get_processing_context().enter_stage('knowledgeObjects_of_tables', len(data.tables))
         res = []
         for table in data.tables:
             res.extend(table.annotate_cells())
+            checkpoint(1)
         return res
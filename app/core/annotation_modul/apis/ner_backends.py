@@ -0,0 +1,255 @@
+from abc import ABC, abstractmethod
+import threading
+from typing import List, Tuple, Pattern
+
+from ..datamodels.annotation_model import Annotation
+from ..datamodels.text_models import Sentence, Word
+from .util_functions import TOKENIZER
+from .prefilter import filter_model_sentences
+from ..processing_context import checkpoint, get_processing_context
+from ..resources import get_resources, NUMERICAL_CATEGORY, ACRONYM_CATEGORY
+from app.core.metrics import MODEL_BATCH_SIZE, MODEL_BATCH_FILL
+from app.core.config import ANNOTATION_SCORE, NAMED_ENTITY_RECOGNITION_MODEL_PATH, DEFAULT_NER_BACKEND, \
+    NER_LEAN_INFERENCE
+
+
+class NERBackend(ABC):
+    """ A backend that annotates sentences with named entities. """
+    # Only the sentences of a backend with a model are prefiltered (see filter_model_sentences)
+    uses_model: bool = False
+
+    @abstractmethod
+    def annotate(self, sentences: List[Sentence], batchsize: int = 64, batchOfSentences: bool = True) -> None:
+        ''' Abstract method to add the found entities as annotations to the sentences. '''
+
+
+class FlairBackend(NERBackend):
+    """ Annotates the sentences with the trained named entity recognition model (flair SequenceTagger).
+    The model (and torch) is loaded on first use. In the lean mode (NER_LEAN_INFERENCE) the predicted spans are converted to
+    plain (start, end, tag, score) tuples directly after each batch and the flair sentences are freed.
+    The model is shared by all threads, one prediction runs at a time. Torch releases the GIL during the prediction,
+    so the other documents go on with their python stages in the meantime. """
+    uses_model = True
+    NAMED_ENTITY_RECOGNITION_MODEL = None
+    MODEL_LOCK = threading.Lock()
+    PREDICT_LOCK = threading.Lock()
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        return cls.NAMED_ENTITY_RECOGNITION_MODEL is not None
+
+    @classmethod
+    def get_model(cls):
+        with cls.MODEL_LOCK:
+            if cls.NAMED_ENTITY_RECOGNITION_MODEL is None:
+                import torch
+                import flair
+                from flair.models import SequenceTagger
+                # Check if a gpu is available, if it is the case use the gpu (default) else use cpu mode
+                if not torch.cuda.is_available():
+                    flair.device = torch.device('cpu')
+                cls.NAMED_ENTITY_RECOGNITION_MODEL = SequenceTagger.load(NAMED_ENTITY_RECOGNITION_MODEL_PATH)
+        return cls.NAMED_ENTITY_RECOGNITION_MODEL
+
+    @staticmethod
+    def observe_batch(size: int, batch_size: int) -> None:
+        MODEL_BATCH_SIZE.observe(size)
+        MODEL_BATCH_FILL.observe(size / batch_size)
+
+    def predict(self, flair_sentences, **kwargs) -> None:
+        """ Predicts the entities of the flair sentences with the shared model. """
+        model = self.get_model()
+        with FlairBackend.PREDICT_LOCK:
+            model.predict(flair_sentences, **kwargs)
+
+    def annotate(self, sentences: List[Sentence], batchsize: int = 64, batchOfSentences: bool = True) -> None:
+        if batchOfSentences:
+            self.batch_annotations(sentences, batchsize)
+        else:
+            self.single_annotations(sentences)
+
+    def batch_annotations(self, sentences: List[Sentence], batch_size: int = 64):
+        '''
+        Creates Batches of Sentences that will be parallel analysed by the
+        model.
+        :param batch_size: Number of Sentences parallel analysed
+        :return: by the Model annotated Sentences
+        '''
+        if NER_LEAN_INFERENCE:
+            return self.lean_batch_annotations(sentences, batch_size)
+
+        from flair.data import Sentence as fdSentence
+
+        batch = []
+        counter = 0
+
+        for num, sentence in enumerate(sentences, 1):
+            if num % batch_size == 0:
+                self.observe_batch(len(batch), batch_size)
+                self.predict(batch)
+                for annotatedSentence in batch:
+                    self.set_annotation_from_model(sentences[counter], annotatedSentence)
+                    counter += 1
+                checkpoint(len(batch))
+                batch = []
+
+            batch.append(fdSentence(sentence.text_in_sentence, use_tokenizer=TOKENIZER.get()))
+
+        if len(batch) > 0:
+            self.observe_batch(len(batch), batch_size)
+            self.predict(batch)
+            for annotatedSentence in batch:
+                self.set_annotation_from_model(sentences[counter], annotatedSentence)
+                counter += 1
+            checkpoint(len(batch))
+
+    def lean_batch_annotations(self, sentences: List[Sentence], batch_size: int = 64):
+        '''
+        Creates Batches of Sentences that will be parallel analysed by the model.
+        Only plain spans are kept from the prediction, no flair object outlives its batch.
+        :param batch_size: Number of Sentences parallel analysed
+        '''
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            self.observe_batch(len(batch), batch_size)
+            spans_per_sentence = self.predict_spans([_.text_in_sentence for _ in batch])
+            for sentence, spans in zip(batch, spans_per_sentence):
+                self.set_annotation_from_spans(sentence, spans)
+            checkpoint(len(batch))
+
+    def predict_spans(self, texts: List[str]) -> List[List[Tuple[int, int, str, float]]]:
+        """ Predicts the entities of the texts without storing the embeddings.
+        Returns for every text the found spans as (start, end, tag, score). """
+        from flair.data import Sentence as fdSentence
+
+        flair_sentences = [fdSentence(text, use_tokenizer=TOKENIZER.get()) for text in texts]
+        self.predict(flair_sentences, mini_batch_size=max(len(flair_sentences), 1), embedding_storage_mode='none')
+        res = [[(span.start_pos, span.end_pos, span.tag, span.score) for span in flair_sentence.get_spans('ner')]
+               for flair_sentence in flair_sentences]
+        del flair_sentences
+        return res
+
+    def single_annotations(self, sentences):
+        if NER_LEAN_INFERENCE:
+            return self.lean_batch_annotations(sentences, 1)
+
+        from flair.data import Sentence as fdSentence
+
+        for sentence in sentences:
+            annotatedSentence = fdSentence(sentence.text_in_sentence, use_tokenizer=TOKENIZER.get())
+            self.observe_batch(1, 1)
+            self.predict(annotatedSentence)
+            self.set_annotation_from_model(sentence, annotatedSentence)
+            checkpoint(1)
+
+    def set_annotation_from_model(self, sentence: Sentence, flair_sentence) -> None:
+        for span in flair_sentence.get_spans('ner'):
+            if span.score > ANNOTATION_SCORE:
+
+                locationSpan: Tuple[int, int] = (min([x.start_pos for x in span.tokens]),
+                                                 max([x.end_pos for x in span.tokens]))
+                wordList = self._clean_words_of_span(sentence.get_words_of_span(locationSpan))
+
+                if len(wordList) == 0:
+                    continue
+
+                anno = Annotation.create_model_annotation(span, wordList)
+                sentence.annotations.append(anno)
+
+    def set_annotation_from_spans(self, sentence: Sentence, spans: List[Tuple[int, int, str, float]]) -> None:
+        for start, end, tag, score in spans:
+            if score > ANNOTATION_SCORE:
+                wordList = self._clean_words_of_span(sentence.get_words_of_span((start, end)))
+
+                if len(wordList) == 0:
+                    continue
+
+                label = sentence.text_in_sentence[start:end]
+                anno = Annotation.create_model_annotation_from_span(label, start, end, tag, score, wordList)
+                sentence.annotations.append(anno)
+
+    @staticmethod
+    def _clean_words_of_span(wordList: List[Word]) -> List[Word]:
+        """ Removes brackets at the borders of the span and dismisses spans of figures and tables. """
+        if len(wordList) == 0:
+            return wordList
+
+        special_chars = ["(", ")", "{", "}", "[", "]", "\\"]
+        first_word = wordList[0]
+        last_word = wordList[-1]
+
+        if first_word.word in special_chars:
+            wordList.remove(first_word)
+        if last_word.word in special_chars and last_word in wordList:
+            wordList.remove(last_word)
+
+        for word in wordList:
+            if word.word.lower() in ["tab.", "tab", "table", "fig", "fig.", "figure"]:
+                return []
+        return wordList
+
+
+class GazetteerBackend(NERBackend):
+    """ Annotates the sentences with patterns only, no model (and no torch) is needed:
+    - numerical values followed by a unit (e.g. 0.8 GPa)
+    - the static tags of the gazetteer (ner_tags_static.json)
+    - known acronyms (e.g. COF)
+    It is a cheap replacement for the model, e.g. for fast requests or for tests on a cpu. """
+    NUMERICAL_CATEGORY = NUMERICAL_CATEGORY
+    ACRONYM_CATEGORY = ACRONYM_CATEGORY
+
+    def get_patterns(self) -> List[Tuple[Pattern, str, str]]:
+        """ Returns the patterns together with their category and specific category (see resources.py). """
+        return get_resources().gazetteer_patterns
+
+    def annotate(self, sentences: List[Sentence], batchsize: int = 64, batchOfSentences: bool = True) -> None:
+        for sentence in sentences:
+            self.set_annotation_from_patterns(sentence)
+            checkpoint(1)
+
+    def set_annotation_from_patterns(self, sentence: Sentence) -> None:
+        for pattern, category, specific_category in self.get_patterns():
+            for match in pattern.finditer(sentence.text_in_sentence):
+                words = sentence.get_words_of_span(match.span())
+                # Checks if the words are already part of an annotation
+                if len(words) == 0 or any([_.has_annotation for _ in words]):
+                    continue
+
+                label = " ".join([word.word for word in words])
+                startPos = min([word.start_pos for word in words])
+                endPos = max([word.end_pos for word in words])
+
+                anno = Annotation.create_manual_annotation(label, startPos, endPos, category, specific_category,
+                                                           words)
+                sentence.annotations.append(anno)
+
+
+class CascadeBackend(NERBackend):
+    """ Annotates the sentences with a cheap backend first. Only sentences without any hit are send to the
+    expensive backend, they are prefiltered if it has a model. """
+
+    def __init__(self, cheap_backend: NERBackend, expensive_backend: NERBackend):
+        self.cheap_backend = cheap_backend
+        self.expensive_backend = expensive_backend
+
+    def annotate(self, sentences: List[Sentence], batchsize: int = 64, batchOfSentences: bool = True) -> None:
+        self.cheap_backend.annotate(sentences, batchsize, batchOfSentences)
+        sentences_without_hits = [_ for _ in sentences if len(_.annotations) == 0]
+        if self.expensive_backend.uses_model:
+            sentences_without_hits = filter_model_sentences(sentences_without_hits)
+        get_processing_context().enter_stage('model', len(sentences_without_hits))
+        self.expensive_backend.annotate(sentences_without_hits, batchsize, batchOfSentences)
+
+
+FLAIR_BACKEND: FlairBackend = FlairBackend()
+GAZETTEER_BACKEND: GazetteerBackend = GazetteerBackend()
+NER_BACKENDS = {
+    'flair': FLAIR_BACKEND,
+    'gazetteer': GAZETTEER_BACKEND,
+    'cascade': CascadeBackend(GAZETTEER_BACKEND, FLAIR_BACKEND)
+}
+
+
+def get_ner_backend(name: str = None) -> NERBackend:
+    """ Returns the backend with the given name. If no name is given the backend of the deployment is used. """
+    return NER_BACKENDS[name or DEFAULT_NER_BACKEND]
@@ -0,0 +1,135 @@
+import logging
+from typing import List, Tuple, Dict, Pattern
+
+from ..datamodels.text_models import Sentence
+from ..resources import get_resources
+from app.core.config import NER_PREFILTER, NER_PREFILTER_SIGNALS
+from app.core.metrics import SENTENCES
+
+logger = logging.getLogger(__name__)
+
+
+class NERPrefilter:
+    """ Decides with cheap signals of the words of a sentence if the sentence is send to the named entity
+    recognition model. A sentence is send to the model if at least one of the enabled signals is found:
+    - digits: a word contains a digit
+    - units: a word is a known unit (units.json) or has a known long form (abbreviations.json)
+    - gazetteer: the sentence contains a static tag (ner_tags_static.json)
+    - capitalized: the sentence contains at least two capitalized words in a row (e.g. Hertzian Pressure)
+    """
+
+    def __init__(self, signals: List[str] = None):
+        self.signals: List[str] = signals if signals is not None else NER_PREFILTER_SIGNALS
+
+    def get_units(self) -> frozenset:
+        return get_resources().unit_set
+
+    def get_gazetteer(self) -> Pattern:
+        """ Any of the static tags (lower case). """
+        return get_resources().patterns['prefilter_gazetteer']
+
+    def is_candidate(self, sentence: Sentence) -> bool:
+        """ Checks if the sentence has any signal for an entity. """
+        words = sentence.words
+        if 'digits' in self.signals:
+            if any([any([char.isdigit() for char in word.word]) for word in words]):
+                return True
+        if 'units' in self.signals:
+            units = self.get_units()
+            if any([word.word in units or word.long_form != word.word for word in words]):
+                return True
+        if 'gazetteer' in self.signals:
+            if self.get_gazetteer().search(sentence.text_in_sentence.lower()):
+                return True
+        if 'capitalized' in self.signals:
+            # The first word of a sentence is always capitalized
+            for word, next_word in zip(words[1:], words[2:]):
+                if word.word[:1].isupper() and next_word.word[:1].isupper() and \
+                        word.word.isalpha() and next_word.word.isalpha():
+                    return True
+        return False
+
+    def split(self, sentences: List[Sentence]) -> Tuple[List[Sentence], List[Sentence]]:
+        """ Splits the sentences in the sentences that are send to the model and the skipped sentences. """
+        candidates = []
+        skipped = []
+        for sentence in sentences:
+            if self.is_candidate(sentence):
+                candidates.append(sentence)
+            else:
+                skipped.append(sentence)
+                logger.debug("Skipped sentence %s for the model: %s", sentence.id, sentence.text_in_sentence)
+
+        logger.info("Prefilter skipped %s of %s sentences for the model", len(skipped), len(sentences))
+        return candidates, skipped
+
+    def evaluate(self, sentences: List[Sentence]) -> Dict:
+        """ Compares the prefilter against the full inference. The sentences have to be annotated with the
+        model already (all of them). The recall loss is the share of the annotations that are found in sentences
+        the prefilter would have skipped. """
+        candidates, skipped = self.split(sentences)
+        annotations_in_candidates = sum([len(_.annotations) for _ in candidates])
+        annotations_in_skipped = sum([len(_.annotations) for _ in skipped])
+        annotations = annotations_in_candidates + annotations_in_skipped
+
+        report = {
+            'sentences': len(sentences),
+            'skipped_sentences': len(skipped),
+            'annotations': annotations,
+            'lost_annotations': annotations_in_skipped,
+            'recall_loss': annotations_in_skipped / annotations if annotations > 0 else 0.0
+        }
+        logger.info("Prefilter evaluation: %s", report)
+        return report
+
+
+PREFILTER: NERPrefilter = NERPrefilter()
+
+
+def filter_model_sentences(sentences: List[Sentence]) -> List[Sentence]:
+    """ Returns the sentences that are send to the model. With NER_PREFILTER on, the sentences without any signal for
+    an entity are skipped. Only a backend with a model is prefiltered, the patterns are cheaper than the prefilter. """
+    if NER_PREFILTER != 'on':
+        return sentences
+    sentences, skipped_sentences = PREFILTER.split(sentences)
+    SENTENCES.inc(len(skipped_sentences), source='skipped')
+    return sentences
+
+
+if __name__ == '__main__':
+    # Evaluates the prefilter against the full inference of the model on a corpus of documents
+    # python -m app.core.annotation_modul.apis.prefilter document_1.json document_2.json ...
+    import json
+    import sys
+    from ..datamodels.text_models import Text
+    from .ner_backends import FLAIR_BACKEND
+
+    logging.basicConfig(level=logging.INFO)
+    sentences_of_corpus = 0
+    skipped_of_corpus = 0
+    annotations_of_corpus = 0
+    lost_of_corpus = 0
+    for path in sys.argv[1:]:
+        with open(path, "r") as file:
+            document = json.load(file)
+        text = Text()
+        text.read_json({'chapters': document['text']['chapters']}, document['metadata'].get('abstract'))
+        chapters = [text.abstract] + text.chapters if text.abstract is not None else text.chapters
+        sentences = [sentence for chapter in chapters for paragraph in chapter.paragraphs
+                     for sentence in paragraph.sentences]
+
+        FLAIR_BACKEND.annotate(sentences)
+        report = PREFILTER.evaluate(sentences)
+        sentences_of_corpus += report['sentences']
+        skipped_of_corpus += report['skipped_sentences']
+        annotations_of_corpus += report['annotations']
+        lost_of_corpus += report['lost_annotations']
+
+    print(json.dumps({
+        'documents': len(sys.argv[1:]),
+        'sentences': sentences_of_corpus,
+        'skipped_sentences': skipped_of_corpus,
+        'annotations': annotations_of_corpus,
+        'lost_annotations': lost_of_corpus,
+        'recall_loss': lost_of_corpus / annotations_of_corpus if annotations_of_corpus > 0 else 0.0
+    }, indent=4))
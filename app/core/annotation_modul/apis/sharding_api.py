@@ -0,0 +1,192 @@
+import logging
+import multiprocessing
+import threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Tuple
+
+from ._base_api_ import TransformationStrategy
+from ..annotation_model import DocumentAnalysis
+from .annotation_api import AnnotationStrategy
+from .table_api import TableStrategy
+from .ner_backends import get_ner_backend
+from .annotation_cache import AnnotationCache, ShardResults, Token, AnnotationRecord, SHARD_RESULTS, \
+    get_annotation_cache, get_annotation_records, get_tokenizer
+from ..datamodels.annotation_model import Annotation
+from ..datamodels.text_models import Sentence
+from ..processing_context import ProcessingContext, CURRENT_CONTEXT, TaskCancelled, checkpoint, \
+    get_processing_context
+from ..resources import get_current_resources, get_resources, reload_resources
+from app.core.config import PIPELINE_PROFILES, SHARD_WORKERS, SHARDING_MIN_COST, SHARD_START_METHOD, TABLE_CELL_COST
+
+logger = logging.getLogger(__name__)
+
+# The tokens, the annotations of the named entity recognition per pass and of the gazetteer per text of a shard
+ShardResult = Tuple[Dict[str, List[Token]], Dict[str, List[List[AnnotationRecord]]], Dict[str, List[AnnotationRecord]]]
+
+
+class ShardContext(ProcessingContext):
+    """ The context of a shard in a worker process, it never aborts (the task is cancelled in the main process).
+    It keeps the next annotation id at the start of every stage, so the annotations of the named entity recognition can be
+    split into the passes of the backend (e.g. the cascade annotates all sentences with the cheap backend first). """
+
+    def __init__(self):
+        super().__init__(None, deadline=0)
+        self.stage_starts: List[int] = []
+
+    def enter_stage(self, stage: str, total: int = 0) -> None:
+        self.stage_starts.append(self.peek_id('annotation'))
+        super().enter_stage(stage, total)
+
+    def get_pass(self, annotation: Annotation) -> int:
+        return max(bisect_right(self.stage_starts, annotation.annotationID) - 1, 0)
+
+
+def annotate_shard(shard: Dict, ner_backend: str, stages: List[str], resource_version: str) -> ShardResult:
+    """ Tokenizes and annotates the sentences of a shard (a chapter or a table) in a worker process.
+    Only plain records are returned, the words and annotations are created by the main process.
+    The worker reloads its resources if the document uses another version, if the version is not available (the files
+    changed again) the shard fails and the document is processed serially. """
+    if get_current_resources().checksum != resource_version:
+        reload_resources()
+    if get_current_resources().checksum != resource_version:
+        raise ValueError(f"The resources {resource_version[:12]} are not available in the worker")
+
+    if 'table' in shard:
+        tableAPI = TableStrategy()
+        texts = tableAPI.get_table_texts(tableAPI.create_table(shard['table']))
+    else:
+        texts = shard['texts']
+    texts = list(dict.fromkeys(texts))
+
+    context = ShardContext()
+    token = CURRENT_CONTEXT.set(context)
+    try:
+        tokenizer = AnnotationCache(None, ner_backend)
+        sentences = [Sentence({'text': _}, None, tokenizer) for _ in texts]
+        annotationAPI = AnnotationStrategy()
+
+        annotations = {}
+        if 'model' in stages:
+            annotationAPI.annotate_with_model(64, sentences, True, get_ner_backend(ner_backend))
+            for sentence in sentences:
+                passes = [[] for _ in context.stage_starts]
+                for annotation, record in zip(sentence.annotations, get_annotation_records(sentence)):
+                    passes[context.get_pass(annotation)].append(record)
+                annotations[sentence.text_in_sentence] = passes
+
+        gazetteer_annotations = {}
+        if 'gazetteer' in stages:
+            for sentence in sentences:
+                number_of_annotations = len(sentence.annotations)
+                annotationAPI.set_manual_annotation(sentence)
+                records = get_annotation_records(sentence)[number_of_annotations:]
+                gazetteer_annotations[sentence.text_in_sentence] = records
+    finally:
+        CURRENT_CONTEXT.reset(token)
+    return tokenizer.tokens, annotations, gazetteer_annotations
+
+
+class ShardingStrategy(TransformationStrategy):
+    """ Splits a large document into shards, a shard per chapter and per table, and tokenizes and annotates them in
+    parallel by a pool of processes. It runs before the other strategies, they build the words and annotations from
+    the results of the shards in the serial order (see ShardResults). So the ids and the output are the same as
+    without sharding. If a shard fails, the document is processed serially. """
+    POOL: ProcessPoolExecutor = None
+    POOL_LOCK = threading.Lock()
+
+    @classmethod
+    def get_pool(cls) -> ProcessPoolExecutor:
+        """ Returns the pool of the worker processes, it is started on first use. """
+        with cls.POOL_LOCK:
+            if cls.POOL is None:
+                context = multiprocessing.get_context(SHARD_START_METHOD)
+                cls.POOL = ProcessPoolExecutor(SHARD_WORKERS, mp_context=context)
+            return cls.POOL
+
+    @classmethod
+    def reset_pool(cls, pool: ProcessPoolExecutor) -> None:
+        """ Drops the broken pool, a new one is started on the next use. A pool started by another thread in the
+        meantime is kept. """
+        with cls.POOL_LOCK:
+            if cls.POOL is pool:
+                cls.POOL = None
+        pool.shutdown(wait=False)
+
+    def preprocess_data(self, data: DocumentAnalysis) -> None:
+        if SHARD_WORKERS <= 0:
+            return
+        stages = PIPELINE_PROFILES[data.profile]
+        shards, cost = self.get_shards(data, stages)
+        if cost < SHARDING_MIN_COST or len(shards) < 2:
+            return
+
+        results = ShardResults(data.id, get_tokenizer(data.id))
+        get_processing_context().enter_stage('shards', len(shards))
+        futures = []
+        pool = self.get_pool()
+        try:
+            resource_version = get_resources().checksum
+            futures = [pool.submit(annotate_shard, shard, data.ner_backend, stages, resource_version)
+                       for shard in shards]
+            pending = futures
+            while pending:
+                # The task is cancelled in between, the running shards are finished by the workers but ignored
+                done, pending = wait(pending, timeout=1.0)
+                checkpoint(len(done))
+            for future in futures:
+                results.update(*future.result())
+        except TaskCancelled:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.exception("A shard of document %s failed, the document is processed serially", data.id)
+            for future in futures:
+                future.cancel()
+            # A crashed worker breaks the pool, a new one is started for the next document
+            if isinstance(e, BrokenProcessPool):
+                ShardingStrategy.reset_pool(pool)
+            return
+
+        # The cache keeps the tokens for the next version of the document
+        cache = get_annotation_cache(data.id)
+        if cache is not None:
+            cache.tokens.update(results.tokens)
+        SHARD_RESULTS[data.id] = results
+        logger.info("Annotated document %s (%s words) in %s shards", data.id, cost, len(shards))
+
+    def process_data(self, data: DocumentAnalysis) -> None:
+        pass
+
+    def postprocess_data(self, data: DocumentAnalysis) -> None:
+        pass
+
+    def get_shards(self, data: DocumentAnalysis, stages: List[str]) -> Tuple[List[Dict], int]:
+        """ Returns the shards of the document and its cost (see TABLE_CELL_COST). The text and the tables are still
+        the plain dicts of the request body. The sentences known from the previous version of the document are
+        skipped, they get the annotations of the cache. """
+        cache = get_annotation_cache(data.id)
+        known_texts = cache.previous.annotations if cache is not None and cache.previous is not None else {}
+
+        chapters = list(data.text['chapters'])
+        abstract = data.metadata.get('abstract')
+        if abstract is not None and 'paragraphs' in abstract:
+            chapters.append(abstract)
+
+        shards = []
+        cost = 0
+        for chapter in chapters:
+            texts = [sentence['text'] if 'text' in sentence else sentence.get('sentence', '')
+                     for paragraph in chapter['paragraphs'] for sentence in paragraph['sentences']]
+            texts = [_ for _ in texts if _ not in known_texts]
+            if texts:
+                shards.append({'texts': texts})
+                cost += sum([len(_.split()) for _ in texts])
+
+        if 'tables' in stages:
+            for table in data.tables:
+                shards.append({'table': table})
+                cost += sum([len(row.get('cells', [])) for row in table.get('rows', [])]) * TABLE_CELL_COST
+        return shards, cost
@@ -2,6 +2,9 @@ from ._base_api_ import TransformationStrategy
 from ..annotation_model import DocumentAnalysis
 from app.core.annotation_modul.datamodels.table_model import Table, Row, Column, Cell
 from app.core.annotation_modul.datamodels.text_models import Sentence
+from .annotation_cache import get_tokenizer
+from .util_functions import TOKENIZER
+from ..resources import get_resources
 import re
 from typing import List, Tuple, Union
 
@@ -14,15 +17,21 @@ class TableStrategy(TransformationStrategy):
 
     def preprocess_data(self, data: DocumentAnalysis) -> None:
         res = []
+        # The tables are still the plain dicts of the request body (see Document.from_json)
         for table in data.tables:
-            table = Table(table.dict())
-            table_header = table.get_table_header()
-            table.lines = self._get_table_lines(table, table_header)
-            table.units = self._get_list_of_table_units([table_header] + table.lines)
-            self.table_to_sentence(table)
+            table = self.create_table(table)
+            self.table_to_sentence(table, get_tokenizer(data.id))
             res.append(table)
         data.tables = res
 
+    def create_table(self, jsonDump) -> Table:
+        """ Creates the table with its lines and units from the plain dict of the request body. """
+        table = Table(jsonDump)
+        table_header = table.get_table_header()
+        table.lines = self._get_table_lines(table, table_header)
+        table.units = self._get_list_of_table_units([table_header] + table.lines)
+        return table
+
 
 
     def postprocess_data(self, data: DocumentAnalysis) -> None:
@@ -64,27 +73,21 @@ class TableStrategy(TransformationStrategy):
 
 
 
-    def table_to_sentence(self, table) -> None:
+    def table_to_sentence(self, table, tokenizer=TOKENIZER) -> None:
         '''
         Transforms the table in a list of simple sentences.
 
+        :param tokenizer: Splits the sentences into tokens, e.g. the AnnotationCache of the document.
+
         :return: None
         '''
-        table_header = table.get_table_header()
-        lines = table.lines
-        units = table.units
-
-        number_of_elements_in_line: int = len(lines[0].cells)
-
-        for i in range(number_of_elements_in_line):
-            for column, name, unit in zip(lines, table_header.cells, units):
-                text: str = f"The {name.textInCell} has a value of {column.cells[i].textInCell}{unit if unit else ''}."
-                text = re.sub(" +", " ", text)
-                sentence = Sentence.from_table(
-                    sentence=text,
-                    table=table)
-                table.textual_representations.append(sentence)
-                #line.textual_representation = sentence
+        for text in self.get_table_texts(table):
+            sentence = Sentence.from_table(
+                sentence=text,
+                table=table,
+                tokenizer=tokenizer)
+            table.textual_representations.append(sentence)
+            #line.textual_representation = sentence
 
         c = """
         for line in lines:
@@ -99,6 +102,24 @@ class TableStrategy(TransformationStrategy):
         """
 
 
+    def get_table_texts(self, table) -> List[str]:
+        '''
+        Returns the texts of the simple sentences of the table, a sentence per cell of the data.
+        '''
+        table_header = table.get_table_header()
+        lines = table.lines
+        units = table.units
+
+        number_of_elements_in_line: int = len(lines[0].cells)
+
+        res = []
+        for i in range(number_of_elements_in_line):
+            for column, name, unit in zip(lines, table_header.cells, units):
+                text: str = f"The {name.textInCell} has a value of {column.cells[i].textInCell}{unit if unit else ''}."
+                text = re.sub(" +", " ", text)
+                res.append(text)
+        return res
+
     def _get_list_of_table_units(self, lines: List[Union[Row, Column]]) -> List[str]:
         '''
         This function will return a list, of the size of a row or col, with units found in the table.
@@ -136,7 +157,7 @@ class TableStrategy(TransformationStrategy):
             for cell in line.cells:
                 text_in_cell: str = re.sub(regex, "", cell.textInCell)
                 _unit = " "
-                for unit in Table.UNITS:
+                for unit in get_resources().units:
                     if f" {unit} " in f" {text_in_cell} ":
                         _unit = unit
                         break
@@ -287,15 +308,13 @@ class TableStrategy(TransformationStrategy):
         return ratio_for_line
 
     def hits_per_line(self, line):
+        # Any of the categorical labels (lower case)
+        labels = get_resources().patterns['categorical_labels']
         hits_per_line = []
         for row in line:
             hits_for_line = []
             for cell in row.cells:
-                hit = False
-                for label in Table.CATEGORICAL_LABELS:
-                    if re.search(label.lower(), " " + cell.textInCell.lower() + " "):
-                        hit = True
-                        break
+                hit = labels.search(" " + cell.textInCell.lower() + " ") is not None
                 hits_for_line.append(hit)
             hits_per_line.append(hits_for_line)
         return hits_per_line
@@ -1,6 +1,7 @@
 from ._base_api_ import TransformationStrategy
 from ..annotation_model import DocumentAnalysis
 from ..datamodels.text_models import Text
+from .annotation_cache import get_tokenizer
 
 
 class TextStrategy(TransformationStrategy):
@@ -10,9 +11,10 @@ class TextStrategy(TransformationStrategy):
         super().__init__()
 
     def preprocess_data(self, data: DocumentAnalysis) -> None:
-        chapters = {'chapters': [_.dict() for _ in data.text.chapters]}
+        # The text is still the plain dict of the request body (see Document.from_json)
+        chapters = {'chapters': data.text['chapters']}
         data.text = Text()
-        data.text.read_json(chapters, data.metadata.abstract.dict())
+        data.text.read_json(chapters, data.metadata.get('abstract'), get_tokenizer(data.id))
 
 
     def postprocess_data(self, data: DocumentAnalysis) -> None:
@@ -1,32 +1,78 @@
-from app.core.config import MANUAL_NAMED_ENTITY_RECOGNITION, NAMED_ENTITY_RECOGNITION_MODEL_PATH
 import snowballstemmer
-import spacy
-from flair.tokenization import SegtokTokenizer, SciSpacyTokenizer
-from typing import List
-import json
-import torch
-import flair
+import threading
+from typing import Tuple
 
 
 ########################################################################################################################
 # Some models to initiate
+# The heavy models (torch, flair, spacy) are loaded on first use, the resources are part of the bundle (see resources.py)
 
-# Check if a gpu is available
-# if it is the case use the gpu (default) else use cpu mode
-if not torch.cuda.is_available():
-    flair.device = torch.device('cpu')
 
-POS_MODEL = spacy.load("en_core_sci_sm")
-TOKENIZER = SciSpacyTokenizer()
-STEMMER = snowballstemmer.stemmer('english')
-with open(MANUAL_NAMED_ENTITY_RECOGNITION, "r") as file:
-    MANUAL_NER_TAGS = json.load(file)
+class LazyTokenizer:
+    """ The tokenizer of the pipeline (SciSpacyTokenizer of flair), its spacy model is loaded on first use.
+    It tokenizes like the tokenizer itself, a flair sentence needs the loaded tokenizer (get). """
 
-def load_table(path_to_table: str) -> List[str]:
-    # Loads a dictionary (as a spellchecker) for checking data
-    res = [_ for _ in json.load(open(path_to_table, 'r+'))['data']]
-    return sorted(res, key=len, reverse=True)
+    def __init__(self):
+        self._tokenizer = None
+        self._lock = threading.Lock()
 
+    def get(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    from flair.tokenization import SciSpacyTokenizer
+                    self._tokenizer = SciSpacyTokenizer()
+        return self._tokenizer
 
+    @property
+    def loaded(self) -> bool:
+        return self._tokenizer is not None
 
+    def tokenize(self, text: str):
+        return self.get().tokenize(text)
 
+
+class ThreadLocalStemmer:
+    """ The snowball stemmer per thread. A stemmer keeps the word it stems in its state, so documents processed at
+    the same time by different threads must not share one. """
+
+    def __init__(self, language: str):
+        self.language: str = language
+        self._local = threading.local()
+
+    def get(self):
+        stemmer = getattr(self._local, 'stemmer', None)
+        if stemmer is None:
+            stemmer = self._local.stemmer = snowballstemmer.stemmer(self.language)
+        return stemmer
+
+    def stemWord(self, word: str) -> str:
+        return self.get().stemWord(word)
+
+
+TOKENIZER = LazyTokenizer()
+STEMMER = ThreadLocalStemmer('english')
+
+
+def get_memory_usage() -> Tuple[int, int]:
+    """ Returns the current and the peak resident set size of the process in bytes.
+    The values are read from /proc and are 0 on systems without it. """
+    res = {'VmRSS': 0, 'VmHWM': 0}
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                key = line.split(':')[0]
+                if key in res:
+                    res[key] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return res['VmRSS'], res['VmHWM']
+
+
+def reset_peak_memory_usage() -> None:
+    """ Resets the peak resident set size of the process to the current one (Linux only). """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
@@ -1,21 +1,16 @@
 from collections import defaultdict
-from typing import List
-import json
-from app.core.config import ANNOTATION_INPUT_PARAMETERS
+from typing import List, Dict
 import app.core.schemas.datamodel as io
+from app.core.annotation_modul.processing_context import next_id
 
 class Annotation:
-    with open(ANNOTATION_INPUT_PARAMETERS) as file:
-        ANNOTATION_SPECIFICATION = json.load(file)
-    IDCOUNTER = 1
-
     def __init__(self, label: str, startPos: int, endPos: int, category: str, specificCategory: str, confidence:
     float, typeOfAnnotation: bool, tokens, wordList):
         self.label: str = label
         self.startPos: int = startPos
         self.endPos: int = endPos
         self.confidence: float = confidence
-        self.annotationID: int = Annotation.IDCOUNTER
+        self.annotationID: int = next_id('annotation')
         self.category: str = category
         self.specificCategory: str = specificCategory
         self.wordList: List['Word'] = []
@@ -26,14 +21,21 @@ class Annotation:
         self.textualPatternMatch = False
         self.numericMatch = False
 
-        Annotation.IDCOUNTER += 1
-
     def to_io(self) -> io.Annotation:
         return io.Annotation(**{
             'words': [_.to_io() for _ in self.wordList],
             'category': self.specificCategory,
             'id': self.annotationID,
         })
+
+    def to_output_dict(self) -> Dict:
+        """ The output model (see to_io) as plain dict, without creating the pydantic models. """
+        return {
+            'id': self.annotationID,
+            'words': [_.to_output_dict() for _ in self.wordList],
+            'category': self.specificCategory
+        }
+
     def saveAsDict(self):
         res = {
             'id': self.annotationID,
@@ -65,6 +67,12 @@ class Annotation:
     def create_model_annotation(cls, span, wordList):
         return cls(span.text, span.start_pos, span.end_pos, span.tag, span.tag, span.score, True, span.tokens, wordList)
 
+    @classmethod
+    def create_model_annotation_from_span(cls, label: str, startPos: int, endPos: int, tag: str, score: float,
+                                          wordList):
+        """ Creates an annotation of the model from a plain span (lean inference) instead of a flair span. """
+        return cls(label, startPos, endPos, tag, tag, score, True, None, wordList)
+
     @classmethod
     def create_manual_annotation(cls, label: str, startPos: int, endPos: int, category: str,
                                  specificCategory: str, tokens):
@@ -78,8 +86,13 @@ class Annotation:
         :param typeOfAnnotation: True if Annotated with Model, False if Annotated with Manual
         :return:
         '''
+        # is Annotation with Model given as plain span, the words of the span are the annotated words
+        if typeOfAnnotation and tokens is None:
+            self.wordList.extend(wordList)
+            for word in wordList:
+                word.add_annotation(self.category, self, typeOfAnnotation)
         # is Annotation with Model
-        if typeOfAnnotation:
+        elif typeOfAnnotation:
             for token in tokens:
                 for word in wordList:
                     if word.start_pos == token.start_pos:
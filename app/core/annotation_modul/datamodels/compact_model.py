@@ -0,0 +1,122 @@
+from typing import Dict, List
+
+import orjson
+
+
+class CompactEncoder:
+    """ Encodes a processed document in the compact format of the response.
+
+    Every string is stored once in the string table 'strings' and referenced by its index. The words are stored
+    as columns (one list per attribute), a sentence references the range [start, end) of its words in these
+    columns and an annotation the indices of its words. A cell is stored once in the cells of its table,
+    rows and columns reference the indices of their cells.
+
+    {
+        'document_id': str,
+        'format': 'compact',
+        'strings': [str],
+        'words': {'id': [int], 'prev_word_id': [int], 'text': [int], 'normalized_text': [int],
+                  'enriched_text': [int], 'annotation_id': [int], 'start_pos': [int], 'end_pos': [int]},
+        'text': {'chapters': [{'paragraphs': [{'sentences': [[start, end]]}]}], 'abstract': chapter or None},
+        'tables': [{'rows': [{'cells': [int], 'type': str}], 'columns': [{'cells': [int], 'type': str}],
+                    'table_header': {'cells': [int], 'type': str}, 'units': [int],
+                    'cells': [{'text': int, 'annotation_ids': [int]}]}],
+        'annotations': {'id': [int], 'category': [int], 'words': [[int]]},
+        'knowledgeObjects': {'id': [int], 'category': [int], 'labels': [[int]], 'annotation_ids': [[int]]},
+        'profile': str
+    }
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._string_index: Dict[str, int] = {}
+        self.words: Dict[str, List[int]] = {'id': [], 'prev_word_id': [], 'text': [], 'normalized_text': [],
+                                            'enriched_text': [], 'annotation_id': [], 'start_pos': [],
+                                            'end_pos': []}
+        self._word_index: Dict[int, int] = {}
+
+    def encode(self, document, document_id: str = None) -> bytes:
+        """ Returns the document in the compact format as json. The document_id overwrites the id of the document. """
+        text = {
+            'chapters': [self._chapter(_) for _ in document.text.chapters],
+            'abstract': self._chapter(document.text.abstract) if document.text.abstract is not None else None
+        }
+        tables = [self._table(_) for _ in document.tables]
+        annotations = {'id': [], 'category': [], 'words': []}
+        for annotation in document.annotations:
+            annotations['id'].append(annotation.annotationID)
+            annotations['category'].append(self._string(annotation.specificCategory))
+            annotations['words'].append([self._word(_) for _ in annotation.wordList])
+        knowledgeObjects = {'id': [], 'category': [], 'labels': [], 'annotation_ids': []}
+        for knowledgeObject in document.knowledgeObjects:
+            knowledgeObjects['id'].append(knowledgeObject.knowObjID)
+            knowledgeObjects['category'].append(self._string(knowledgeObject.specificCategory))
+            knowledgeObjects['labels'].append([self._string(_) for _ in knowledgeObject.labels])
+            knowledgeObjects['annotation_ids'].append([_.annotationID for _ in knowledgeObject.annotations])
+
+        return orjson.dumps({
+            'document_id': document_id or document.id,
+            'format': 'compact',
+            'strings': self.strings,
+            'words': self.words,
+            'text': text,
+            'tables': tables,
+            'annotations': annotations,
+            'knowledgeObjects': knowledgeObjects,
+            'profile': document.profile
+        })
+
+    def _string(self, string: str) -> int:
+        if string not in self._string_index:
+            self._string_index[string] = len(self.strings)
+            self.strings.append(string)
+        return self._string_index[string]
+
+    def _word(self, word) -> int:
+        """ Adds the word to the columns (if not already done) and returns its index. """
+        if word.id not in self._word_index:
+            self._word_index[word.id] = len(self.words['id'])
+            self.words['id'].append(word.id)
+            self.words['prev_word_id'].append(word.previous_word.id if word.previous_word is not None else -1)
+            self.words['text'].append(self._string(word.word))
+            self.words['normalized_text'].append(self._string(word.normalized_form))
+            self.words['enriched_text'].append(self._string(word.long_form))
+            self.words['annotation_id'].append(word.annotation.annotationID if word.annotation is not None else -1)
+            self.words['start_pos'].append(word.start_pos)
+            self.words['end_pos'].append(word.end_pos)
+        return self._word_index[word.id]
+
+    def _chapter(self, chapter) -> Dict:
+        return {
+            'paragraphs': [{'sentences': [self._sentence(_) for _ in paragraph.sentences]}
+                           for paragraph in chapter.paragraphs]
+        }
+
+    def _sentence(self, sentence) -> List[int]:
+        start = len(self.words['id'])
+        for word in sentence.words:
+            self._word(word)
+        return [start, len(self.words['id'])]
+
+    def _table(self, table) -> Dict:
+        cells = []
+        cell_index = {}
+
+        def line(_line) -> Dict:
+            res = []
+            for cell in _line.cells:
+                annotation_ids = [_.annotationID for _ in cell.get_annotations()]
+                key = (cell.textInCell, tuple(annotation_ids))
+                if key not in cell_index:
+                    cell_index[key] = len(cells)
+                    cells.append({'text': self._string(cell.textInCell), 'annotation_ids': annotation_ids})
+                res.append(cell_index[key])
+            return {'cells': res, 'type': _line.type}
+
+        return {
+            'rows': [line(_) for _ in table.rows],
+            'columns': [line(_) for _ in table.cols],
+            'table_header': line(table.table_header),
+            'units': [self._string(_) for _ in table.units],
+            'cells': cells
+        }
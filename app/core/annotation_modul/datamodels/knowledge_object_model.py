@@ -1,20 +1,19 @@
 from fuzzywuzzy import process, fuzz
 import regex
-from typing import List
+from typing import List, Dict
 from .annotation_model import Annotation
 import app.core.schemas.datamodel as io
+from app.core.annotation_modul.processing_context import next_id
 
 class KnowledgeObject:
-    IDCounter = 1
 
     def __init__(self, annotation: Annotation):
         self.annotations: List[Annotation] = self._get_annotations_from_annotation_object(annotation)
-        self.knowObjID = KnowledgeObject.IDCounter
+        self.knowObjID = next_id('knowledgeObject')
         self.labels: List[str] = [_.label for _ in self.annotations]
         self.category: str = annotation.category
         self.specificCategory: str = annotation.specificCategory
         self._labels_normalized: List[str] = [" ".join([word.normalized_form for word in annotation.wordList]) for annotation in self.annotations]
-        KnowledgeObject.IDCounter += 1
 
     def to_io(self) -> io.KnowledgeObject:
         return io.KnowledgeObject(**{
@@ -24,6 +23,15 @@ class KnowledgeObject:
             'annotation_ids': [_.annotationID for _ in self.annotations]
         })
 
+    def to_output_dict(self) -> Dict:
+        """ The output model (see to_io) as plain dict, without creating the pydantic models. """
+        return {
+            'id': self.knowObjID,
+            'category': self.specificCategory,
+            'labels': [_ for _ in self.labels],
+            'annotation_ids': [_.annotationID for _ in self.annotations]
+        }
+
     def saveAsDictSmall(self):
         return self.knowObjID
 
@@ -5,23 +5,17 @@ from typing import Tuple, List, Dict, Union
 
 from app.core.annotation_modul.datamodels.text_models import Sentence
 from app.core.annotation_modul.datamodels.annotation_model import Annotation
+from app.core.annotation_modul.processing_context import next_id
 
-from app.core.config import CATEGORICAL_LABELS, UNITS
-from ..apis.util_functions import load_table
 import app.core.schemas.datamodel as io
 
 from ..apis.util_functions import TOKENIZER
-from flair.data import Sentence as fdSentence
 
 
 class Table:
-    # Get the categories and units as a sorted list
-    CATEGORICAL_LABELS = load_table(CATEGORICAL_LABELS)
-    UNITS = load_table(UNITS)
-
     def __init__(self, jsonDump: Dict):
         t_header = jsonDump['table_header']
-        if t_header['type'] == "row":
+        if t_header.get('type') == "row":
             t_header = Row(t_header)
         else:
             t_header = Column(t_header)
@@ -44,6 +38,15 @@ class Table:
             'units': self.units
         })
 
+    def to_output_dict(self) -> Dict:
+        """ The output model (see to_io) as plain dict, without creating the pydantic models. """
+        return {
+            'rows': [_.to_output_dict() for _ in self.rows],
+            'columns': [_.to_output_dict() for _ in self.cols],
+            'table_header': self.table_header.to_output_dict(),
+            'units': self.units
+        }
+
     def get_table_header(self) -> Union[Row, Column]:
         return self.table_header
 
@@ -54,7 +57,8 @@ class Table:
 
         for sentence in self.textual_representations:
             annotations.extend(sentence.annotations)
-        annotations = list(set(annotations))
+        # Without duplicates, in the order of the sentences
+        annotations = list(dict.fromkeys(annotations))
 
         lines = self.lines + [self.table_header]
         for line in lines:
@@ -62,8 +66,7 @@ class Table:
 
         for annotation in annotations:
             for cell in cells:
-                sentence = fdSentence(cell.textInCell, use_tokenizer=TOKENIZER)
-                for word in sentence.tokens:
+                for word in TOKENIZER.tokenize(cell.textInCell):
                     for annotation_word in annotation.wordList:
                         if word.text == annotation_word.word:
                             cell.annotations.append(annotation)
@@ -139,7 +142,7 @@ class Row:
     def __init__(self, jsonDump):
         self.cells = [Cell(cellDump) for cellDump in jsonDump['cells']]
         self.textual_representation: str = ''
-        self.type = jsonDump['type']
+        self.type = jsonDump.get('type', '')
 
     def to_io(self) -> io.Row:
         return io.Row(**{
@@ -147,6 +150,12 @@ class Row:
             'type': self.type
         })
 
+    def to_output_dict(self) -> Dict:
+        return {
+            'cells': [_.to_output_dict() for _ in self.cells],
+            'type': self.type
+        }
+
     def set_category(self, type: str):
         self.category = type
         for cell in self.cells:
@@ -160,14 +169,12 @@ class Row:
 
 
 class Column:
-    COUNTER = 1
 
     def __init__(self, jsonDump):
-        self.id = Column.COUNTER
+        self.id = next_id('column')
         self.cells = [Cell(cellDump) for cellDump in jsonDump['cells']]
-        self.type = jsonDump['type']
+        self.type = jsonDump.get('type', '')
         self.textual_representation: str = ''
-        Column.COUNTER += 1
 
     def to_io(self) -> io.Column:
         return io.Column(**{
@@ -175,6 +182,12 @@ class Column:
             'type': self.type
         })
 
+    def to_output_dict(self) -> Dict:
+        return {
+            'cells': [_.to_output_dict() for _ in self.cells],
+            'type': self.type
+        }
+
     def set_category(self, type: str):
         self.category = type
         for cell in self.cells:
@@ -191,18 +204,33 @@ class Cell:
 
     def __init__(self, jsonDump):
         self.textInCell = jsonDump['text'].rstrip().lstrip() if jsonDump['text'] is not None else ''
-        self.type: str = jsonDump['type']
-        self.category: str = jsonDump['category']
+        self.type: str = jsonDump.get('type', '')
+        self.category: str = jsonDump.get('category', '')
         self.annotations: List[Annotation] = []
         self.knowledgeObject = []
 
+    def get_annotations(self) -> List[Annotation]:
+        """ The annotations of the cell without duplicates, in the order they were found (not by a set, so the
+        output does not depend on the memory addresses). """
+        return list(dict.fromkeys(self.annotations))
+
     def to_io(self) -> io.Cell:
-        annotations = set(self.annotations)
+        annotations = self.get_annotations()
         return io.Cell(**{
             'text': self.textInCell,
             'annotation_ids': [_.annotationID for _ in annotations]
         })
 
+    def to_output_dict(self) -> Dict:
+        # The category and the type keep the defaults of the output model, as in to_io
+        annotations = self.get_annotations()
+        return {
+            'text': self.textInCell,
+            'category': '',
+            'type': '',
+            'annotation_ids': [_.annotationID for _ in annotations]
+        }
+
     def add_unit(self, unit: str):
         self.textInCell += " " + unit
 
@@ -2,9 +2,9 @@ from __future__ import annotations
 from typing import List, Tuple, Dict
 
 from .annotation_model import Annotation
-from app.core.config import ABBREVIATIONS
-import json
 from app.core.annotation_modul.apis.util_functions import STEMMER, TOKENIZER
+from app.core.annotation_modul.processing_context import next_id, get_processing_context
+from app.core.annotation_modul.resources import get_resources
 import app.core.schemas.datamodel as io
 import re
 
@@ -21,30 +21,46 @@ class Text:
             'chapters': [_.to_io() for _ in self.chapters],
             'abstract': self.abstract.to_io() if self.abstract is not None else None
         })
-    def read_json(self, jsonDumpText, jsonDumpAbstract):
-        self.chapters = [Chapter(chap) for chap in jsonDumpText['chapters']]
+
+    def to_output_dict(self) -> Dict:
+        """ The output model (see to_io) as plain dict, without creating the pydantic models. """
+        return {
+            'chapters': [_.to_output_dict() for _ in self.chapters],
+            'abstract': self.abstract.to_output_dict() if self.abstract is not None else None
+        }
+    def read_json(self, jsonDumpText, jsonDumpAbstract, tokenizer=TOKENIZER):
+        '''
+        :param tokenizer: Splits the sentences into tokens, e.g. a tokenizer that reuses the tokens of a previous
+                          version of the document (see AnnotationCache)
+        '''
+        self.chapters = [Chapter(chap, tokenizer) for chap in jsonDumpText['chapters']]
         if jsonDumpAbstract is not None:
-            self.abstract = self._set_abstract(jsonDumpAbstract)
+            self.abstract = self._set_abstract(jsonDumpAbstract, tokenizer)
 
 
 
-    def _set_abstract(self, dumpfile):
+    def _set_abstract(self, dumpfile, tokenizer=TOKENIZER):
         if 'paragraphs' in dumpfile:
-            return Chapter(dumpfile)
+            return Chapter(dumpfile, tokenizer)
         else:
             return None
 
 
 class Chapter:
 
-    def __init__(self, jsonDump):
-        self.paragraphs = [Paragraph(para) for para in jsonDump['paragraphs']]
+    def __init__(self, jsonDump, tokenizer=TOKENIZER):
+        self.paragraphs = [Paragraph(para, tokenizer) for para in jsonDump['paragraphs']]
 
     def to_io(self) -> io.Chapter:
         return io.Chapter(**{
             'paragraphs': [_.to_io() for _ in self.paragraphs]
         })
 
+    def to_output_dict(self) -> Dict:
+        return {
+            'paragraphs': [_.to_output_dict() for _ in self.paragraphs]
+        }
+
     def save_as_dict(self):
         annotations = self.getAnnotations()
         knowledgeObjects = self.getKnowledgeObjects()
@@ -78,14 +94,19 @@ class Chapter:
 
 class Paragraph:
 
-    def __init__(self, jsonDump):
-        self.sentences = [Sentence(sent, self) for sent in jsonDump['sentences']]
+    def __init__(self, jsonDump, tokenizer=TOKENIZER):
+        self.sentences = [Sentence(sent, self, tokenizer) for sent in jsonDump['sentences']]
 
     def to_io(self) -> io.Paragraph:
         return io.Paragraph(**{
             'sentences': [_.to_io() for _ in self.sentences]
         })
 
+    def to_output_dict(self) -> Dict:
+        return {
+            'sentences': [_.to_output_dict() for _ in self.sentences]
+        }
+
     def save_as_dict(self):
         annotations = self.getAnnotations()
         knowledgeObjects = self.getKnowledgeObjects()
@@ -111,28 +132,32 @@ class Paragraph:
 
 
 class Sentence:
-    ID = 0
 
-    def __init__(self, jsonDump: Dict, paragraph):
-        self.id = Sentence.ID
-        self.text_in_sentence: str = jsonDump['text'] if 'text' in jsonDump else jsonDump['sentence']
+    def __init__(self, jsonDump: Dict, paragraph, tokenizer=TOKENIZER):
+        self.id = next_id('sentence')
+        self.text_in_sentence: str = jsonDump['text'] if 'text' in jsonDump else jsonDump.get('sentence', '')
         self.paragraph = paragraph
         self.words: List[Word] = []
         self.annotations: List[Annotation] = []
-        Sentence.ID += 1
-        self.setWords()
+        self.setWords(tokenizer)
 
     def to_io(self) -> io.Sentence:
         return io.Sentence(**{
             'words': [_.to_io() for _ in self.words]
         })
 
+    def to_output_dict(self) -> Dict:
+        # The text keeps the default of the output model, as in to_io
+        return {
+            'text': '',
+            'words': [_.to_output_dict() for _ in self.words]
+        }
+
     @classmethod
-    def from_table(cls, sentence, table) -> Sentence:
+    def from_table(cls, sentence, table, tokenizer=TOKENIZER) -> Sentence:
         zwerg = {'sentence': sentence,
-                 'paragraph_id': Sentence.ID}
-        sentence = cls(zwerg, table)
-        sentence.setWords()
+                 'paragraph_id': get_processing_context().peek_id('sentence')}
+        sentence = cls(zwerg, table, tokenizer)
         return sentence
 
     def getText(self, useNormalizedForm: bool = False):
@@ -166,7 +191,7 @@ class Sentence:
         annotations = self.getAnnotations()
         return list(set([_.knowledgeObject for _ in annotations]))
 
-    def setWords(self) -> None:
+    def setWords(self, tokenizer=TOKENIZER) -> None:
         '''
         Splits the sentence in Words and save the words in the parameter words
         :return: None
@@ -174,7 +199,7 @@ class Sentence:
         if len(self.words) > 0:
             return
 
-        tokens = TOKENIZER.tokenize(self.text_in_sentence)
+        tokens = tokenizer.tokenize(self.text_in_sentence)
         # Create a Object for each Word
         prevWord: Word = None
         for token in tokens:
@@ -230,17 +255,11 @@ class Sentence:
 
 
 class Word:
-    IDCounter = 0
-    LONGFORMS = None
-    with open(ABBREVIATIONS, mode="rb") as js:
-        LONGFORMS = json.load(js)
 
     def __init__(self, word, startPos: int, endPos: int, prevWord: Word, spaceAfterWord: bool = False):
-        self.id = Word.IDCounter
+        self.id = next_id('word')
         self.word = word
-        self.long_form = word
-        if word in Word.LONGFORMS.keys():
-            self.long_form = Word.LONGFORMS[word]
+        self.long_form = get_resources().longforms.get(word, word)
         self.normalized_form: str = self._normalize_word(word)
         self.has_annotation = False
         self.annotation: Annotation = None
@@ -253,8 +272,6 @@ class Word:
         if self.previous_word:
             self.previous_word.next_word = self
 
-        Word.IDCounter += 1
-
     def to_io(self) -> io.Word:
         return io.Word(**{
             'id': self.id,
@@ -267,6 +284,18 @@ class Word:
             'end_pos': self.end_pos
         })
 
+    def to_output_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'prev_word_id': self.previous_word.id if self.previous_word is not None else -1,
+            'text': self.word,
+            'normalized_text': self.normalized_form,
+            'enriched_text': self.long_form,
+            'annotation_id': self.annotation.annotationID if self.annotation is not None else -1,
+            'start_pos': self.start_pos,
+            'end_pos': self.end_pos
+        }
+
     def _normalize_word(self, word: str) -> str:
         #######
         # For the normalization we have to consider serveral parts
@@ -0,0 +1,187 @@
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from app.core.config import TASK_DEADLINE
+
+
+class TaskCancelled(Exception):
+    """ Raised at a checkpoint of a task that was cancelled. """
+    status = 'cancelled'
+    reason = 'was cancelled'
+
+    def __init__(self, document_id: str, stage: str):
+        super().__init__(f"The task of the document {document_id} {self.reason} in the stage {stage}")
+        self.document_id: str = document_id
+        self.stage: str = stage
+
+
+class TaskTimeout(TaskCancelled):
+    """ Raised at a checkpoint of a task that exceeded its deadline. """
+    status = 'timeout'
+    reason = 'exceeded its deadline'
+
+
+class ProcessingContext:
+    """ The state of the processing of one document: the status, the current stage with its progress, the deadline
+    and the cancellation.
+
+    The long loops of the pipeline call checkpoint (or advance) regularly, there the task is aborted with TaskCancelled
+    or TaskTimeout if it was cancelled or exceeded its deadline. The deadline (in seconds) starts with the processing,
+    not with the submission.
+
+    The context owns the ids of the words, sentences, columns, annotations and KnowledgeObjects of the document (see
+    next_id), so documents processed at the same time in different threads do not share any counter. A document is
+    processed by a single thread, the context is not locked.
+
+    The context keeps the resources (gazetteer, units, ...) the document started with, a reload of the resources
+    during its processing takes effect with the next document (see resources.get_resources).
+
+    The timings of the phases of the strategies are collected per document (see TransformationStrategy). """
+    # The first id per kind of object
+    FIRST_IDS = {'word': 0, 'sentence': 0, 'column': 1, 'annotation': 1, 'knowledgeObject': 1}
+
+    def __init__(self, document_id: str, deadline: float = None):
+        self.document_id: str = document_id
+        self.deadline: float = deadline if deadline is not None else TASK_DEADLINE
+        self.status: str = 'pending'
+        self.stage: str = 'queued'
+        self.processed: int = 0
+        self.total: int = 0
+        self.detail: str = None
+        self.cancelled: bool = False
+        self.started: float = None
+        self.ended: float = None
+        self.ids: Dict[str, int] = dict(ProcessingContext.FIRST_IDS)
+        self.resources = None
+        self.timings: List[Dict] = []
+        # The task runs under the profiler (see task_api.profiling)
+        self.profiling: bool = False
+
+    def next_id(self, kind: str) -> int:
+        """ Allocates the next id of the kind of object (e.g. word or annotation) of the document. """
+        id = self.ids[kind]
+        self.ids[kind] += 1
+        return id
+
+    def peek_id(self, kind: str) -> int:
+        """ Returns the id the next object of the kind gets, without allocating it. """
+        return self.ids[kind]
+
+    def add_timing(self, strategy: str, phase: str, seconds: float, produced: Dict[str, int],
+                   failed: bool = False, memory_peak: int = None) -> Dict:
+        """ Adds the timing of a phase of a strategy with the number of objects (e.g. words) it produced and its peak
+        memory in bytes (only with the memory accounting). """
+        timing = {'strategy': strategy, 'phase': phase, 'seconds': seconds, **produced}
+        if memory_peak is not None:
+            timing['memory_peak'] = memory_peak
+        if failed:
+            timing['failed'] = True
+        self.timings.append(timing)
+        return timing
+
+    def get_timings(self) -> Dict:
+        """ Returns the timings of the phases in their order and the seconds per strategy. """
+        strategies = {}
+        for timing in self.timings:
+            strategies[timing['strategy']] = strategies.get(timing['strategy'], 0.0) + timing['seconds']
+        return {'elapsed': self.elapsed, 'strategies': strategies, 'phases': list(self.timings)}
+
+    def get_memory_peaks(self) -> Dict[str, int]:
+        """ Returns the peak memory per strategy in bytes, empty without the memory accounting. """
+        peaks = {}
+        for timing in self.timings:
+            if 'memory_peak' in timing:
+                peaks[timing['strategy']] = max(peaks.get(timing['strategy'], 0), timing['memory_peak'])
+        return peaks
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+        self.status = 'working'
+        self.stage = 'started'
+        self.checkpoint()
+
+    def enter_stage(self, stage: str, total: int = 0) -> None:
+        """ Starts a new stage, the progress is counted from 0 to total. """
+        self.stage = stage
+        self.processed = 0
+        self.total = total
+        self.checkpoint()
+
+    def advance(self, processed: int = 1) -> None:
+        """ Counts the processed units (e.g. sentences) of the stage and checks for a cancellation. """
+        self.processed += processed
+        self.checkpoint()
+
+    def checkpoint(self) -> None:
+        if self.cancelled:
+            raise TaskCancelled(self.document_id, self.stage)
+        if self.deadline and self.started is not None and time.monotonic() - self.started > self.deadline:
+            raise TaskTimeout(self.document_id, self.stage)
+
+    def cancel(self) -> None:
+        """ Requests the cancellation, the task stops at its next checkpoint. """
+        self.cancelled = True
+        if self.status == 'pending':
+            self.status = 'cancelled'
+
+    def finish(self, status: str = 'finished', detail: str = None) -> None:
+        self.status = status
+        self.detail = detail
+        self.ended = time.monotonic()
+
+    def renew(self) -> 'ProcessingContext':
+        """ Returns a new context for another run of the document with the settings of the submission (deadline and
+        profiling), the ids start again. """
+        context = ProcessingContext(self.document_id, self.deadline)
+        context.profiling = self.profiling
+        return context
+
+    @property
+    def in_flight(self) -> bool:
+        """ The task is queued or running, a cancelled task until it is aborted (see finish). """
+        return self.ended is None
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started is None:
+            return None
+        return (self.ended or time.monotonic()) - self.started
+
+    def to_status(self) -> Dict:
+        return {
+            'status': self.status,
+            'document_id': self.document_id,
+            'stage': self.stage,
+            'processed': self.processed,
+            'total': self.total,
+            'elapsed': self.elapsed,
+            'detail': self.detail
+        }
+
+
+# The context of the document that is processed by the current thread
+CURRENT_CONTEXT: ContextVar[ProcessingContext] = ContextVar('CURRENT_CONTEXT', default=None)
+# The contexts per document id, to report the progress and to cancel a task
+PROCESSING_CONTEXTS: Dict[str, ProcessingContext] = {}
+
+
+def get_processing_context() -> ProcessingContext:
+    """ Returns the context of the document processed by the current thread. Outside of a task (e.g. for the
+    evaluation of the prefilter) a context without deadline is returned, its checkpoints never abort and its ids
+    are counted per thread. """
+    context = CURRENT_CONTEXT.get()
+    if context is None:
+        context = ProcessingContext(None, deadline=0)
+        CURRENT_CONTEXT.set(context)
+    return context
+
+
+def next_id(kind: str) -> int:
+    """ Allocates the next id of the kind of object (e.g. word or annotation) of the document of the current thread. """
+    return get_processing_context().next_id(kind)
+
+
+def checkpoint(processed: int = 0) -> None:
+    """ Counts the processed units of the current stage and aborts the task if it was cancelled or timed out. """
+    get_processing_context().advance(processed)
@@ -0,0 +1,392 @@
+""" The resources of the pipeline (abbreviations, static tags, units, labels, ...) as one precompiled bundle.
+
+The build step compiles the JSON files of app/core/files into a single versioned binary file (RESOURCE_BUNDLE):
+
+    python -m app.core.annotation_modul.resources
+
+The bundle holds a string table and the tables of the resources in the form the pipeline uses them: sorted (the longest
+unit first), escaped and joined to the sources of the patterns. The workers map the bundle into memory (mmap), so it is
+loaded without parsing and its pages are shared between the processes. A missing bundle or a bundle of other resources
+(see the checksum) is replaced by compiling the JSON files in memory.
+
+The resources are reloaded without a restart (and without touching the model): the JSON files are watched
+(RESOURCE_WATCH_INTERVAL) or reloaded by the admin api. The new resources are compiled in the background and swapped
+in at once. A document keeps the resources it started with, the caches that depend on the resources (the annotations
+of the incremental cache and the content hashes of the deduplication) are keyed by their checksum.
+
+Layout (little endian):
+    MAGIC | uint32 length of the index | index (JSON) | string table | tables
+The string table is uint32 offsets[count + 1] followed by the UTF-8 bytes of all strings. A table is a sequence of rows
+of uint32 ids of the string table, the index holds the offset, the number of rows and the width of every table.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from functools import cached_property
+from typing import Dict, List, Tuple, Pattern, Sequence
+
+from app.core.config import RESOURCE_SOURCES, RESOURCE_BUNDLE, ABBREVIATIONS, MANUAL_NAMED_ENTITY_RECOGNITION, \
+    ANNOTATION_INPUT_PARAMETERS, CATEGORICAL_LABELS, UNITS, UNIT_CATEGORIES, RESOURCE_WATCH_INTERVAL
+from app.core.metrics import RESOURCE_RELOADS
+from app.core.annotation_modul.processing_context import CURRENT_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ANNRES\r\n'
+FORMAT_VERSION = 1
+
+# The categories of the patterns of the gazetteer that are not part of the static tags
+NUMERICAL_CATEGORY = "InputValue"
+ACRONYM_CATEGORY = "Acronym"
+
+
+def get_checksum(paths: Sequence[str] = None) -> str:
+    """ Returns the checksum of the JSON files and of the format, a bundle with another checksum is outdated. """
+    checksum = hashlib.sha256(str(FORMAT_VERSION).encode())
+    for path in paths if paths is not None else RESOURCE_SOURCES:
+        checksum.update(os.path.basename(path).encode())
+        with open(path, 'rb') as file:
+            checksum.update(file.read())
+    return checksum.hexdigest()
+
+
+def load_table(path_to_table: str) -> List[str]:
+    """ Loads a list of words (as a spellchecker) for checking data, the longest first. """
+    with open(path_to_table, 'r') as file:
+        res = [_ for _ in json.load(file)['data']]
+    return sorted(res, key=len, reverse=True)
+
+
+def compile_tables() -> Dict[str, List[Tuple[str, ...]]]:
+    """ Compiles the JSON files into the tables of the bundle, every row is a tuple of strings. """
+    with open(ABBREVIATIONS, 'rb') as file:
+        longforms = json.load(file)
+    with open(MANUAL_NAMED_ENTITY_RECOGNITION, 'r') as file:
+        manual_ner_tags = json.load(file)
+    with open(ANNOTATION_INPUT_PARAMETERS, 'r') as file:
+        annotation_specification = json.load(file)
+    with open(UNIT_CATEGORIES, 'r') as file:
+        unit_categories = json.load(file)
+    units = load_table(UNITS)
+    categorical_labels = load_table(CATEGORICAL_LABELS)
+
+    tables = {
+        'longforms': list(longforms.items()),
+        'ner_tags': [(name, attribute['category'], attribute['specific_category'], tag)
+                     for name, attribute in manual_ner_tags.items() for tag in attribute['tags']],
+        'annotation_specification': [(parameter, unit) for parameter, units_of_parameter in
+                                     annotation_specification.items() for unit in units_of_parameter],
+        'units': [(_,) for _ in units],
+        'categorical_labels': [(_,) for _ in categorical_labels],
+    }
+
+    # The patterns of the gazetteer backend in the order they are applied:
+    # - numerical values followed by a unit, e.g. 0.8 GPa or 10N
+    # - the static tags, the longest tag first
+    # - acronyms that are not a unit
+    gazetteer_patterns = []
+    for specific_category, units_of_category in unit_categories.items():
+        units_of_category = sorted(units_of_category, key=len, reverse=True)
+        regex = r"(?<![\w.,])\d+([.,]\d+)? ?(" + "|".join([re.escape(_) for _ in units_of_category]) + r")(?![\w/])"
+        gazetteer_patterns.append((regex, NUMERICAL_CATEGORY, specific_category))
+    tags = [(tag, category, specific_category) for _, category, specific_category, tag in tables['ner_tags']]
+    for synonym, category, specific_category in sorted(tags, key=lambda x: len(x[0]), reverse=True):
+        gazetteer_patterns.append((r"(?i)\b" + re.escape(synonym) + r"\b", category, specific_category))
+    known_units = set(units)
+    for acronym, long_form in longforms.items():
+        if len(acronym) > 1 and acronym.isalpha() and acronym.isupper() and acronym not in known_units:
+            gazetteer_patterns.append((r"\b" + re.escape(acronym) + r"\b", ACRONYM_CATEGORY, long_form))
+    tables['gazetteer_patterns'] = gazetteer_patterns
+
+    # The static tags as they are matched by the pattern matching of the annotation stage (lower case)
+    tables['manual_patterns'] = [(re.escape(tag.lower()), category, specific_category)
+                                 for _, category, specific_category, tag in tables['ner_tags']]
+
+    # Single patterns: any static tag (pre-filter) and any categorical label (tables)
+    lower_tags = sorted([tag.lower() for *_, tag in tables['ner_tags']], key=len, reverse=True)
+    tables['patterns'] = [
+        ('prefilter_gazetteer', "|".join([re.escape(_) for _ in lower_tags])),
+        ('categorical_labels', "|".join([f"(?:{_.lower()})" for _ in categorical_labels])),
+    ]
+    return tables
+
+
+def build_bundle(tables: Dict[str, List[Tuple[str, ...]]], checksum: str) -> bytes:
+    """ Encodes the tables into the binary bundle, every string is stored once. """
+    string_ids: Dict[str, int] = {}
+    for rows in tables.values():
+        for row in rows:
+            for value in row:
+                string_ids.setdefault(value, len(string_ids))
+    blob = b''.join([_.encode('utf-8') for _ in string_ids])
+    offsets = [0]
+    for value in string_ids:
+        offsets.append(offsets[-1] + len(value.encode('utf-8')))
+    strings = struct.pack(f'<{len(offsets)}I', *offsets) + blob
+    strings += b'\0' * (-len(strings) % 4)
+
+    sections = []
+    index = {'format': FORMAT_VERSION, 'checksum': checksum, 'strings': [0, len(string_ids)], 'tables': {}}
+    position = len(strings)
+    for name, rows in tables.items():
+        width = len(rows[0]) if rows else 1
+        ids = [string_ids[value] for row in rows for value in row]
+        sections.append(struct.pack(f'<{len(ids)}I', *ids))
+        index['tables'][name] = [position, len(rows), width]
+        position += len(sections[-1])
+
+    # The offsets of the index are relative to the end of the header, the header is padded to 4 bytes
+    encoded_index = json.dumps(index, sort_keys=True).encode('utf-8')
+    encoded_index += b' ' * (-(len(MAGIC) + 4 + len(encoded_index)) % 4)
+    return MAGIC + struct.pack('<I', len(encoded_index)) + encoded_index + strings + b''.join(sections)
+
+
+class ResourceBundle:
+    """ The resources read from a bundle (a mapped file or the bytes of the in-memory compilation). The strings are
+    decoded on access, the resources in the form of the pipeline are decoded once on first use. """
+
+    def __init__(self, buffer, path: str = None):
+        self.buffer = buffer
+        self.path = path
+        self.loaded_at: float = time.time()
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a resource bundle")
+        index_length, = struct.unpack_from('<I', buffer, len(MAGIC))
+        self.index: Dict = json.loads(bytes(buffer[len(MAGIC) + 4:len(MAGIC) + 4 + index_length]))
+        if self.index['format'] != FORMAT_VERSION:
+            raise ValueError(f"Format {self.index['format']} of the resource bundle is not supported")
+        self.base = len(MAGIC) + 4 + index_length
+        self.count = self.index['strings'][1]
+        self.blob = self.base + 4 * (self.count + 1)
+
+    @property
+    def checksum(self) -> str:
+        return self.index['checksum']
+
+    @classmethod
+    def open(cls, path: str) -> 'ResourceBundle':
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path)
+
+    @classmethod
+    def compile(cls) -> 'ResourceBundle':
+        return cls(build_bundle(compile_tables(), get_checksum()))
+
+    def prepare(self) -> 'ResourceBundle':
+        """ Decodes all resources and compiles the patterns, so the first document that uses them does not wait. """
+        for name in ['longforms', 'manual_ner_tags', 'annotation_specification', 'units', 'unit_set',
+                     'categorical_labels', 'patterns', 'gazetteer_patterns', 'manual_patterns']:
+            getattr(self, name)
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.checksum,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'strings': self.count,
+            'tables': {name: rows for name, (_, rows, _) in self.index['tables'].items()}
+        }
+
+    def get_string(self, string_id: int) -> str:
+        start, end = struct.unpack_from('<2I', self.buffer, self.base + 4 * string_id)
+        return bytes(self.buffer[self.blob + start:self.blob + end]).decode('utf-8')
+
+    def get_table(self, name: str) -> List[Tuple[str, ...]]:
+        offset, rows, width = self.index['tables'][name]
+        ids = struct.unpack_from(f'<{rows * width}I', self.buffer, self.base + offset)
+        values = [self.get_string(_) for _ in ids]
+        return [tuple(values[_:_ + width]) for _ in range(0, len(values), width)]
+
+    @cached_property
+    def longforms(self) -> Dict[str, str]:
+        return dict(self.get_table('longforms'))
+
+    @cached_property
+    def manual_ner_tags(self) -> Dict[str, Dict]:
+        res = {}
+        for name, category, specific_category, tag in self.get_table('ner_tags'):
+            attribute = res.setdefault(name, {'tags': [], 'category': category, 'specific_category': specific_category})
+            attribute['tags'].append(tag)
+        return res
+
+    @cached_property
+    def annotation_specification(self) -> Dict[str, List[str]]:
+        res = {}
+        for parameter, unit in self.get_table('annotation_specification'):
+            res.setdefault(parameter, []).append(unit)
+        return res
+
+    @cached_property
+    def units(self) -> List[str]:
+        """ The known units, the longest first. """
+        return [_ for _, in self.get_table('units')]
+
+    @cached_property
+    def unit_set(self) -> frozenset:
+        return frozenset(self.units)
+
+    @cached_property
+    def categorical_labels(self) -> List[str]:
+        """ The categorical labels of the tables, the longest first. """
+        return [_ for _, in self.get_table('categorical_labels')]
+
+    @cached_property
+    def patterns(self) -> Dict[str, Pattern]:
+        return {name: re.compile(source) for name, source in self.get_table('patterns')}
+
+    @cached_property
+    def gazetteer_patterns(self) -> List[Tuple[Pattern, str, str]]:
+        """ The patterns of the gazetteer backend together with their category and specific category. """
+        return [(re.compile(source), category, specific_category)
+                for source, category, specific_category in self.get_table('gazetteer_patterns')]
+
+    @cached_property
+    def manual_patterns(self) -> List[Tuple[Pattern, str, str]]:
+        """ The static tags (lower case) together with their category and specific category. """
+        return [(re.compile(source), category, specific_category)
+                for source, category, specific_category in self.get_table('manual_patterns')]
+
+
+RESOURCES: ResourceBundle = None
+RESOURCES_LOCK = threading.Lock()
+# Only one reload compiles the resources at a time
+RELOAD_LOCK = threading.Lock()
+
+
+def load_resources() -> ResourceBundle:
+    """ Maps the bundle of RESOURCE_BUNDLE, if it is missing or outdated the JSON files are compiled in memory. """
+    checksum = get_checksum()
+    if os.path.exists(RESOURCE_BUNDLE):
+        try:
+            bundle = ResourceBundle.open(RESOURCE_BUNDLE)
+            if bundle.checksum == checksum:
+                return bundle
+            logger.warning("The resource bundle %s is outdated, the resources are compiled in memory", RESOURCE_BUNDLE)
+        except (OSError, ValueError) as e:
+            logger.warning("The resource bundle %s is not readable (%s), the resources are compiled in memory",
+                           RESOURCE_BUNDLE, e)
+    return ResourceBundle(build_bundle(compile_tables(), checksum))
+
+
+def get_current_resources() -> ResourceBundle:
+    """ Returns the current resources of the process, they are loaded on first use. """
+    global RESOURCES
+    if RESOURCES is None:
+        with RESOURCES_LOCK:
+            if RESOURCES is None:
+                RESOURCES = load_resources()
+    return RESOURCES
+
+
+def get_resources() -> ResourceBundle:
+    """ Returns the resources for the document of the current thread. A document keeps the resources of its first
+    access, a reload takes effect with the next document. """
+    context = CURRENT_CONTEXT.get()
+    if context is None:
+        return get_current_resources()
+    if context.resources is None:
+        context.resources = get_current_resources()
+    return context.resources
+
+
+def get_resource_version() -> str:
+    return get_resources().checksum
+
+
+def reload_resources() -> Tuple[ResourceBundle, bool]:
+    """ Loads the resources again if the JSON files changed. The new resources are prepared (the patterns compiled)
+    before they replace the current ones. Returns the resources and whether they changed. """
+    global RESOURCES
+    with RELOAD_LOCK:
+        current = get_current_resources()
+        try:
+            if get_checksum() == current.checksum:
+                RESOURCE_RELOADS.inc(result='unchanged')
+                return current, False
+            resources = load_resources().prepare()
+        except Exception:
+            RESOURCE_RELOADS.inc(result='failed')
+            raise
+        RESOURCES = resources
+    RESOURCE_RELOADS.inc(result='changed')
+    logger.info("Reloaded the resources, version %s (previous %s)", resources.checksum[:12], current.checksum[:12])
+    return resources, True
+
+
+class ResourceWatcher:
+    """ Checks the JSON files for changes (modification time and size) every interval seconds and reloads the
+    resources. A file that cannot be parsed (e.g. while it is written) is tried again at the next change. """
+
+    def __init__(self, interval: float, paths: Sequence[str] = None):
+        self.interval: float = interval
+        self.paths: Sequence[str] = paths if paths is not None else RESOURCE_SOURCES
+        self.thread: threading.Thread = None
+        self.stopped = threading.Event()
+
+    def get_state(self) -> List[Tuple[float, int]]:
+        res = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                res.append((stat.st_mtime, stat.st_size))
+            except OSError:
+                res.append((0.0, -1))
+        return res
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name='resource-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def run(self) -> None:
+        state = self.get_state()
+        while not self.stopped.wait(self.interval):
+            new_state = self.get_state()
+            if new_state == state:
+                continue
+            state = new_state
+            try:
+                reload_resources()
+            except Exception:
+                logger.exception("Reloading the changed resources failed, the previous resources are kept")
+
+
+WATCHER: ResourceWatcher = None
+
+
+def start_resource_watcher() -> None:
+    """ Starts watching the JSON files (once per process), if RESOURCE_WATCH_INTERVAL is set. """
+    global WATCHER
+    if RESOURCE_WATCH_INTERVAL > 0 and WATCHER is None:
+        # The resources to compare with are loaded before the watcher takes its first state
+        get_current_resources()
+        WATCHER = ResourceWatcher(RESOURCE_WATCH_INTERVAL)
+        WATCHER.start()
+
+
+def write_bundle(path: str = None) -> str:
+    """ Compiles the JSON files and writes the bundle (atomically, a running worker keeps its mapped file). """
+    path = path or RESOURCE_BUNDLE
+    data = build_bundle(compile_tables(), get_checksum())
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+if __name__ == '__main__':
+    path = write_bundle(sys.argv[1] if len(sys.argv) > 1 else None)
+    bundle = ResourceBundle.open(path)
+    print(f"Wrote {path}: {os.path.getsize(path)} bytes, {bundle.count} strings, "
+          f"{len(bundle.index['tables'])} tables, checksum {bundle.checksum[:12]}")
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 
@@ -8,6 +9,169 @@ MANUAL_NAMED_ENTITY_RECOGNITION = os.path.join(CURRENT_DIRECTORY,"files/ner_tags
 NAMED_ENTITY_RECOGNITION_MODEL_PATH = os.path.join(CURRENT_DIRECTORY,"files/annotation_model/spanBert/final-model.pt")
 CATEGORICAL_LABELS = os.path.join(CURRENT_DIRECTORY,"files/categorical_labels.json")
 UNITS = os.path.join(CURRENT_DIRECTORY,"files/units.json")
+UNIT_CATEGORIES = os.path.join(CURRENT_DIRECTORY,"files/unit_categories.json")
+
+# The JSON resources are compiled into one binary bundle (python -m app.core.annotation_modul.resources), the workers
+# map it into memory. Without an up-to-date bundle the resources are compiled in memory on first use.
+RESOURCE_SOURCES = [MANUAL_NAMED_ENTITY_RECOGNITION, ABBREVIATIONS, ANNOTATION_INPUT_PARAMETERS, CATEGORICAL_LABELS, UNITS,
+                    UNIT_CATEGORIES]
+RESOURCE_BUNDLE = os.environ.get("RESOURCE_BUNDLE", os.path.join(CURRENT_DIRECTORY, "files/resources.bundle"))
+# Every worker checks the JSON resources for changes every RESOURCE_WATCH_INTERVAL seconds (0 disables the watcher) and
+# reloads them without a restart. POST /admin/resources/reload reloads them at once, but only in the worker that
+# answers the request.
+RESOURCE_WATCH_INTERVAL = float(os.environ.get("RESOURCE_WATCH_INTERVAL", "10"))
+
+# The admin apis (e.g. the reload of the resources) need the header X-Admin-Token with this token.
+# Without a token the admin apis are disabled.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Profiling of single documents (?profiling=true with the admin token)
+# The profiles (pstats and collapsed stacks sampled every PROFILING_SAMPLE_INTERVAL seconds) of the last
+# PROFILING_MAX_PROFILES documents are kept in PROFILING_DIRECTORY.
+PROFILING_DIRECTORY = os.environ.get("PROFILING_DIRECTORY", os.path.join(tempfile.gettempdir(), "annotation-profiles"))
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_MAX_PROFILES = int(os.environ.get("PROFILING_MAX_PROFILES", "20"))
 
 ANNOTATION_SCORE = 0.9
 
+# The stages of the pipeline that are executed for a request.
+# Every profile lists the stages it runs, a stage that is not part of the profile is skipped.
+# - tables: transforms the tables into sentences and annotates them
+# - model: annotates the sentences with the named entity recognition model
+# - gazetteer: annotates the sentences with the static tags, acronyms and the propagation of known annotations
+# - knowledgeObjects: clusters the annotations to KnowledgeObjects (needs at least one annotation stage)
+PIPELINE_PROFILES = {
+    "full": ["tables", "model", "gazetteer", "knowledgeObjects"],
+    "text": ["model", "gazetteer", "knowledgeObjects"],
+    "annotations": ["tables", "model", "gazetteer"],
+    "gazetteer": ["gazetteer"],
+}
+DEFAULT_PIPELINE_PROFILE = "full"
+
+# The backends for the named entity recognition
+# - flair: the trained SequenceTagger
+# - gazetteer: static tags, acronyms and numerical values with units (no model needed)
+# - cascade: the gazetteer first, only sentences without any hit are send to the model
+# The backend of the deployment can be set with the environment variable NER_BACKEND.
+NER_BACKENDS = ["flair", "gazetteer", "cascade"]
+DEFAULT_NER_BACKEND = os.environ.get("NER_BACKEND", "flair")
+
+# Pre-filter of the sentences for the named entity recognition
+# 'off': every sentence is send to the model
+# 'on': only sentences with at least one of the signals (digits, units, gazetteer, capitalized) are send to the model,
+# the backends without a model (gazetteer, the cheap pass of the cascade) annotate every sentence
+# 'evaluate': every sentence is send to the model and the recall loss of the pre-filter is logged
+NER_PREFILTER = os.environ.get("NER_PREFILTER", "off")
+NER_PREFILTER_SIGNALS = ["digits", "units", "gazetteer", "capitalized"]
+
+# Lean inference of the model: the embeddings are not stored and the predicted spans are converted
+# to plain tuples directly after each batch, so the flair objects are freed per batch.
+NER_LEAN_INFERENCE = os.environ.get("NER_LEAN_INFERENCE", "1") == "1"
+
+# Validation of the request body
+# Without the strict validation the body is parsed once and read directly by the pipeline.
+# The strict validation checks the complete document with pydantic (opt-in per request with ?strict=true).
+STRICT_VALIDATION = os.environ.get("STRICT_VALIDATION", "0") == "1"
+
+# Formats of the response
+# - full: the words are embedded in every annotation (default)
+# - compact: a shared string table, the words as columns and references instead of copies
+#   (requested with ?format=compact or the Accept header COMPACT_MEDIA_TYPE)
+RESPONSE_FORMATS = ["full", "compact"]
+COMPACT_MEDIA_TYPE = "application/vnd.annotation.compact+json"
+
+# Size of the chunks (in bytes) of a streamed result
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Default and maximal number of items of a page of the queryable results (annotations, knowledgeObjects, sentences)
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Deduplication of submitted documents by their content hash
+# A document with the same content (except the id) and the same pipeline version reuses the task of the first one.
+# The pipeline version is a checksum of the model, the settings below and the version of the (reloadable) resources.
+DEDUPLICATION = os.environ.get("DEDUPLICATION", "1") == "1"
+PIPELINE_RESOURCES = [NAMED_ENTITY_RECOGNITION_MODEL_PATH]
+
+# Incremental annotation of resubmitted documents
+# The tokens and the annotations of the named entity recognition are kept per document id (for the last
+# INCREMENTAL_CACHE_SIZE documents). A resubmitted document only sends its changed sentences to the backend,
+# unless the request sets ?incremental=false.
+INCREMENTAL_ANNOTATION = os.environ.get("INCREMENTAL_ANNOTATION", "1") == "1"
+INCREMENTAL_CACHE_SIZE = int(os.environ.get("INCREMENTAL_CACHE_SIZE", "100"))
+
+# Notification of finished tasks
+# The long-poll api waits at most MAX_LONG_POLL_TIMEOUT seconds (LONG_POLL_TIMEOUT by default) for the results.
+# The callback url of a request is called with a POST (json: status, document_id) when its results are ready.
+LONG_POLL_TIMEOUT = 30.0
+MAX_LONG_POLL_TIMEOUT = 120.0
+# The callbacks are sent by CALLBACK_WORKERS threads of their own, a slow client does not hold a worker of the
+# scheduler. A callback url has to be a host of CALLBACK_ALLOWED_HOSTS (comma separated) if it is set. Otherwise
+# any host is allowed that does not resolve to a private, loopback, link-local or reserved address, unless
+# CALLBACK_ALLOW_PRIVATE=1.
+CALLBACK_TIMEOUT = 10.0
+CALLBACK_RETRIES = 3
+CALLBACK_WORKERS = int(os.environ.get("CALLBACK_WORKERS", "4"))
+CALLBACK_ALLOWED_HOSTS = [_.strip().lower() for _ in os.environ.get("CALLBACK_ALLOWED_HOSTS", "").split(',')
+                          if _.strip()]
+CALLBACK_ALLOW_PRIVATE = os.environ.get("CALLBACK_ALLOW_PRIVATE", "0") == "1"
+
+# Deadline (in seconds) for the processing of a document, 0 for no deadline. A request can set its own deadline.
+TASK_DEADLINE = float(os.environ.get("TASK_DEADLINE", "0"))
+
+# Scheduling of the documents
+# The cost of a document is estimated on submission in words: the words of the text and TABLE_CELL_COST words per
+# table cell (every cell becomes a sentence). A document is put into the first lane its cost does not exceed
+# (max_cost None for no limit). The SCHEDULER_WORKERS threads serve the non-empty lanes by their weight, in a lane
+# the document with the smallest cost goes first. The cost is reduced by SCHEDULER_AGING words per second of waiting
+# and by SCHEDULER_PRIORITY_STEP words per level of the priority of the client (-10 to 10).
+# The reserved_workers of a lane are not used by the other lanes, so large documents never occupy every worker.
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "2"))
+SCHEDULER_LANES = {
+    "interactive": {"max_cost": 5000, "weight": 3, "reserved_workers": 1},
+    "batch": {"max_cost": None, "weight": 1},
+}
+TABLE_CELL_COST = 8
+SCHEDULER_AGING = 100.0
+SCHEDULER_PRIORITY_STEP = 1000.0
+
+# Sharding of large documents
+# A document with at least SHARDING_MIN_COST words (see TABLE_CELL_COST) is split into shards, a shard per chapter and
+# per table. The shards are tokenized and annotated (model and gazetteer) by a pool of SHARD_WORKERS processes, the
+# stages that need the whole document (acronyms, propagation, KnowledgeObjects) run on the merged results.
+# SHARD_WORKERS 0 (the default) disables the sharding, the pool adds SHARD_WORKERS processes with a copy of the
+# pipeline to every server process. The workers are started with SHARD_START_METHOD (spawn, forkserver or fork).
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", "0"))
+SHARDING_MIN_COST = int(os.environ.get("SHARDING_MIN_COST", "20000"))
+SHARD_START_METHOD = os.environ.get("SHARD_START_METHOD", "spawn")
+
+# Pre-forked deployment (see gunicorn_conf.py)
+# The master loads and warms up the pipeline once, the workers share the models copy-on-write.
+# SHARE_MODEL_MEMORY moves the tensors of the model to shared memory (/dev/shm) before the fork, which is off by
+# default: the tensors are shared copy-on-write anyway and docker limits /dev/shm to 64 MB, so the model needs a
+# container started with a larger --shm-size. WORKER_TORCH_THREADS limits the threads of torch per worker (0 keeps
+# the default of torch).
+PRELOAD_WARM_UP = os.environ.get("PRELOAD_WARM_UP", "1") == "1"
+SHARE_MODEL_MEMORY = os.environ.get("SHARE_MODEL_MEMORY", "0") == "1"
+WORKER_TORCH_THREADS = int(os.environ.get("WORKER_TORCH_THREADS", "0"))
+
+# The phases of the strategies are timed per document, the timings are logged and returned by the task status
+# (?timings=true).
+STAGE_TIMINGS = os.environ.get("STAGE_TIMINGS", "1") == "1"
+# The peak memory of the timed phases is measured by tracemalloc (see memory_accounting), it slows down the processing
+# and is off by default. MEMORY_ACCOUNTING_FRAMES frames are kept per traced allocation. With MEMORY_ACCOUNTING the
+# sizes of the stored results are estimated right after they are stored, otherwise when they are asked for.
+MEMORY_ACCOUNTING = os.environ.get("MEMORY_ACCOUNTING", "0") == "1"
+MEMORY_ACCOUNTING_FRAMES = 1
+
+# Startup
+# The heavy models (torch, flair, spacy) are loaded on first use, not on import. With WARM_UP_ON_STARTUP the app warms
+# up the pipeline in the background after its start, /ready answers 503 until the models are warm. The pre-forked
+# deployment warms up in the master instead (PRELOAD_WARM_UP). IMPORT_BUDGETS are the seconds an import may take in a
+# fresh interpreter, checked by: python -m app.core.import_budget
+WARM_UP_ON_STARTUP = os.environ.get("WARM_UP_ON_STARTUP", "1") == "1"
+IMPORT_BUDGETS = {
+    "app.core.schemas.datamodel": 0.5,
+    "app.routers.metrics": 0.5,
+    "app.routers.annotation": 2.0,
+}
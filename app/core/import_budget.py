@@ -0,0 +1,61 @@
+""" The import time of the modules of the service, every import is timed in a fresh interpreter against its budget
+(IMPORT_BUDGETS). The heavy models must not be loaded by an import, they are loaded on first use.
+
+    python -m app.core.import_budget [module ...]
+
+Exits with 1 if an import exceeds its budget, the slowest imports of the module (python -X importtime) are listed.
+"""
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from app.core.config import IMPORT_BUDGETS
+
+# Modules that must not be imported by importing the service (they are loaded on first use)
+HEAVY_MODULES = ['torch', 'flair', 'spacy']
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[int, str]], List[str]]:
+    """ Imports the module in a fresh interpreter. Returns the seconds of the import, the slowest imports
+    (cumulative microseconds, module) and the heavy modules that were imported. """
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "print(time.perf_counter() - start)\n"
+            f"print(','.join([_ for _ in {HEAVY_MODULES!r} if _ in sys.modules]))\n")
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr[-2000:]}")
+    lines = process.stdout.splitlines()
+    seconds = float(lines[-2])
+    heavy_modules = [_ for _ in lines[-1].split(',') if _]
+
+    # import time: self [us] | cumulative | imported package
+    imports = []
+    for line in process.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].strip()))
+    imports.sort(reverse=True)
+    return seconds, imports[:10], heavy_modules
+
+
+def check_budgets(budgets: Dict[str, float]) -> bool:
+    ok = True
+    for module, budget in budgets.items():
+        seconds, imports, heavy_modules = measure_import(module)
+        passed = seconds <= budget and not heavy_modules
+        ok = ok and passed
+        print(f"{'ok' if passed else 'FAILED':<8}{module:<40}{seconds:>8.3f} s (budget {budget:.3f} s)")
+        if heavy_modules:
+            print(f"        imports {', '.join(heavy_modules)}")
+        if not passed:
+            for cumulative, name in imports:
+                print(f"        {cumulative / 1e6:>8.3f} s  {name}")
+    return ok
+
+
+if __name__ == '__main__':
+    modules = sys.argv[1:]
+    sys.exit(0 if check_budgets({_: IMPORT_BUDGETS.get(_, 1.0) for _ in modules} if modules else IMPORT_BUDGETS)
+             else 1)
@@ -0,0 +1,74 @@
+""" The memory of the documents: the peak per phase of the pipeline and the size retained by a stored result.
+
+The peaks are measured by tracemalloc, which slows down the allocations of the whole process, so it is only started
+with MEMORY_ACCOUNTING=1 (or PYTHONTRACEMALLOC). A peak is the maximum of the traced memory during the phase above the
+memory at its start. tracemalloc traces the process, not a thread: with several documents at once the peak includes
+the allocations of the other documents, it is exact with a single worker of the scheduler.
+
+The retained size of a result is an estimate: the sizes (sys.getsizeof) of the objects reachable from the result,
+every object counted once. The classes, modules, functions and the resources are shared and not counted, the strings
+shared with other results (e.g. the long forms of the words) are counted for every result.
+"""
+import logging
+import sys
+import tracemalloc
+import types
+from typing import Iterable
+
+from app.core.config import MEMORY_ACCOUNTING, MEMORY_ACCOUNTING_FRAMES
+
+logger = logging.getLogger(__name__)
+
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                types.CodeType, types.FrameType, types.GeneratorType, types.CoroutineType)
+ATOMIC_TYPES = (str, bytes, int, float, bool, complex, type(None))
+
+
+def start_memory_accounting() -> None:
+    """ Starts tracemalloc if MEMORY_ACCOUNTING is set, the phases of the strategies are measured while it traces. """
+    if MEMORY_ACCOUNTING and not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_ACCOUNTING_FRAMES)
+        logger.info("Started the memory accounting (tracemalloc)")
+
+
+def start_peak() -> int:
+    """ Starts the measurement of a peak, returns the traced memory at its start. """
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    return current
+
+
+def get_peak(start: int) -> int:
+    """ Returns the peak of the traced memory since start_peak above the memory at its start. """
+    _, peak = tracemalloc.get_traced_memory()
+    return max(peak - start, 0)
+
+
+def get_retained_size(root, shared: Iterable = ()) -> int:
+    """ Estimates the bytes retained by root, the objects of shared (and the objects only reachable through them) are
+    not counted. """
+    seen = {id(_) for _ in shared}
+    stack = [root]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, ATOMIC_TYPES):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                slots = cls.__dict__.get('__slots__', ())
+                for name in [slots] if isinstance(slots, str) else slots:
+                    if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return size
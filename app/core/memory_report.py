@@ -0,0 +1,71 @@
+""" The memory of the workers of a pre-forked deployment (see gunicorn_conf.py).
+
+The unique set size (USS) of a worker is the memory only this worker uses, the pages it shares copy-on-write with the
+master (the models) are not included. The proportional set size (PSS) splits the shared pages among the processes.
+The number of workers per node is limited by: RSS of the master + workers * USS.
+
+    python -m app.core.memory_report <pid of the gunicorn master>
+"""
+import logging
+import os
+import sys
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def get_memory_report(pid='self') -> Dict[str, int]:
+    """ Returns the rss, pss, uss and shared memory of the process in bytes (Linux only, 0 on other systems). """
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        pass
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+        'shared': values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0)
+    }
+
+
+def get_child_pids(pid: int) -> List[int]:
+    """ Returns the pids of the child processes (the workers of the master). """
+    res = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as file:
+                # The name of the command is in brackets and can contain spaces, the parent pid follows the state
+                parent_pid = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent_pid == pid:
+            res.append(int(name))
+    return sorted(res)
+
+
+def log_memory_report(name: str, pid='self') -> Dict[str, int]:
+    report = get_memory_report(pid)
+    logger.info("Memory of %s: RSS %.1f MB, PSS %.1f MB, USS %.1f MB, shared %.1f MB", name,
+                *[report[_] / 2 ** 20 for _ in ['rss', 'pss', 'uss', 'shared']])
+    return report
+
+
+def format_report(master_pid: int) -> str:
+    lines = [f"{'process':<16}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}{'shared MB':>11}"]
+    processes = [('master', master_pid)] + [('worker', _) for _ in get_child_pids(master_pid)]
+    for name, pid in processes:
+        report = get_memory_report(pid)
+        lines.append(f"{name:<16}{pid:>8}" + ''.join([f"{report[_] / 2 ** 20:>10.1f}" for _ in ['rss', 'pss', 'uss']])
+                     + f"{report['shared'] / 2 ** 20:>11.1f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(format_report(int(sys.argv[1]) if len(sys.argv) > 1 else os.getpid()))
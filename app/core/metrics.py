@@ -0,0 +1,245 @@
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+
+class Metric(ABC):
+    """ A metric with a value per combination of labels.
+    The values are kept per thread, so the hot path (inc, observe) takes no lock. The values of all threads are merged
+    when the metrics are collected (a scrape may miss an update that is in progress). """
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = labelnames
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        # Only the registration of the values of a new thread is locked
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"The metric {self.name} needs the labels {', '.join(self.labelnames)}")
+        try:
+            return tuple([str(labels[_]) for _ in self.labelnames])
+        except KeyError:
+            raise ValueError(f"The metric {self.name} needs the labels {', '.join(self.labelnames)}")
+
+    def _shard(self) -> Dict:
+        """ Returns the values of the current thread. """
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def _get_shards(self) -> List[Dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # A copy of a dict is atomic, the thread of the shard may go on updating it
+        return [_.copy() for _ in shards]
+
+    @abstractmethod
+    def collect(self) -> List[str]:
+        """ Returns the samples in the text format of Prometheus. """
+
+
+class Counter(Metric):
+    """ A monotonically increasing value per combination of labels (Prometheus counter). """
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        values = self._shard()
+        values[key] = values.get(key, 0.0) + amount
+
+    def get_values(self) -> Dict[Tuple[str, ...], float]:
+        res = {}
+        for shard in self._get_shards():
+            for key, value in shard.items():
+                res[key] = res.get(key, 0.0) + value
+        return res
+
+    def value(self, **labels) -> float:
+        return self.get_values().get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        """ Returns the samples in the text format of Prometheus. """
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in self.get_values().items()]
+
+
+class Gauge(Metric):
+    """ A value per combination of labels that goes up and down (Prometheus gauge). The value is either set or
+    computed by a function when the metrics are collected (e.g. the length of a queue), which costs nothing in the hot
+    path. """
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Callable[[], Dict[Tuple[str, ...], float]] = None
+        super().__init__(name, documentation, labelnames)
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """ Sets the function that returns the values per combination of labels (as tuple) on collection. """
+        self._function = function
+
+    def get_values(self) -> Dict[Tuple[str, ...], float]:
+        values = dict(self._values)
+        if self._function is not None:
+            values.update(self._function())
+        return values
+
+    def collect(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in self.get_values().items()]
+
+
+class Histogram(Metric):
+    """ The distribution of observed values (e.g. latencies in seconds) in cumulative buckets per combination of
+    labels (Prometheus histogram). """
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        shard = self._shard()
+        # Per combination of labels: the counts per bucket (not cumulative, the last one is +Inf), the sum and the count
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        values[0][bisect_left(self.buckets, value)] += 1
+        values[1] += value
+        values[2] += 1
+
+    def get_values(self) -> Dict[Tuple[str, ...], List]:
+        res = {}
+        for shard in self._get_shards():
+            for key, (counts, total, count) in shard.items():
+                merged = res.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return res
+
+    def collect(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.get_values().items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames + ('le',), key + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not labelnames:
+        return ''
+    labels = ','.join([f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)])
+    return '{' + labels + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """ All metrics of the service, rendered in the text format of Prometheus by the api /metrics. """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric) -> None:
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY: Registry = Registry()
+
+DEDUPLICATED_DOCUMENTS = Counter('annotation_deduplication_total',
+                                 'Submitted documents by the result of the lookup of their content hash. '
+                                 'A hit reuses the task of an identical document (hit rate = hit / (hit + miss)).',
+                                 ('result',))
+CALLBACKS = Counter('annotation_callbacks_total',
+                    'Calls of the callback urls of the clients by their result (success, failure after the retries or '
+                    'blocked url).',
+                    ('result',))
+TASK_LATENCY = Histogram('annotation_task_latency_seconds',
+                         'Seconds from the submission of a document until its results are ready, per lane.',
+                         ('lane',))
+RESOURCE_RELOADS = Counter('annotation_resource_reloads_total',
+                           'Reloads of the resources (gazetteer, units, abbreviations, ...) by their result '
+                           '(changed, unchanged or failed).',
+                           ('result',))
+QUEUE_WAIT = Histogram('annotation_queue_wait_seconds',
+                       'Seconds a document waits in its lane until a worker starts it, per lane.',
+                       ('lane',))
+QUEUE_DEPTH = Gauge('annotation_queue_depth',
+                    'Documents waiting in the lane of the scheduler.',
+                    ('lane',))
+TASKS_IN_FLIGHT = Gauge('annotation_tasks_in_flight',
+                        'Documents processed by the workers of the scheduler at the moment, per lane.',
+                        ('lane',))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds',
+                            'Seconds of the requests per route (the template of the path), method and status code.',
+                            ('route', 'method', 'status'),
+                            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+STAGE_DURATION = Histogram('annotation_stage_duration_seconds',
+                           'Seconds of a phase (preprocess, process, postprocess) of a strategy of the pipeline.',
+                           ('strategy', 'phase'),
+                           buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+MODEL_BATCH_SIZE = Histogram('annotation_model_batch_size',
+                             'Sentences per batch of the named entity recognition model.',
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+MODEL_BATCH_FILL = Histogram('annotation_model_batch_fill_ratio',
+                             'Sentences per batch of the model divided by the batch size (1 = full batch).',
+                             buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+SENTENCES = Counter('annotation_sentences_total',
+                    'Sentences of the annotation stage by their source: model (annotated by the backend), cache '
+                    '(reused from the previous version), shards (annotated in parallel) or skipped (pre-filter). '
+                    'The rate is the throughput in sentences per second.',
+                    ('source',))
+CACHE_LOOKUPS = Counter('annotation_cache_lookups_total',
+                        'Lookups of the caches (incremental: sentences of resubmitted documents, encoded_results: the '
+                        'encoded responses) by their result (hit ratio = hit / (hit + miss)).',
+                        ('cache', 'result'))
+RESULT_STORE_DOCUMENTS = Gauge('annotation_result_store_documents',
+                               'Documents in the stores of the results (finished tasks, encoded results, indexes).',
+                               ('store',))
+RESULT_STORE_BYTES = Gauge('annotation_result_store_encoded_bytes',
+                           'Bytes of the encoded results kept for the responses.')
+RESULT_STORE_RETAINED_BYTES = Gauge('annotation_result_store_retained_bytes',
+                                    'Estimated bytes retained by the finished tasks and their indexes.')
+RESULT_RETAINED_BYTES = Histogram('annotation_result_retained_bytes',
+                                  'Estimated bytes retained by the result of a document (the task and its index).',
+                                  buckets=tuple([2 ** _ for _ in range(16, 32, 2)]))
+STAGE_MEMORY_PEAK = Histogram('annotation_stage_memory_peak_bytes',
+                              'Peak memory of a phase of a strategy above the memory at its start (only with '
+                              'MEMORY_ACCOUNTING=1).',
+                              ('strategy', 'phase'),
+                              buckets=tuple([2 ** _ for _ in range(16, 32, 2)]))
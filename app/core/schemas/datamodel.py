@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-from typing import List, Union
+from typing import List, Union, Dict, Iterator
 
-from pydantic import BaseModel, Field
+import orjson
+from pydantic import BaseModel, Field, validator
 
+from app.core.config import PIPELINE_PROFILES, DEFAULT_PIPELINE_PROFILE, NER_BACKENDS, INCREMENTAL_ANNOTATION
 
 
 class Annotation(BaseModel):
@@ -79,6 +81,32 @@ class ResponseDocument(BaseModel):
     tables: List[Table] = Field(description="A list of tables extracted from the document. ")
     annotations: List[Annotation] = []
     knowledgeObjects: List[KnowledgeObject] = []
+    profile: str = Field(default=DEFAULT_PIPELINE_PROFILE, description="The pipeline profile used for the document. ")
+
+
+class PositionedSentence(Sentence):
+    section: str = Field(description="The section of the sentence, abstract or chapters. ")
+    chapter: int
+    paragraph: int
+    sentence: int
+
+
+class Page(BaseModel):
+    document_id: str
+    total: int = Field(description="The number of items matching the filters. ")
+    next_cursor: int = Field(default=None, description="The cursor of the next page, None on the last page. ")
+
+
+class AnnotationPage(Page):
+    items: List[Annotation] = []
+
+
+class KnowledgeObjectPage(Page):
+    items: List[KnowledgeObject] = []
+
+
+class SentencePage(Page):
+    items: List[PositionedSentence] = []
 
 
 class Metadata(BaseModel):
@@ -92,6 +120,77 @@ class Document(BaseModel):
     tables: List[Table] = Field(description='The Tables of the document.', default=[])
     annotations: List = []
     knowledgeObjects: List = []
+    profile: str = Field(default=DEFAULT_PIPELINE_PROFILE,
+                         description=f"The pipeline profile defining the stages that are executed for the document. "
+                                     f"One of {', '.join(PIPELINE_PROFILES)}.")
+    ner_backend: str = Field(default=None,
+                             description=f"The backend for the named entity recognition. "
+                                         f"One of {', '.join(NER_BACKENDS)}. By default the backend of the "
+                                         f"deployment is used.")
+    incremental: bool = Field(default=INCREMENTAL_ANNOTATION,
+                              description="Reuse the annotations of the unchanged sentences and tables of a previous "
+                                          "version of the document (with the same id).")
+
+    @validator('profile')
+    def profile_is_known(cls, profile: str) -> str:
+        if profile not in PIPELINE_PROFILES:
+            raise ValueError(f"Unknown pipeline profile '{profile}'")
+        return profile
+
+    @validator('ner_backend')
+    def ner_backend_is_known(cls, ner_backend: str) -> str:
+        if ner_backend is not None and ner_backend not in NER_BACKENDS:
+            raise ValueError(f"Unknown backend '{ner_backend}'")
+        return ner_backend
+
+    @staticmethod
+    def chapter_is_well_formed(chapter, field: str) -> None:
+        """ Checks the nesting of a chapter of the request body, which is read as it is by the pipeline. """
+        if not isinstance(chapter, dict):
+            raise ValueError(f"The field {field} has to be an object")
+        if not isinstance(chapter.get('paragraphs', []), list):
+            raise ValueError(f"The field {field}.paragraphs has to be a list")
+        for paragraph in chapter.get('paragraphs', []):
+            if not isinstance(paragraph, dict) or not isinstance(paragraph.get('sentences', []), list):
+                raise ValueError(f"The paragraphs of {field} have to be objects with a list of sentences")
+            for sentence in paragraph['sentences'] if 'sentences' in paragraph else []:
+                if not isinstance(sentence, dict) or not isinstance(sentence.get('text', ''), str):
+                    raise ValueError(f"The sentences of {field} have to be objects with a text")
+
+    @classmethod
+    def from_json(cls, jsonDump: Dict, strict: bool = False) -> Document:
+        """ Creates the document from the parsed request body.
+        By default only the fields on the top level are checked and the text and tables stay plain dicts, which
+        are read once by the pipeline (see TextStrategy and TableStrategy).
+        The strict mode validates the complete document. """
+        if strict:
+            return cls.construct(**cls.parse_obj(jsonDump).dict())
+
+        missing_fields = [_ for _ in ['id', 'text', 'metadata'] if _ not in jsonDump]
+        if missing_fields:
+            raise ValueError(f"Missing fields {', '.join(missing_fields)}")
+        # The containers are read by the pipeline as they are, a wrong type would only fail in the task
+        if not isinstance(jsonDump['id'], str):
+            raise ValueError("The field id has to be a string")
+        if not isinstance(jsonDump['text'], dict):
+            raise ValueError("The field text has to be an object")
+        if 'chapters' not in jsonDump['text']:
+            raise ValueError("Missing field text.chapters")
+        if not isinstance(jsonDump['text']['chapters'], list):
+            raise ValueError("The field text.chapters has to be a list")
+        if not isinstance(jsonDump['metadata'], dict):
+            raise ValueError("The field metadata has to be an object")
+        for index, chapter in enumerate(jsonDump['text']['chapters']):
+            cls.chapter_is_well_formed(chapter, f"text.chapters[{index}]")
+        if jsonDump['metadata'].get('abstract') is not None:
+            cls.chapter_is_well_formed(jsonDump['metadata']['abstract'], "metadata.abstract")
+        if not isinstance(jsonDump.get('tables', []), list):
+            raise ValueError("The field tables has to be a list")
+        if not all([isinstance(_, dict) for _ in jsonDump.get('tables', [])]):
+            raise ValueError("The tables have to be objects")
+        cls.profile_is_known(jsonDump.get('profile', DEFAULT_PIPELINE_PROFILE))
+        cls.ner_backend_is_known(jsonDump.get('ner_backend'))
+        return cls.construct(**jsonDump)
 
     def to_output_model(self) -> ResponseDocument:
         return ResponseDocument(**{
@@ -99,9 +198,45 @@ class Document(BaseModel):
             'text': self.text.to_io(),
             'tables': [_.to_io() for _ in self.tables],
             'annotations': [_.to_io() for _ in self.annotations],
-            'knowledgeObjects': [_.to_io() for _ in self.knowledgeObjects]
+            'knowledgeObjects': [_.to_io() for _ in self.knowledgeObjects],
+            'profile': self.profile
+        })
+
+    def to_output_json(self, document_id: str = None) -> bytes:
+        """ Encodes the output model directly as json. The bytes are equal to the response of to_output_model,
+        but no pydantic model is created or validated on the way.
+        The document_id overwrites the id of the document (for a deduplicated document). """
+        return orjson.dumps({
+            'document_id': document_id or self.id,
+            'text': self.text.to_output_dict(),
+            'tables': [_.to_output_dict() for _ in self.tables],
+            'annotations': [_.to_output_dict() for _ in self.annotations],
+            'knowledgeObjects': [_.to_output_dict() for _ in self.knowledgeObjects],
+            'profile': self.profile
         })
 
+    def iter_output_records(self, document_id: str = None) -> Iterator[Dict]:
+        """ Yields the output model record by record (document, sentences, tables, annotations, knowledgeObjects).
+        Every record is created when it is requested, so the output is never in memory as a whole. """
+        yield {'type': 'document', 'document_id': document_id or self.id, 'profile': self.profile}
+
+        sections = [('abstract', [self.text.abstract] if self.text.abstract is not None else []),
+                    ('chapters', self.text.chapters)]
+        for section, chapters in sections:
+            for chapter_id, chapter in enumerate(chapters):
+                for paragraph_id, paragraph in enumerate(chapter.paragraphs):
+                    for sentence_id, sentence in enumerate(paragraph.sentences):
+                        yield {'type': 'sentence', 'section': section, 'chapter': chapter_id,
+                               'paragraph': paragraph_id, 'sentence': sentence_id, **sentence.to_output_dict(),
+                               'text': sentence.text_in_sentence}
+
+        for table_id, table in enumerate(self.tables):
+            yield {'type': 'table', 'table': table_id, **table.to_output_dict()}
+        for annotation in self.annotations:
+            yield {'type': 'annotation', **annotation.to_output_dict()}
+        for knowledgeObject in self.knowledgeObjects:
+            yield {'type': 'knowledgeObject', **knowledgeObject.to_output_dict()}
+
 
 
 
@@ -114,4 +249,7 @@ Table.update_forward_refs()
 Row.update_forward_refs()
 Column.update_forward_refs()
 Annotation.update_forward_refs()
-ResponseDocument.update_forward_refs()
\ No newline at end of file
+ResponseDocument.update_forward_refs()
+PositionedSentence.update_forward_refs()
+AnnotationPage.update_forward_refs()
+SentencePage.update_forward_refs()
\ No newline at end of file
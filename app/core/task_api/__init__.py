@@ -1,14 +1,24 @@
+import logging
 import os
+from typing import Dict
 
+import orjson
 from pydantic import BaseModel, Field
 
-from ..annotation_modul.apis import AnnotationStrategy, TextStrategy, TableStrategy, KnowledgeObjectStrategy
+from ..annotation_modul.apis import AnnotationStrategy, TextStrategy, TableStrategy, KnowledgeObjectStrategy, \
+    ShardingStrategy
+from ..annotation_modul.apis.annotation_cache import start_annotation_cache, SHARD_RESULTS
+from ..annotation_modul.processing_context import ProcessingContext, PROCESSING_CONTEXTS, CURRENT_CONTEXT
 from ..annotation_modul.annotation_model import DocumentAnalysis
+from ..config import PIPELINE_PROFILES, STAGE_TIMINGS
+
+logger = logging.getLogger(__name__)
 
 textAPI: TextStrategy = TextStrategy()
 tableAPI: TableStrategy = TableStrategy()
 annotationAPI: AnnotationStrategy = AnnotationStrategy()
 knowledgeObjectAPI: KnowledgeObjectStrategy = KnowledgeObjectStrategy()
+shardingAPI: ShardingStrategy = ShardingStrategy()
 
 
 class TaskSettings(BaseModel):
@@ -26,17 +36,17 @@ class TaskSettings(BaseModel):
         """ Creates a new Task asynchronicity. """
         data.update({
             "document_id": data['document'].id,
-            "data": {'document': data['document'].dict()}
+            "data": DocumentAnalysis.construct(document=data['document'])
         })
         self = cls(**data)
         return self
 
     @classmethod
     def create(cls, **data):
-        """ Creates a new Task. """
+        """ Creates a new Task. The document is handed over as it is, it is not validated a second time. """
         data.update({
             "document_id": data['document'].id,
-            "data": {'document': data['document'].dict()}
+            "data": DocumentAnalysis.construct(document=data['document'])
         })
         self = cls(**data)
         return self
@@ -69,27 +79,69 @@ class Task:
 
     @staticmethod
     def execute_annotation(task_settings: TaskSettings) -> None:
-        """ Extracts Text, Tables, Images, and Metadata from the PDF. """
+        """ Extracts Text, Tables, Images, and Metadata from the PDF.
+        Only the stages of the pipeline profile of the document are executed.
+        In the incremental mode the unchanged sentences of a resubmitted document reuse their tokens and
+        annotations (see AnnotationCache).
+        A large document is split into shards that are tokenized and annotated in parallel (see ShardingStrategy).
+        The progress is reported to the ProcessingContext of the document, a cancelled or timed out task is aborted
+        with TaskCancelled. The context also allocates the ids of the document, so several documents can be
+        processed at the same time by different threads (the strategies keep no state of a document). """
         data = task_settings.data.document
-
-        tableAPI.preprocess_data(data)
-        textAPI.preprocess_data(data)
-        annotationAPI.preprocess_data(data)
-        knowledgeObjectAPI.preprocess_data(data)
-
-        tableAPI.process_data(data)
-        textAPI.process_data(data)
-        annotationAPI.process_data(data)
-        knowledgeObjectAPI.process_data(data)
-
-        tableAPI.postprocess_data(data)
-        textAPI.postprocess_data(data)
-        annotationAPI.postprocess_data(data)
-        knowledgeObjectAPI.postprocess_data(data)
+        context = PROCESSING_CONTEXTS.get(data.id)
+        # The context of a former run of the document is replaced, the ids start again for every run
+        if context is None:
+            context = PROCESSING_CONTEXTS[data.id] = ProcessingContext(data.id)
+        elif context.started is not None:
+            context = PROCESSING_CONTEXTS[data.id] = context.renew()
+        token = CURRENT_CONTEXT.set(context)
+        try:
+            Task._execute_annotation(data, context)
+        finally:
+            CURRENT_CONTEXT.reset(token)
 
         task_settings.data = data
         task_settings.status = 'finished'
 
+    @staticmethod
+    def _execute_annotation(data, context: ProcessingContext) -> None:
+        context.start()
+        stages = PIPELINE_PROFILES[data.profile]
+        cache = start_annotation_cache(data)
+
+        if 'tables' not in stages:
+            data.tables = []
+
+        strategies = [tableAPI, textAPI]
+        if 'model' in stages or 'gazetteer' in stages:
+            # A large document is tokenized and annotated in shards before the text and the tables are read
+            strategies.insert(0, shardingAPI)
+            strategies.append(annotationAPI)
+        if 'knowledgeObjects' in stages:
+            strategies.append(knowledgeObjectAPI)
+
+        try:
+            # The strategies refine the stage, e.g. to model, gazetteer or knowledgeObjects
+            context.enter_stage('preprocess')
+            for strategy in strategies:
+                strategy.preprocess_data(data)
+
+            context.enter_stage('process')
+            for strategy in strategies:
+                strategy.process_data(data)
+
+            context.enter_stage('postprocess')
+            for strategy in strategies:
+                strategy.postprocess_data(data)
+        finally:
+            if cache is not None:
+                cache.finish()
+            SHARD_RESULTS.pop(data.id, None)
+            if STAGE_TIMINGS and context.timings:
+                timings = context.get_timings()
+                logger.info("Timings of document %s: %s", data.id, orjson.dumps(timings).decode(),
+                            extra={'timings': timings})
+
 
 class TaskBuilder:
     """ A Builder Class to create Tasksettings. """
@@ -119,7 +171,21 @@ class TaskBuilder:
         executable(task_settings)
 
 class TaskStatus(BaseModel):
-    status: str = Field(description="The Status of the task. This can be either 'working' or 'finished'. "
-                                    "If the status is 'working' the results of the task are not ready for the response."
-                                    "If the status is 'finished' call the api /extraction/get_data/{document_id}.")
+    status: str = Field(description="The Status of the task. This can be 'pending', 'working', 'finished', "
+                                    "'cancelled', 'timeout' or 'failed'. "
+                                    "If the status is 'pending' or 'working' the results of the task are not ready for "
+                                    "the response. "
+                                    "If the status is 'finished' call the api /annotation/get_task_results/.")
     document_id: str = Field(description="An id specified by the user to distinguish the extraction tasks. ")
+    stage: str = Field(default=None, description="The current stage of the task, e.g. model, gazetteer or "
+                                                 "knowledgeObjects. For an aborted task the stage it was aborted in.")
+    processed: int = Field(default=None, description="The processed units (e.g. sentences) of the stage. ")
+    total: int = Field(default=None, description="The units (e.g. sentences) of the stage, 0 if unknown. ")
+    elapsed: float = Field(default=None, description="The seconds since the start of the processing. ")
+    detail: str = Field(default=None, description="The reason of an aborted task. ")
+    timings: Dict = Field(default=None, description="Only with ?timings=true: the seconds per strategy and of every "
+                                                    "phase of the strategies with the number of sentences, words, "
+                                                    "annotations and knowledgeObjects it produced. ")
+    memory: Dict = Field(default=None, description="Only with ?memory=true: the estimated bytes retained by the stored "
+                                                   "result and the peak memory in bytes per strategy (only if the "
+                                                   "memory accounting is enabled). ")
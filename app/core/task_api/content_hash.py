@@ -0,0 +1,44 @@
+import hashlib
+import os
+from typing import Dict
+
+import orjson
+
+from app.core.config import PIPELINE_RESOURCES, ANNOTATION_SCORE, DEFAULT_PIPELINE_PROFILE, DEFAULT_NER_BACKEND, \
+    NER_PREFILTER, NER_PREFILTER_SIGNALS
+from app.core.annotation_modul.resources import get_resource_version
+
+PIPELINE_VERSION: str = None
+
+
+def get_pipeline_version() -> str:
+    """ Returns a checksum of everything besides the document that changes the results: the model, the settings and
+    the resources (gazetteer, abbreviations, units, ...). The checksum of the model is computed once on the first call,
+    the resources are part of it by their version, so a reload of the resources changes the pipeline version. """
+    global PIPELINE_VERSION
+    if PIPELINE_VERSION is None:
+        checksum = hashlib.sha256()
+        for path in PIPELINE_RESOURCES:
+            checksum.update(path.encode())
+            if not os.path.exists(path):
+                checksum.update(b'missing')
+                continue
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    checksum.update(block)
+        checksum.update(orjson.dumps([ANNOTATION_SCORE, NER_PREFILTER, NER_PREFILTER_SIGNALS]))
+        PIPELINE_VERSION = checksum.hexdigest()
+    return hashlib.sha256((PIPELINE_VERSION + get_resource_version()).encode()).hexdigest()
+
+
+def get_content_hash(jsonDump: Dict) -> str:
+    """ Returns the hash of the content of a document (the parsed request body) for the current pipeline version.
+    The id and the incremental mode (it does not change the results) are not part of the content, the keys are sorted
+    and the defaults of profile and backend are filled in, so the same paper submitted under another id has the same
+    hash. """
+    content = {key: value for key, value in jsonDump.items() if key not in ['id', 'incremental']}
+    content['profile'] = content.get('profile') or DEFAULT_PIPELINE_PROFILE
+    content['ner_backend'] = content.get('ner_backend') or DEFAULT_NER_BACKEND
+    checksum = hashlib.sha256(get_pipeline_version().encode())
+    checksum.update(orjson.dumps(content, option=orjson.OPT_SORT_KEYS))
+    return checksum.hexdigest()
@@ -0,0 +1,128 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from app.core.config import CALLBACK_TIMEOUT, CALLBACK_RETRIES, CALLBACK_WORKERS, CALLBACK_ALLOWED_HOSTS, \
+    CALLBACK_ALLOW_PRIVATE
+from app.core.metrics import CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionEvents:
+    """ Lets requests wait for the completion of a document instead of polling.
+    A waiting request registers a future of its event loop, the (background) thread that finishes the document sets
+    the futures thread-safe with call_soon_threadsafe. """
+
+    def __init__(self):
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def register(self, document_id: str) -> asyncio.Future:
+        """ Returns a future that is done as soon as the document is finished. It has to be registered before the
+        state of the document is checked, otherwise the completion could be missed. """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._waiters[document_id].append((loop, future))
+        return future
+
+    def unregister(self, document_id: str, future: asyncio.Future) -> None:
+        with self._lock:
+            waiters = self._waiters.get(document_id, [])
+            waiters[:] = [_ for _ in waiters if _[1] is not future]
+            if not waiters:
+                self._waiters.pop(document_id, None)
+
+    async def wait(self, future: asyncio.Future, timeout: float) -> bool:
+        """ Waits for the registered future. Returns False if the timeout expired. """
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self, document_id: str) -> None:
+        """ Wakes up every request waiting for the document (finished or aborted). Can be called from any thread. """
+        with self._lock:
+            waiters = self._waiters.pop(document_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_set_done, future)
+
+
+def _set_done(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+def check_callback_url(url: str) -> None:
+    """ Raises a ValueError if the callback url must not be called. It has to be a http url of a host of
+    CALLBACK_ALLOWED_HOSTS (if set), otherwise the host must not resolve to an address of the internal network
+    (private, loopback, link-local or reserved) unless CALLBACK_ALLOW_PRIVATE is set. The host is resolved, so the
+    check blocks. """
+    parts = urlsplit(url)
+    if parts.scheme not in ['http', 'https'] or not parts.hostname:
+        raise ValueError("The callback url has to be a http url")
+    if CALLBACK_ALLOWED_HOSTS:
+        if parts.hostname not in CALLBACK_ALLOWED_HOSTS:
+            raise ValueError(f"The host {parts.hostname} of the callback url is not allowed")
+        return
+    if CALLBACK_ALLOW_PRIVATE:
+        return
+
+    try:
+        addresses = {_[4][0] for _ in socket.getaddrinfo(parts.hostname, parts.port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"The host {parts.hostname} of the callback url can not be resolved")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global:
+            raise ValueError(f"The host {parts.hostname} of the callback url is an internal address")
+
+
+def send_callback(url: str, document_id: str, status: str = 'finished') -> bool:
+    """ Posts the status of the finished (or aborted) document to the callback url of the client.
+    A failed call is retried CALLBACK_RETRIES times with an increasing delay. The url is checked again before the
+    call (the address of the host may have changed since the submission) and redirects are not followed. """
+    try:
+        check_callback_url(url)
+    except ValueError as e:
+        logger.warning("Callback %s for document %s blocked: %s", url, document_id, e)
+        CALLBACKS.inc(result='blocked')
+        return False
+
+    payload = {'status': status, 'document_id': document_id}
+    for attempt in range(CALLBACK_RETRIES + 1):
+        try:
+            response = requests.post(url, json=payload, timeout=CALLBACK_TIMEOUT, allow_redirects=False)
+            if response.status_code < 400:
+                CALLBACKS.inc(result='success')
+                return True
+            logger.warning("Callback %s for document %s returned %s", url, document_id, response.status_code)
+        except requests.RequestException as e:
+            logger.warning("Callback %s for document %s failed: %s", url, document_id, e)
+        if attempt < CALLBACK_RETRIES:
+            time.sleep(2 ** attempt)
+    CALLBACKS.inc(result='failure')
+    return False
+
+
+def submit_callback(url: str, document_id: str, status: str = 'finished') -> Future:
+    """ Sends the callback (see send_callback) in a thread of the callbacks, the caller does not wait for it. """
+    return CALLBACK_EXECUTOR.submit(send_callback, url, document_id, status)
+
+
+COMPLETION_EVENTS: CompletionEvents = CompletionEvents()
+# The threads are started with the first callback
+CALLBACK_EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=CALLBACK_WORKERS, thread_name_prefix='callback')
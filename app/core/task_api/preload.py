@@ -0,0 +1,110 @@
+import gc
+import logging
+import threading
+import time
+
+from . import Task, TaskSettings
+from ..annotation_modul.apis.annotation_cache import ANNOTATION_CACHES
+from ..annotation_modul.apis.ner_backends import FlairBackend
+from ..annotation_modul.processing_context import PROCESSING_CONTEXTS
+from ..schemas.datamodel import Document
+
+logger = logging.getLogger(__name__)
+
+# A small document that passes every stage of the pipeline (model, gazetteer, acronyms, tables, KnowledgeObjects)
+WARM_UP_DOCUMENT = {
+    'id': '__warm_up__',
+    'metadata': {'abstract': {'paragraphs': [{'sentences': [
+        {'text': 'We measured the coefficient of friction under a normal load of 10 N.'}
+    ]}]}},
+    'text': {'chapters': [{'paragraphs': [{'sentences': [
+        {'text': 'The coefficient of friction (COF) of the MXene coating was 0.25 at a Hertzian Pressure of 1.47 GPa.'},
+        {'text': 'The COF was reduced at a relative Humidity of 50 %.'}
+    ]}]}]},
+    'tables': [{
+        'table_header': {'cells': [{'text': 'Material'}, {'text': 'COF'}], 'type': 'row'},
+        'rows': [{'cells': [{'text': 'Material'}, {'text': 'COF'}], 'type': 'row'},
+                 {'cells': [{'text': 'MXene'}, {'text': '0.25'}], 'type': 'row'}],
+        'columns': [{'cells': [{'text': 'Material'}, {'text': 'MXene'}], 'type': 'column'},
+                    {'cells': [{'text': 'COF'}, {'text': '0.25'}], 'type': 'column'}]
+    }]
+}
+
+
+class Readiness:
+    """ The state of the warm-up, the service is ready once the models are loaded and warm (see /ready). """
+
+    def __init__(self):
+        self.ready = False
+        self.warming_up = False
+        self.warm_up_seconds: float = None
+        self.error: str = None
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        return {
+            'ready': self.ready,
+            'warming_up': self.warming_up,
+            'warm_up_seconds': self.warm_up_seconds,
+            'error': self.error
+        }
+
+
+READINESS = Readiness()
+
+
+def warm_up(ner_backend: str = None) -> float:
+    """ Runs a small document through the pipeline, so the models and resources are loaded and the first inference
+    (e.g. the allocations of torch) is done before the first request. Returns the seconds of the warm-up. """
+    start = time.monotonic()
+    jsonDump = dict(WARM_UP_DOCUMENT, ner_backend=ner_backend, incremental=False)
+    task_settings = TaskSettings.create(client='warm-up', document=Document.from_json(jsonDump))
+    try:
+        Task.execute_annotation(task_settings)
+    finally:
+        # Nothing of the warm-up document is kept
+        PROCESSING_CONTEXTS.pop(jsonDump['id'], None)
+        ANNOTATION_CACHES.pop(jsonDump['id'], None)
+    duration = time.monotonic() - start
+    READINESS.ready = True
+    READINESS.warm_up_seconds = duration
+    logger.info("Warmed up the pipeline in %.1f s", duration)
+    return duration
+
+
+def start_warm_up() -> None:
+    """ Warms up the pipeline in a background thread, the app answers requests in the meantime. Nothing is done if the
+    pipeline is already warm (e.g. in a worker forked from a warmed up master) or is warming up. """
+    with READINESS.lock:
+        if READINESS.ready or READINESS.warming_up:
+            return
+        READINESS.warming_up = True
+
+    def run():
+        try:
+            warm_up()
+        except Exception as e:
+            READINESS.error = repr(e)
+            logger.exception("The warm-up of the pipeline failed")
+        finally:
+            READINESS.warming_up = False
+
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
+
+
+def freeze_for_fork(share_memory: bool = False) -> None:
+    """ Prepares the loaded models for the fork of the workers, they share the memory of the master copy-on-write.
+    - The parameters of the model are frozen (no gradients) and optionally moved to shared memory, so no worker
+      writes to the pages of the tensors.
+    - The objects of the master are moved to the permanent generation of the garbage collector (gc.freeze), so the
+      collections of the workers do not touch (and copy) their pages. """
+    model = FlairBackend.NAMED_ENTITY_RECOGNITION_MODEL
+    if model is not None:
+        model.eval()
+        for parameter in model.parameters():
+            parameter.requires_grad_(False)
+        if share_memory:
+            model.share_memory()
+    gc.collect()
+    gc.freeze()
+    logger.info("Froze %s objects of the master for the fork of the workers", gc.get_freeze_count())
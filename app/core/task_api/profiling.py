@@ -0,0 +1,122 @@
+""" Profiling of the task of a single document (opt-in per request, see extract_annotations).
+
+The task runs under cProfile (deterministic, the pstats file) and a stack sampler (wall clock, the collapsed stacks
+for flamegraph.pl or speedscope). Both only see the thread of the task, the shards of a large document are processed
+by other processes and are not part of the profile. Without the flag nothing is profiled.
+
+    python -m pstats <document>.pstats
+    flamegraph.pl <document>.collapsed > <document>.svg
+"""
+import cProfile
+import hashlib
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict
+
+from app.core.config import PROFILING_DIRECTORY, PROFILING_SAMPLE_INTERVAL, PROFILING_MAX_PROFILES
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FORMATS = {'pstats': '.pstats', 'collapsed': '.collapsed'}
+
+
+class StackSampler:
+    """ Samples the stack of a thread every interval seconds and counts the stacks in the collapsed format: the frames
+    from the root to the leaf separated by ';' and the number of samples. """
+
+    def __init__(self, thread_id: int, interval: float = PROFILING_SAMPLE_INTERVAL):
+        self.thread_id: int = thread_id
+        self.interval: float = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread: threading.Thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name=f'stack-sampler-{self.thread_id}', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                              .replace(';', ':'))
+                frame = frame.f_back
+            del frame
+            self.stacks[';'.join(reversed(frames))] += 1
+
+    def collapsed(self) -> str:
+        return ''.join([f"{stack} {count}\n" for stack, count in self.stacks.most_common()])
+
+
+def get_profile_path(document_id: str, format: str) -> str:
+    """ Returns the path of the profile of the document, the document id is hashed into a safe file name. """
+    name = re.sub(r'[^\w.-]', '_', document_id)[:64]
+    checksum = hashlib.sha1(document_id.encode()).hexdigest()[:12]
+    return os.path.join(PROFILING_DIRECTORY, f"{name}-{checksum}{PROFILE_FORMATS[format]}")
+
+
+def drop_old_profiles() -> None:
+    """ Keeps the files of the last PROFILING_MAX_PROFILES profiles. """
+    paths = [os.path.join(PROFILING_DIRECTORY, _) for _ in os.listdir(PROFILING_DIRECTORY)
+             if _.endswith(tuple(PROFILE_FORMATS.values()))]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[PROFILING_MAX_PROFILES * len(PROFILE_FORMATS):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profile_task(document_id: str):
+    """ Profiles the code of the block (the task of the document) and saves the pstats and the collapsed stacks. """
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        try:
+            os.makedirs(PROFILING_DIRECTORY, exist_ok=True)
+            profiler.dump_stats(get_profile_path(document_id, 'pstats'))
+            with open(get_profile_path(document_id, 'collapsed'), 'w') as file:
+                file.write(sampler.collapsed())
+            drop_old_profiles()
+            logger.info("Profiled document %s: %s samples", document_id, sum(sampler.stacks.values()))
+        except OSError:
+            logger.exception("The profile of document %s could not be saved", document_id)
+
+
+def get_profile_summary(document_id: str, limit: int = 50) -> str:
+    """ Returns the functions of the pstats of the document with the highest cumulative time as text. """
+    output = io.StringIO()
+    stats = pstats.Stats(get_profile_path(document_id, 'pstats'), stream=output)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+def get_profiles() -> Dict[str, float]:
+    """ Returns the files of the saved profiles with their modification time. """
+    if not os.path.isdir(PROFILING_DIRECTORY):
+        return {}
+    return {_: os.path.getmtime(os.path.join(PROFILING_DIRECTORY, _)) for _ in sorted(os.listdir(PROFILING_DIRECTORY))
+            if _.endswith(tuple(PROFILE_FORMATS.values()))}
@@ -0,0 +1,92 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List, Dict, Tuple, Sequence
+
+
+class ResultIndex:
+    """ Indexes of a processed document, built once when the task is finished.
+    The queries return the positions of the matching elements, so a page of the results can be serialized
+    without touching the rest of the document. """
+
+    def __init__(self, document):
+        self.annotations = document.annotations
+        self.knowledgeObjects = document.knowledgeObjects
+
+        self.annotations_by_category: Dict[str, List[int]] = defaultdict(list)
+        self.annotations_by_specific_category: Dict[str, List[int]] = defaultdict(list)
+        for position, annotation in enumerate(self.annotations):
+            self.annotations_by_category[annotation.category].append(position)
+            self.annotations_by_specific_category[annotation.specificCategory].append(position)
+
+        self.knowledgeObjects_by_category: Dict[str, List[int]] = defaultdict(list)
+        self.knowledgeObjects_by_specific_category: Dict[str, List[int]] = defaultdict(list)
+        labels = []
+        for position, knowledgeObject in enumerate(self.knowledgeObjects):
+            self.knowledgeObjects_by_category[knowledgeObject.category].append(position)
+            self.knowledgeObjects_by_specific_category[knowledgeObject.specificCategory].append(position)
+            labels.extend([(label.lower(), position) for label in knowledgeObject.labels])
+        # The labels are sorted, all labels with the same prefix are next to each other
+        labels.sort()
+        self._label_keys: List[str] = [_[0] for _ in labels]
+        self._label_positions: List[int] = [_[1] for _ in labels]
+
+        # The sentences with their position (section, chapter, paragraph, sentence) in the document
+        self.sentences: List[Tuple[str, int, int, int, object]] = []
+        self.sentences_by_chapter: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+        sections = [('abstract', [document.text.abstract] if document.text.abstract is not None else []),
+                    ('chapters', document.text.chapters)]
+        for section, chapters in sections:
+            for chapter_id, chapter in enumerate(chapters):
+                for paragraph_id, paragraph in enumerate(chapter.paragraphs):
+                    for sentence_id, sentence in enumerate(paragraph.sentences):
+                        self.sentences_by_chapter[(section, chapter_id)].append(len(self.sentences))
+                        self.sentences.append((section, chapter_id, paragraph_id, sentence_id, sentence))
+
+    @staticmethod
+    def _intersect(positions: Sequence[int], other_positions: Sequence[int]) -> List[int]:
+        other_positions = set(other_positions)
+        return [_ for _ in positions if _ in other_positions]
+
+    def find_annotations(self, category: str = None, specificCategory: str = None) -> Sequence[int]:
+        positions = range(len(self.annotations))
+        if category is not None:
+            positions = self.annotations_by_category.get(category, [])
+        if specificCategory is not None:
+            positions = self._intersect(positions, self.annotations_by_specific_category.get(specificCategory, []))
+        return positions
+
+    def find_knowledgeObjects(self, category: str = None, specificCategory: str = None,
+                              label_prefix: str = None) -> Sequence[int]:
+        positions = range(len(self.knowledgeObjects))
+        if category is not None:
+            positions = self.knowledgeObjects_by_category.get(category, [])
+        if specificCategory is not None:
+            positions = self._intersect(positions,
+                                        self.knowledgeObjects_by_specific_category.get(specificCategory, []))
+        if label_prefix is not None:
+            label_prefix = label_prefix.lower()
+            start = bisect_left(self._label_keys, label_prefix)
+            end = start
+            while end < len(self._label_keys) and self._label_keys[end].startswith(label_prefix):
+                end += 1
+            positions = self._intersect(positions, self._label_positions[start:end])
+        return positions
+
+    def find_sentences(self, section: str = 'chapters', chapter: int = None, paragraph_from: int = None,
+                       paragraph_to: int = None) -> Sequence[int]:
+        """ Finds the sentences of a section, optionally of a single chapter and of a range of paragraphs
+        (paragraph_from and paragraph_to are included). """
+        if chapter is not None:
+            positions = self.sentences_by_chapter.get((section, chapter), [])
+        else:
+            positions = [_ for _, sentence in enumerate(self.sentences) if sentence[0] == section]
+        if paragraph_from is not None:
+            positions = [_ for _ in positions if self.sentences[_][2] >= paragraph_from]
+        if paragraph_to is not None:
+            positions = [_ for _ in positions if self.sentences[_][2] <= paragraph_to]
+        return positions
+
+    def sentence_to_output_dict(self, position: int) -> Dict:
+        section, chapter_id, paragraph_id, sentence_id, sentence = self.sentences[position]
+        return {'section': section, 'chapter': chapter_id, 'paragraph': paragraph_id, 'sentence': sentence_id,
+                **sentence.to_output_dict(), 'text': sentence.text_in_sentence}
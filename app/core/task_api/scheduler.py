@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Callable
+
+from app.core.config import SCHEDULER_WORKERS, SCHEDULER_LANES, TABLE_CELL_COST, SCHEDULER_AGING, \
+    SCHEDULER_PRIORITY_STEP, PIPELINE_PROFILES, DEFAULT_PIPELINE_PROFILE
+from app.core.metrics import TASK_LATENCY, QUEUE_WAIT, QUEUE_DEPTH, TASKS_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_cost(jsonDump: Dict) -> float:
+    """ Estimates the cost of the processing of a document (the parsed request body) in words.
+    Only the plain dicts are counted, nothing is tokenized. """
+    def words_of_chapter(chapter: Dict) -> int:
+        return sum([len(sentence.get('text', '').split())
+                    for paragraph in chapter.get('paragraphs', []) for sentence in paragraph.get('sentences', [])])
+
+    cost = sum([words_of_chapter(_) for _ in (jsonDump.get('text') or {}).get('chapters', [])])
+    abstract = (jsonDump.get('metadata') or {}).get('abstract')
+    if abstract:
+        cost += words_of_chapter(abstract)
+    if 'tables' in PIPELINE_PROFILES[jsonDump.get('profile') or DEFAULT_PIPELINE_PROFILE]:
+        cells = sum([len(row.get('cells', [])) for table in jsonDump.get('tables') or [] for row in table.get('rows', [])])
+        cost += cells * TABLE_CELL_COST
+    return cost
+
+
+class ScheduledTask:
+
+    def __init__(self, document_id: str, cost: float, priority: int, lane: str, function: Callable, args: tuple):
+        self.document_id: str = document_id
+        self.cost: float = cost
+        self.priority: int = priority
+        self.lane: str = lane
+        self.function: Callable = function
+        self.args: tuple = args
+        self.submitted: float = time.monotonic()
+
+    def score(self, now: float) -> float:
+        """ The smallest score is processed first: the shortest job, aged by its waiting time and raised by the
+        priority of the client. """
+        return self.cost - self.priority * SCHEDULER_PRIORITY_STEP - (now - self.submitted) * SCHEDULER_AGING
+
+
+class Scheduler:
+    """ Processes the submitted documents with a fixed number of worker threads.
+    The documents are sorted into lanes by their estimated cost, so small documents are not queued behind a huge one.
+    The lanes are served by a smooth weighted round robin, in a lane the shortest (aged) job goes first.
+    The workers reserved for a lane (reserved_workers) are not used by the other lanes, a lane always gets at least
+    one worker. """
+
+    def __init__(self, lanes: Dict[str, Dict] = None, workers: int = SCHEDULER_WORKERS):
+        self.lane_settings: Dict[str, Dict] = lanes if lanes is not None else SCHEDULER_LANES
+        self.lanes: Dict[str, List[ScheduledTask]] = {_: [] for _ in self.lane_settings}
+        self._credits: Dict[str, float] = {_: 0.0 for _ in self.lane_settings}
+        # The tasks processed by the workers at the moment per lane
+        self.running: Dict[str, int] = {_: 0 for _ in self.lane_settings}
+        self.number_of_workers: int = workers
+        self._workers: List[threading.Thread] = []
+        self._condition = threading.Condition()
+
+    def get_lane(self, cost: float) -> str:
+        for lane, settings in self.lane_settings.items():
+            if settings['max_cost'] is None or cost <= settings['max_cost']:
+                return lane
+        return list(self.lane_settings)[-1]
+
+    def submit(self, document_id: str, cost: float, function: Callable, *args, priority: int = 0) -> str:
+        """ Queues the function (the processing of the document) and returns its lane. """
+        lane = self.get_lane(cost)
+        task = ScheduledTask(document_id, cost, priority, lane, function, args)
+        with self._condition:
+            # The workers are started with the first task, not at the import (e.g. before a fork)
+            if not self._workers:
+                self._start_workers()
+            self.lanes[lane].append(task)
+            self._condition.notify()
+        logger.info("Scheduled document %s (cost %s, priority %s) in lane %s", document_id, cost, priority, lane)
+        return lane
+
+    def get_lane_limit(self, lane: str) -> int:
+        """ Returns the number of workers the lane may use at the same time: every worker besides the ones reserved for
+        the other lanes, but at least one. """
+        reserved = sum([settings.get('reserved_workers', 0) for other, settings in self.lane_settings.items()
+                        if other != lane])
+        return max(self.number_of_workers - reserved, 1)
+
+    def _ready_lanes(self) -> List[str]:
+        """ Returns the lanes with queued tasks that may use another worker. """
+        return [_ for _, tasks in self.lanes.items() if tasks and self.running[_] < self.get_lane_limit(_)]
+
+    def queue_depth(self, lane: str) -> int:
+        return len(self.lanes[lane])
+
+    def in_flight(self, lane: str) -> int:
+        return self.running[lane]
+
+    def _start_workers(self) -> None:
+        for number in range(self.number_of_workers):
+            worker = threading.Thread(target=self._work, name=f"annotation-worker-{number}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _next_task(self) -> ScheduledTask:
+        """ Takes the next task, it has to be called with the condition held and at least one lane ready. """
+        lanes = self._ready_lanes()
+        total_weight = sum([self.lane_settings[_]['weight'] for _ in lanes])
+        for lane in lanes:
+            self._credits[lane] += self.lane_settings[lane]['weight']
+        lane = max(lanes, key=lambda _: self._credits[_])
+        self._credits[lane] -= total_weight
+
+        now = time.monotonic()
+        task = min(self.lanes[lane], key=lambda _: _.score(now))
+        self.lanes[lane].remove(task)
+        return task
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready_lanes():
+                    self._condition.wait()
+                task = self._next_task()
+                self.running[task.lane] += 1
+
+            QUEUE_WAIT.observe(time.monotonic() - task.submitted, lane=task.lane)
+            try:
+                task.function(*task.args)
+            except Exception:
+                logger.exception("Processing of document %s failed", task.document_id)
+            finally:
+                TASK_LATENCY.observe(time.monotonic() - task.submitted, lane=task.lane)
+                with self._condition:
+                    self.running[task.lane] -= 1
+                    # A task of the lane may have waited for the worker
+                    self._condition.notify()
+            # An idle worker must not keep the document of its last task alive
+            task = None
+
+
+SCHEDULER: Scheduler = Scheduler()
+QUEUE_DEPTH.set_function(lambda: {(_,): SCHEDULER.queue_depth(_) for _ in SCHEDULER.lanes})
+TASKS_IN_FLIGHT.set_function(lambda: {(_,): SCHEDULER.in_flight(_) for _ in SCHEDULER.lanes})
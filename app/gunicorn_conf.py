@@ -0,0 +1,42 @@
+# The pre-forked deployment with gunicorn:
+#
+#   gunicorn -c gunicorn_conf.py main:app --chdir /app
+#
+# The app is loaded once by the master (preload_app). Before the workers are forked the master warms up the pipeline
+# (the models are loaded and run once) and freezes its objects, so the workers share the models copy-on-write
+# instead of loading their own copy. Every worker logs its unique memory (USS) after its start, the memory of all
+# workers is reported by: python -m app.core.memory_report <pid of the master>
+import logging
+import os
+
+from app.core.config import PRELOAD_WARM_UP, SHARE_MODEL_MEMORY, WORKER_TORCH_THREADS
+
+bind = os.environ.get("BIND", "0.0.0.0:80")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def when_ready(server):
+    """ Runs in the master after the app is loaded, before the workers are forked. """
+    from app.core.task_api.preload import warm_up, freeze_for_fork
+    from app.core.memory_report import log_memory_report
+
+    if PRELOAD_WARM_UP:
+        warm_up()
+    freeze_for_fork(SHARE_MODEL_MEMORY)
+    log_memory_report("master")
+
+
+def post_fork(server, worker):
+    if WORKER_TORCH_THREADS > 0:
+        import torch
+        torch.set_num_threads(WORKER_TORCH_THREADS)
+
+
+def post_worker_init(worker):
+    from app.core.memory_report import log_memory_report
+
+    log_memory_report(f"worker {worker.pid}")
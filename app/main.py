@@ -3,22 +3,34 @@ from typing import List
 
 import uvicorn
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.status import HTTP_404_NOT_FOUND
 
-from routers import annotation
+from routers import annotation, metrics, health, admin
+from app.core.config import WARM_UP_ON_STARTUP
+from app.core.task_api.preload import start_warm_up
+from app.core.annotation_modul.resources import start_resource_watcher
+from app.core.memory_accounting import start_memory_accounting
 
 app = FastAPI()
 app.include_router(annotation.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
+app.include_router(admin.router)
+app.add_middleware(metrics.RequestLatencyMiddleware)
 
 subprocesses: List[subprocess.Popen] = []
 
 
 @app.on_event("startup")
 async def startup_event():
-    """ Start GrobID in the Background. """
-
-    pass
+    """ Start GrobID in the Background. Warms up the models in the background (see /ready), watches the
+    resources and starts the memory accounting. """
+    start_memory_accounting()
+    if WARM_UP_ON_STARTUP:
+        start_warm_up()
+    start_resource_watcher()
 
 
 @app.on_event("shutdown")
@@ -30,8 +42,14 @@ def shutdown_event():
 
 @app.exception_handler(StarletteHTTPException)
 async def custom_http_exception_handler(request, exc):
-    """ Redirects every wrong Request to the docs. """
-    return RedirectResponse("/docs")
+    """ Redirects a request of an unknown route to the docs. The errors of the APIs (e.g. a document that is not
+    found or an invalid document) are returned as json with their status code. """
+    # The router sets the endpoint only for a known route
+    if exc.status_code == HTTP_404_NOT_FOUND and 'endpoint' not in request.scope:
+        return RedirectResponse("/docs")
+    return JSONResponse({'detail': exc.detail}, status_code=exc.status_code, headers=getattr(exc, 'headers', None))
 
 
-uvicorn.run(app, port=8003, host='0.0.0.0')
+# The workers of the sharding (spawn) import the main module again, the server is only started by the main process
+if __name__ == '__main__':
+    uvicorn.run(app, port=8003, host='0.0.0.0')
@@ -0,0 +1,72 @@
+import hmac
+import os
+import time
+
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import PlainTextResponse
+from starlette.status import HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import ADMIN_TOKEN
+from app.core.annotation_modul.resources import get_current_resources, reload_resources
+from app.core.task_api.profiling import PROFILE_FORMATS, get_profile_path, get_profile_summary, get_profiles
+
+router = APIRouter()
+
+
+def is_admin(x_admin_token: str) -> bool:
+    """ Checks the token of the header X-Admin-Token, without ADMIN_TOKEN nobody is an admin. """
+    return bool(ADMIN_TOKEN) and x_admin_token is not None and hmac.compare_digest(x_admin_token, ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: str = Header(None)) -> None:
+    """ Checks the header X-Admin-Token of an admin api, without ADMIN_TOKEN the admin apis are disabled. """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="The admin api needs a valid X-Admin-Token")
+
+
+@router.get('/admin/resources', dependencies=[Depends(require_admin)])
+def get_resources_info():
+    """ An API to get the version of the resources (gazetteer, units, abbreviations, ...) of this worker. """
+    return Response(content=orjson.dumps(get_current_resources().to_dict()), media_type='application/json')
+
+
+@router.post('/admin/resources/reload', dependencies=[Depends(require_admin)])
+async def reload_resources_now():
+    """ An API to reload the resources of this worker at once (the other workers reload them by their watcher).
+    The resources are compiled in the background, the running documents keep their resources. """
+    start = time.monotonic()
+    previous = get_current_resources()
+    resources, changed = await run_in_threadpool(reload_resources)
+    return Response(content=orjson.dumps({
+        'changed': changed,
+        'version': resources.checksum,
+        'previous_version': previous.checksum,
+        'seconds': time.monotonic() - start
+    }), media_type='application/json')
+
+
+@router.get('/admin/profiles', dependencies=[Depends(require_admin)])
+def get_profile_files():
+    """ An API to list the saved profiles (the files with their modification time). """
+    return Response(content=orjson.dumps(get_profiles()), media_type='application/json')
+
+
+@router.get('/admin/profile', dependencies=[Depends(require_admin)])
+def get_profile(document_id: str, format: str = 'text'):
+    """ An API to get the profile of a document submitted with ?profiling=true:
+    - text: the functions with the highest cumulative time (pstats)
+    - pstats: the file of cProfile (python -m pstats, snakeviz)
+    - collapsed: the sampled stacks for flamegraph.pl or speedscope """
+    if format not in ['text'] + list(PROFILE_FORMATS):
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Unknown format '{format}'")
+    path = get_profile_path(document_id, 'pstats' if format == 'text' else format)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="No profile of the document")
+    if format == 'text':
+        return PlainTextResponse(get_profile_summary(document_id))
+    with open(path, 'rb') as file:
+        content = file.read()
+    return Response(content=content, media_type='text/plain' if format == 'collapsed' else 'application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename="{os.path.basename(path)}"'})
@@ -1,92 +1,293 @@
-from fastapi import APIRouter, File, UploadFile, BackgroundTasks, Request, Form, HTTPException, Response
-from starlette.status import HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_404_NOT_FOUND, HTTP_200_OK
-
-from app.core.schemas.datamodel import Document, ResponseDocument
+from fastapi import APIRouter, File, UploadFile, BackgroundTasks, Request, Form, HTTPException, Response, Query, \
+    Header, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.status import HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_404_NOT_FOUND, HTTP_200_OK, \
+    HTTP_422_UNPROCESSABLE_ENTITY, HTTP_409_CONFLICT, HTTP_403_FORBIDDEN
+
+import logging
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import ValidationError
+from typing import Iterator, Sequence, Callable, Dict, List
+
+from app.core.config import STRICT_VALIDATION, RESPONSE_FORMATS, COMPACT_MEDIA_TYPE, STREAM_CHUNK_SIZE, \
+    PAGE_SIZE, MAX_PAGE_SIZE, DEDUPLICATION, LONG_POLL_TIMEOUT, MAX_LONG_POLL_TIMEOUT, MEMORY_ACCOUNTING
+from app.core.metrics import DEDUPLICATED_DOCUMENTS, CACHE_LOOKUPS, RESULT_STORE_DOCUMENTS, RESULT_STORE_BYTES, \
+    RESULT_STORE_RETAINED_BYTES, RESULT_RETAINED_BYTES
+from app.core.memory_accounting import get_retained_size
+from app.core.annotation_modul.resources import get_current_resources
+from app.core.annotation_modul.datamodels.compact_model import CompactEncoder
+from app.core.annotation_modul.processing_context import ProcessingContext, PROCESSING_CONTEXTS, TaskCancelled
+
+from app.core.schemas.datamodel import Document, ResponseDocument, AnnotationPage, KnowledgeObjectPage, SentencePage
 from app.core.task_api import TaskBuilder, TaskStatus
+from app.core.task_api.result_index import ResultIndex
+from app.core.task_api.content_hash import get_content_hash
+from app.core.task_api.notifications import COMPLETION_EVENTS, check_callback_url, submit_callback
+from app.core.task_api.scheduler import SCHEDULER, estimate_cost
+from app.core.task_api.profiling import profile_task
+from .admin import is_admin, require_admin
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # The APIs necessary for the tasks
 
 taskBuilderAPI: TaskBuilder = TaskBuilder()
 finished_tasks_database = dict()
+# The results as json per format, every result is encoded once per format
+encoded_results_database = dict()
+# The indexes of the results for the queries on annotations, knowledgeObjects and sentences
+result_indexes_database = dict()
+# The document id of the first document per content hash (in-flight or finished)
+content_hashes_database = dict()
+# The content hash per document id
+document_content_hashes = dict()
+# A deduplicated document id points to the document id of the task that processes the same content
+document_aliases = dict()
+# The callback urls per document id, they are called once when the results of the document are ready
+callback_urls_database = dict()
+# The estimated bytes retained by the finished task and its index per document id, estimated when they are asked for
+# or, with MEMORY_ACCOUNTING, in the background after the task is stored (see get_result_size)
+result_sizes_database = dict()
+# Serializes the deduplication and the registration of the submitted documents (see submit_document) with the
+# bookkeeping of the finished, aborted and cancelled tasks
+SUBMISSION_LOCK = threading.Lock()
+
+RESULT_STORE_DOCUMENTS.set_function(lambda: {
+    ('finished_tasks',): len(finished_tasks_database),
+    ('encoded_results',): len(encoded_results_database),
+    ('result_indexes',): len(result_indexes_database)
+})
+RESULT_STORE_BYTES.set_function(lambda: {
+    (): sum([len(_) for results in list(encoded_results_database.values()) for _ in list(results.values())])
+})
+# Only the sizes estimated so far, a scrape never walks a result
+RESULT_STORE_RETAINED_BYTES.set_function(lambda: {(): sum(list(result_sizes_database.values()))})
+# The thread that estimates the sizes of the stored results (only with MEMORY_ACCOUNTING)
+RESULT_SIZE_EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-size')
+
+
+def get_inline_schema(model) -> Dict:
+    """ Returns the json schema of the pydantic model with the nested models inlined, for the openapi_extra of a route
+    that reads its body itself (the definitions of the nested models are not part of the openapi components). """
+    schema = model.schema()
+    definitions = schema.pop('definitions', {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if '$ref' in node:
+                return resolve(definitions[node['$ref'].split('/')[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(_) for _ in node]
+        return node
+
+    return resolve(schema)
 
 
 def get_state(document_id: str):
     """ Gets the state of the document. If the document is ready for the response to the Requester the state finished
     will be called."""
-    if document_id in finished_tasks_database:
+    if resolve_alias(document_id) in finished_tasks_database:
         return 'finished'
     else:
         return 'working'
 
 
-def get_results(document_id: str) -> ResponseDocument:
-    """ Returns the results of the document as the outputmodel (document). """
-    return finished_tasks_database[document_id].data.to_output_model()
+def resolve_alias(document_id: str) -> str:
+    """ Returns the document id of the task that processes the document. """
+    return document_aliases.get(document_id, document_id)
 
 
-def get_results_images(document_id: str) -> ResponseDocument:
-    """ Returns the images of a result of the document as the outputmodel (document). """
-    return finished_tasks_database[document_id].data.to_image_model()
+def get_task(document_id: str):
+    """ Returns the finished task of the document (or of the identical document it is an alias of). """
+    return finished_tasks_database[resolve_alias(document_id)]
 
 
-def get_results_metadata(document_id: str) -> ResponseDocument:
-    """ Returns the metadata of a result of the document as the outputmodel (document). """
-    return finished_tasks_database[document_id].data.to_metadata_model()
+def get_results(document_id: str) -> ResponseDocument:
+    """ Returns the results of the document as the outputmodel (document). """
+    return get_task(document_id).data.to_output_model()
+
+
+def get_encoded_results(document_id: str, format: str = 'full') -> bytes:
+    """ Returns the results of the document as json of the outputmodel (document) in the given format.
+    The json is created on the first call and then cached. """
+    encoded_results = encoded_results_database.setdefault(document_id, {})
+    CACHE_LOOKUPS.inc(cache='encoded_results', result='hit' if format in encoded_results else 'miss')
+    if format not in encoded_results:
+        document = get_task(document_id).data
+        if format == 'compact':
+            encoded_results[format] = CompactEncoder().encode(document, document_id)
+        else:
+            encoded_results[format] = document.to_output_json(document_id)
+    return encoded_results[format]
+
+
+def get_result_size(document_id: str) -> int:
+    """ Returns the estimated bytes retained by the finished task of the document and its index. The estimate walks
+    the objects of the result, it is done once per result when it is asked for (the task status and /admin/results)
+    or, with MEMORY_ACCOUNTING, by the RESULT_SIZE_EXECUTOR after the result is stored (see estimate_result_size). """
+    size = result_sizes_database.get(document_id)
+    if size is None:
+        task = finished_tasks_database[document_id]
+        size = get_retained_size((task, get_result_index(document_id)), [get_current_resources()])
+        with SUBMISSION_LOCK:
+            # The size of a result replaced in the meantime is not kept
+            if finished_tasks_database.get(document_id) is task:
+                result_sizes_database[document_id] = size
+        RESULT_RETAINED_BYTES.observe(size)
+    return size
+
+
+def estimate_result_size(document_id: str, task) -> None:
+    """ Estimates the size of the stored result of the document in the background, unless it was replaced. """
+    if finished_tasks_database.get(document_id) is task:
+        get_result_size(document_id)
+
+
+def get_response_format(request: Request, format: str = None) -> str:
+    """ Negotiates the format of the response by the query parameter or else by the Accept header. """
+    if format is not None:
+        if format not in RESPONSE_FORMATS:
+            raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Unknown format '{format}'")
+        return format
+    if COMPACT_MEDIA_TYPE in request.headers.get('accept', ''):
+        return 'compact'
+    return 'full'
+
+
+def stream_results(document_id: str) -> Iterator[bytes]:
+    """ Yields the results of the document as newline delimited json. The records are encoded lazily and send
+    in chunks of about STREAM_CHUNK_SIZE bytes. """
+    chunk = bytearray()
+    for record in get_task(document_id).data.iter_output_records(document_id):
+        chunk += orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk = bytearray()
+    if chunk:
+        yield bytes(chunk)
+
+
+def get_result_index(document_id: str) -> ResultIndex:
+    """ Returns the indexes of the results of the document, they are built when the task is finished. """
+    document_id = resolve_alias(document_id)
+    if document_id not in result_indexes_database:
+        result_indexes_database[document_id] = ResultIndex(finished_tasks_database[document_id].data)
+    return result_indexes_database[document_id]
+
+
+def get_page(document_id: str, positions: Sequence[int], to_output_dict: Callable[[int], Dict], cursor: int,
+             limit: int) -> Response:
+    """ Returns one page of the items at the given positions as json. Only the items of the page are encoded. """
+    next_cursor = cursor + limit if cursor + limit < len(positions) else None
+    return Response(content=orjson.dumps({
+        'document_id': document_id,
+        'total': len(positions),
+        'next_cursor': next_cursor,
+        'items': [to_output_dict(_) for _ in positions[cursor:cursor + limit]]
+    }), media_type='application/json')
 
 
-def get_results_text(document_id: str) -> ResponseDocument:
-    """ Returns the text of a result of the document as the outputmodel (document). """
-    return finished_tasks_database[document_id].data.to_text_model()
+@router.get('/annotation/get_logs/', response_model=ResponseDocument, status_code=HTTP_200_OK)
+def get_task_extraction(document_id: str, request: Request, format: str = None):
+    """ An API to get the extraction of the task.
+    The compact format is returned for ?format=compact or the Accept header
+    application/vnd.annotation.compact+json. """
+    state: str = get_state(document_id)
+    if state == 'finished':
+        format = get_response_format(request, format)
+        media_type = COMPACT_MEDIA_TYPE if format == 'compact' else 'application/json'
+        # The cached json is send directly, without a validation against the response model
+        return Response(content=get_encoded_results(document_id, format), media_type=media_type)
+    else:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
+                            detail="Document not ready or not found")
 
+@router.get('/annotation/get_task_results/', response_model=ResponseDocument, status_code=HTTP_200_OK)
+def get_task_extraction(document_id: str, request: Request, format: str = None):
+    """ An API to get the extraction of the task.
+    The compact format is returned for ?format=compact or the Accept header
+    application/vnd.annotation.compact+json. """
+    state: str = get_state(document_id)
+    if state == 'finished':
+        format = get_response_format(request, format)
+        media_type = COMPACT_MEDIA_TYPE if format == 'compact' else 'application/json'
+        # The cached json is send directly, without a validation against the response model
+        return Response(content=get_encoded_results(document_id, format), media_type=media_type)
+    else:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
+                            detail="Document not ready or not found")
 
-def get_results_tables(document_id: str) -> ResponseDocument:
-    """ Returns the tables of a result of the document as the outputmodel (document). """
-    return finished_tasks_database[document_id].data.to_table_model()
 
-@router.get('/annotation/get_logs/', response_model=ResponseDocument, status_code=HTTP_200_OK)
-def get_task_extraction(document_id: str):
-    """ An API to get the extraction of the task. """
+@router.get('/annotation/stream_task_results/', status_code=HTTP_200_OK)
+def stream_task_extraction(document_id: str):
+    """ An API to stream the extraction of the task as newline delimited json.
+    Every line is one record with a type: document, sentence, table, annotation or knowledgeObject. """
     state: str = get_state(document_id)
     if state == 'finished':
-        res: ResponseDocument = get_results(document_id)
-        return res
+        return StreamingResponse(stream_results(document_id), media_type='application/x-ndjson')
     else:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND,
                             detail="Document not ready or not found")
 
-@router.get('/annotation/get_task_results/', response_model=ResponseDocument, status_code=HTTP_200_OK)
-def get_task_extraction(document_id: str):
-    """ An API to get the extraction of the task. """
+
+@router.get('/annotation/get_knowledgeObjects/', response_model=KnowledgeObjectPage, status_code=HTTP_200_OK)
+def get_knowledgeObjects(document_id: str,
+                         category: str = None,
+                         specificCategory: str = None,
+                         label_prefix: str = None,
+                         cursor: int = Query(0, ge=0),
+                         limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """ An API to get the knowledge objects of the task, filtered by the category, the specific category or the
+    prefix of a label (case insensitive). The results are paginated, the next page starts at next_cursor. """
     state: str = get_state(document_id)
     if state == 'finished':
-        res: ResponseDocument = get_results(document_id)
-        return res
+        index = get_result_index(document_id)
+        positions = index.find_knowledgeObjects(category, specificCategory, label_prefix)
+        return get_page(document_id, positions, lambda _: index.knowledgeObjects[_].to_output_dict(), cursor, limit)
     else:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND,
                             detail="Document not ready or not found")
 
 
-@router.get('/annotation/get_knowledgeObjects/', response_model=ResponseDocument, status_code=HTTP_200_OK)
-def get_task_extraction(document_id: str):
-    """ An API to get the extraction of the task. """
+@router.get('/annotation/get_annotations/', response_model=AnnotationPage, status_code=HTTP_200_OK)
+def get_annotations(document_id: str,
+                    category: str = None,
+                    specificCategory: str = None,
+                    cursor: int = Query(0, ge=0),
+                    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """ An API to get the annotations of the task, filtered by the category or the specific category.
+    The results are paginated, the next page starts at next_cursor. """
     state: str = get_state(document_id)
     if state == 'finished':
-        res: ResponseDocument = get_results_images(document_id)
-        return res
+        index = get_result_index(document_id)
+        positions = index.find_annotations(category, specificCategory)
+        return get_page(document_id, positions, lambda _: index.annotations[_].to_output_dict(), cursor, limit)
     else:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND,
                             detail="Document not ready or not found")
 
 
-@router.get('/annotation/get_annotations/', response_model=ResponseDocument, status_code=HTTP_200_OK)
-def get_task_extraction(document_id: str):
-    """ An API to get the extraction of the task. """
+@router.get('/annotation/get_sentences/', response_model=SentencePage, status_code=HTTP_200_OK)
+def get_sentences(document_id: str,
+                  section: str = Query('chapters', regex='^(abstract|chapters)$'),
+                  chapter: int = Query(None, ge=0),
+                  paragraph_from: int = Query(None, ge=0),
+                  paragraph_to: int = Query(None, ge=0),
+                  cursor: int = Query(0, ge=0),
+                  limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """ An API to get the sentences of the task, optionally of a single chapter and of a range of paragraphs
+    (paragraph_from and paragraph_to are included). The results are paginated, the next page starts at
+    next_cursor. """
     state: str = get_state(document_id)
     if state == 'finished':
-        res: ResponseDocument = get_results_metadata(document_id)
-        return res
+        index = get_result_index(document_id)
+        positions = index.find_sentences(section, chapter, paragraph_from, paragraph_to)
+        return get_page(document_id, positions, index.sentence_to_output_dict, cursor, limit)
     else:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND,
                             detail="Document not ready or not found")
@@ -103,19 +304,319 @@ def has_extraction(document_id: str, response: Response):
     return {}
 
 
-@router.post('/annotation/extract_annotations', response_model=TaskStatus, status_code=HTTP_201_CREATED)
-def extract_annotations(request: Request,
-                        background_tasks: BackgroundTasks,
-                        document: Document
-                        ):
-    """ An API that extracts Information from a single PDF-Document. """
-
-    _job = dict(
+@router.get('/annotation/wait_for_results/')
+async def wait_for_extraction(document_id: str,
+                              timeout: float = Query(LONG_POLL_TIMEOUT, ge=0, le=MAX_LONG_POLL_TIMEOUT)):
+    """ A long-poll variant of has_results. The request is answered as soon as the results of the document are
+    ready (201) or when the timeout (in seconds) expired (204). """
+    document_id = resolve_alias(document_id)
+    # The waiter is registered before the state is checked, a task finishing in between is not missed
+    future = COMPLETION_EVENTS.register(document_id)
+    try:
+        if get_state(document_id) != 'finished':
+            # The waiters are also woken up by an aborted task
+            await COMPLETION_EVENTS.wait(future, timeout)
+    finally:
+        COMPLETION_EVENTS.unregister(document_id, future)
+    finished = get_state(document_id) == 'finished'
+    # A response without content, a 204 must not have a body
+    return Response(status_code=HTTP_201_CREATED if finished else HTTP_204_NO_CONTENT)
+
+
+@router.post('/annotation/extract_annotations', response_model=TaskStatus, status_code=HTTP_201_CREATED,
+             openapi_extra={'requestBody': {'content': {'application/json': {'schema': get_inline_schema(Document)}},
+                                            'required': True}})
+async def extract_annotations(request: Request,
+                              background_tasks: BackgroundTasks,
+                              profile: str = None,
+                              ner_backend: str = None,
+                              strict: bool = STRICT_VALIDATION,
+                              incremental: bool = None,
+                              callback_url: str = None,
+                              deadline: float = Query(None, ge=0),
+                              priority: int = Query(0, ge=-10, le=10),
+                              profiling: bool = False,
+                              x_admin_token: str = Header(None)
+                              ):
+    """ An API that extracts Information from a single PDF-Document.
+    The body is a Document. It is parsed once and handed over to the pipeline, the complete document is only
+    validated in the strict mode.
+    The optional pipeline profile, backend and incremental mode overwrite the ones given in the document.
+    A document with the same content as a submitted one (only the id differs) reuses its task.
+    The optional callback url is called with a POST (json: status, document_id) when the results are ready, it must
+    not point to the internal network (see check_callback_url).
+    The optional deadline (in seconds, 0 for none) aborts the processing of the document when it is exceeded.
+    The document is queued by its estimated size, small documents are processed before large ones. The optional
+    priority (-10 to 10) moves the document forward (or back) in its queue.
+    With profiling (only with the header X-Admin-Token) the task runs under the profiler and is never deduplicated,
+    the profile is returned by /admin/profile. """
+    if profiling and not is_admin(x_admin_token):
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="The profiling needs a valid X-Admin-Token")
+
+    # The parsing, the content hash, the check of the callback url and the submission of a large document take a
+    # while, they do not block the event loop
+    overrides = {'profile': profile, 'ner_backend': ner_backend, 'incremental': incremental}
+    return await run_in_threadpool(submit_document, request, background_tasks, await request.body(), overrides,
+                                   strict, callback_url, deadline, priority, profiling)
+
+
+def submit_document(request: Request, background_tasks: BackgroundTasks, body: bytes, overrides: Dict, strict: bool,
+                    callback_url: str, deadline: float, priority: int, profiling: bool) -> Dict:
+    """ Parses the body of extract_annotations and submits the document (see there). The overrides (profile, backend
+    and incremental mode) that are not None overwrite the ones given in the document. """
+    try:
+        json_document = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if not isinstance(json_document, dict):
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail="The document has to be an object")
+    json_document.update({key: value for key, value in overrides.items() if value is not None})
+    if callback_url is not None:
+        try:
+            check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    try:
+        document = Document.from_json(json_document, strict)
+    except ValidationError as e:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors())
+    except ValueError as e:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    content_hash = get_content_hash(json_document) if DEDUPLICATION and not profiling else None
+    cost = estimate_cost(json_document)
+
+    # Submissions run in parallel threads, the lookup of the content hash and the registration are done at once
+    with SUBMISSION_LOCK:
+        # A new version of a document in-flight would replace the context of its task, only the same content can be
+        # submitted again (it reuses the task)
+        context = PROCESSING_CONTEXTS.get(document.id)
+        if context is not None and context.in_flight and (context.cancelled or content_hash is None or
+                                                          document_content_hashes.get(document.id) != content_hash):
+            raise HTTPException(status_code=HTTP_409_CONFLICT,
+                                detail="The document is in-flight, it can be submitted again when its task has ended")
+
+        if callback_url is not None:
+            callback_urls_database.setdefault(document.id, []).append(callback_url)
+
+        if content_hash is not None and deduplicate(document.id, content_hash):
+            # An identical document is in-flight or finished, its task is reused
+            finished = get_state(document.id) == 'finished'
+            if finished:
+                background_tasks.add_task(send_callbacks, pop_callbacks([document.id]))
+            return dict(
+                status='finished' if finished else 'pending',
+                document_id=document.id
+            )
+
+        if content_hash is None:
+            # The new task replaces the results of the document, not the ones of its aliases
+            hand_over_aliases(document.id)
+        context = PROCESSING_CONTEXTS[document.id] = ProcessingContext(document.id, deadline)
+        context.profiling = profiling
+        SCHEDULER.submit(document.id, cost, bg_annotate, request, document, priority=priority)
+    return dict(
         status='pending',
         document_id=document.id
     )
-    background_tasks.add_task(bg_annotate, request, document)
-    return _job
+
+
+@router.get('/annotation/get_task_status/', response_model=TaskStatus, status_code=HTTP_200_OK)
+def get_task_status(document_id: str, timings: bool = False, memory: bool = False):
+    """ An API to get the status of the task with the current stage and its progress.
+    For a cancelled, timed out or failed task the stage it was aborted in is returned.
+    With timings=true the timings of the phases of the pipeline so far are returned as well.
+    With memory=true the estimated size of the stored result and the peak memory per strategy (only with
+    MEMORY_ACCOUNTING=1) are returned. """
+    context = PROCESSING_CONTEXTS.get(resolve_alias(document_id))
+    if context is None:
+        if get_state(document_id) != 'finished':
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Document not found")
+        status = dict(status='finished', document_id=document_id)
+    else:
+        status = {**context.to_status(), 'document_id': document_id}
+    if timings and context is not None:
+        status['timings'] = context.get_timings()
+    if memory:
+        finished = resolve_alias(document_id) in finished_tasks_database
+        status['memory'] = {'retained_bytes': get_result_size(resolve_alias(document_id)) if finished else None,
+                            'peaks': context.get_memory_peaks() if context is not None else {}}
+    return status
+
+
+@router.post('/annotation/cancel_task/', response_model=TaskStatus, status_code=HTTP_200_OK)
+def cancel_task(document_id: str):
+    """ An API to cancel a pending or working task. A working task stops at its next checkpoint.
+    A deduplicated document is only detached from the task of the identical document, which goes on. """
+    with SUBMISSION_LOCK:
+        # The task of a resubmitted document can be cancelled while the results of the previous one are stored
+        context = PROCESSING_CONTEXTS.get(document_id)
+        if document_id not in document_aliases and context is not None and context.in_flight:
+            context.cancel()
+            return context.to_status()
+
+        if get_state(document_id) == 'finished':
+            raise HTTPException(status_code=HTTP_409_CONFLICT, detail="The task is already finished")
+
+        if document_id in document_aliases:
+            document_aliases.pop(document_id)
+            document_content_hashes.pop(document_id, None)
+            callback_urls_database.pop(document_id, None)
+            context = PROCESSING_CONTEXTS[document_id] = ProcessingContext(document_id)
+            context.cancel()
+            # There is no task of the alias itself that could be aborted
+            context.finish('cancelled')
+            return context.to_status()
+
+        if context is None:
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Document not found")
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=f"The task is already {context.status}")
+
+
+@router.get('/admin/results', dependencies=[Depends(require_admin)])
+def get_largest_results(limit: int = Query(20, ge=1, le=1000)):
+    """ An API to list the stored results with the largest estimated retained size (the task and its index) and the
+    bytes of their encoded responses. """
+    sizes = {_: get_result_size(_) for _ in list(finished_tasks_database)}
+    largest = sorted(sizes.items(), key=lambda _: _[1], reverse=True)[:limit]
+    results = [{
+        'document_id': document_id,
+        'retained_bytes': size,
+        'encoded_bytes': sum([len(_) for _ in list(encoded_results_database.get(document_id, {}).values())]),
+        'aliases': len(get_aliases(document_id))
+    } for document_id, size in largest]
+    return Response(content=orjson.dumps(results), media_type='application/json')
+
+
+def deduplicate(document_id: str, content_hash: str) -> bool:
+    """ Looks up the content hash of the document. If the same content was submitted before (in-flight or finished),
+    the document id becomes an alias of the first document with this content and True is returned.
+    Otherwise the document is registered with its content hash and has to be processed.
+    It has to be called with the SUBMISSION_LOCK held. """
+    if document_content_hashes.get(document_id) != content_hash:
+        # The document was changed, the results of its previous content will be replaced
+        hand_over_aliases(document_id)
+    document_content_hashes[document_id] = content_hash
+    document_aliases.pop(document_id, None)
+    encoded_results_database.pop(document_id, None)
+
+    first_document_id = content_hashes_database.get(content_hash)
+    if first_document_id is None:
+        content_hashes_database[content_hash] = document_id
+        DEDUPLICATED_DOCUMENTS.inc(result='miss')
+        return False
+    if first_document_id != document_id:
+        document_aliases[document_id] = first_document_id
+    # Otherwise the same document was submitted again
+    DEDUPLICATED_DOCUMENTS.inc(result='hit')
+    return True
+
+
+def hand_over_aliases(document_id: str) -> None:
+    """ Hands the previous task of the document over to its first alias before the document gets a new task, so its
+    aliases keep the results of the previous content. The alias becomes the owner of the finished task (or the ended
+    context) and of the previous content hash, the other aliases point to it.
+    It has to be called with the SUBMISSION_LOCK held. """
+    aliases = get_aliases(document_id)
+    previous_hash = document_content_hashes.get(document_id)
+    owns_previous_hash = previous_hash is not None and content_hashes_database.get(previous_hash) == document_id
+    if not aliases:
+        if owns_previous_hash:
+            content_hashes_database.pop(previous_hash)
+        return
+
+    owner = aliases[0]
+    document_aliases.pop(owner)
+    for alias in aliases[1:]:
+        document_aliases[alias] = owner
+    if owns_previous_hash:
+        content_hashes_database[previous_hash] = owner
+    for database in [finished_tasks_database, result_indexes_database, result_sizes_database, PROCESSING_CONTEXTS]:
+        if document_id in database:
+            database[owner] = database[document_id]
+
+
+def get_aliases(document_id: str) -> List[str]:
+    """ Returns the deduplicated document ids that reuse the task of the document. """
+    return [_ for _, aliased_id in document_aliases.items() if aliased_id == document_id]
+
+
+def store_results(document_id: str, task) -> None:
+    """ Stores the finished task of the document and drops the results cached for the previous task. """
+    result_index = ResultIndex(task.data)
+    with SUBMISSION_LOCK:
+        result_indexes_database[document_id] = result_index
+        finished_tasks_database.update({
+            document_id: task
+        })
+        result_sizes_database.pop(document_id, None)
+        encoded_results_database.pop(document_id, None)
+        aliases = get_aliases(document_id)
+        for alias in aliases:
+            encoded_results_database.pop(alias, None)
+        if document_id in PROCESSING_CONTEXTS:
+            PROCESSING_CONTEXTS[document_id].finish('finished')
+        # A callback registered by a new submission after the finish belongs to its task
+        callbacks = pop_callbacks([document_id] + aliases)
+
+    COMPLETION_EVENTS.notify(document_id)
+    send_callbacks(callbacks)
+    # The walk holds the GIL for a large part of the time of a small document, it is only done eagerly when the memory
+    # is accounted anyway
+    if MEMORY_ACCOUNTING:
+        RESULT_SIZE_EXECUTOR.submit(estimate_result_size, document_id, task)
+
+
+def abort_task(document_id: str, status: str, detail: str) -> None:
+    """ Records the aborted (cancelled, timed out or failed) task of the document. """
+    with SUBMISSION_LOCK:
+        context = PROCESSING_CONTEXTS.setdefault(document_id, ProcessingContext(document_id))
+        context.finish(status, detail)
+
+        # The same content has to be processed again when it is submitted the next time
+        content_hash = document_content_hashes.get(document_id)
+        if content_hash is not None and content_hashes_database.get(content_hash) == document_id:
+            content_hashes_database.pop(content_hash)
+        callbacks = pop_callbacks([document_id] + get_aliases(document_id))
+    logger.warning("Task of document %s aborted (%s) in stage %s: %s", document_id, status, context.stage, detail)
+
+    COMPLETION_EVENTS.notify(document_id)
+    send_callbacks(callbacks, status)
+
+
+def run_task(document_id: str, task) -> None:
+    """ Performs the task and stores its results. A cancelled task is not started, an aborted or failed task is
+    recorded in the ProcessingContext of the document. """
+    context = PROCESSING_CONTEXTS.get(document_id)
+    if context is not None and context.cancelled:
+        abort_task(document_id, 'cancelled', "The task was cancelled before it was started")
+        return
+    try:
+        if context is not None and context.profiling:
+            with profile_task(document_id):
+                taskBuilderAPI.perform_task(task)
+        else:
+            taskBuilderAPI.perform_task(task)
+    except TaskCancelled as e:
+        abort_task(document_id, e.status, str(e))
+        return
+    except Exception as e:
+        abort_task(document_id, 'failed', repr(e))
+        raise
+    store_results(document_id, task)
+
+
+def pop_callbacks(document_ids: List[str]) -> Dict[str, List[str]]:
+    """ Removes the callback urls registered for the documents and returns them per document id, every callback url
+    is called once. """
+    return {_: callback_urls_database.pop(_, []) for _ in document_ids}
+
+
+def send_callbacks(callbacks: Dict[str, List[str]], status: str = 'finished') -> None:
+    """ Calls the callback urls per document id (see pop_callbacks) in the threads of the callbacks. """
+    for document_id, urls in callbacks.items():
+        for url in urls:
+            submit_callback(url, document_id, status)
 
 
 def bg_annotate(request, document: Document):
@@ -123,20 +624,14 @@ def bg_annotate(request, document: Document):
                                     client=request.client.host,
                                     document=document)
 
-    taskBuilderAPI.perform_task(task)
-    finished_tasks_database.update({
-        document.id: task
-    })
+    run_task(document.id, task)
 
 async def asy_bg_annotate(request, document: Document):
     task = await taskBuilderAPI.asy_create_task(task='annotate',
                                                 client=request.client.host,
                                                 document=document)
 
-    taskBuilderAPI.perform_task(task)
-    finished_tasks_database.update({
-        document.id: task
-    })
+    run_task(document.id, task)
 
 
 def bg_transform_pdf_to_data(request, document_id, file):
@@ -145,7 +640,4 @@ def bg_transform_pdf_to_data(request, document_id, file):
                                       document_id=document_id,
                                       file=file)
 
-    taskBuilderAPI.perform_task(task)
-    finished_tasks_database.update({
-        document_id: task
-    })
+    run_task(document_id, task)
@@ -0,0 +1,21 @@
+import orjson
+from fastapi import APIRouter, Response
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+
+from app.core.task_api.preload import READINESS
+
+router = APIRouter()
+
+
+@router.get('/health')
+def get_health():
+    """ The liveness of the service, it answers as soon as the app is started. """
+    return Response(content=orjson.dumps({'status': 'ok'}), media_type='application/json')
+
+
+@router.get('/ready')
+def get_ready():
+    """ The readiness of the service: 200 once the models are loaded and warmed up, 503 before (or if the warm-up
+    failed). """
+    status_code = HTTP_200_OK if READINESS.ready else HTTP_503_SERVICE_UNAVAILABLE
+    return Response(content=orjson.dumps(READINESS.to_dict()), media_type='application/json', status_code=status_code)
@@ -0,0 +1,52 @@
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.routing import Match
+
+from app.core.metrics import REGISTRY, REQUEST_LATENCY
+
+router = APIRouter()
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+def get_metrics():
+    """ An API to scrape the metrics of the service in the text format of Prometheus. """
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+def get_route(scope) -> str:
+    """ Returns the template of the path of the route of the request, so the paths of unknown routes do not become
+    labels of the metrics. """
+    for route in scope['app'].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+class RequestLatencyMiddleware:
+    """ Observes the latency of every request per route until its response is sent completely, streamed responses
+    included (see REQUEST_LATENCY). A plain ASGI middleware, it adds no task per request. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.monotonic()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.observe(time.monotonic() - start, route=get_route(scope), method=scope['method'],
+                                    status=status)
@@ -0,0 +1,39 @@
+""" The fixtures shared by the tests of the pipeline and the router. """
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.benchmarks.end_to_end import process_document
+from app.routers import annotation
+from app.tests.utils import gazetteer_document
+
+
+@pytest.fixture(scope='module')
+def processed():
+    """ The default generated document annotated serially with the gazetteer backend. """
+    return process_document(gazetteer_document())
+
+
+@pytest.fixture()
+def client():
+    app = FastAPI()
+    app.include_router(annotation.router)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture()
+def held_tasks(monkeypatch):
+    """ Holds the tasks submitted by the router until the returned event is set. """
+    release = threading.Event()
+    bg_annotate = annotation.bg_annotate
+
+    def held_bg_annotate(request, document):
+        release.wait(60)
+        bg_annotate(request, document)
+
+    monkeypatch.setattr(annotation, 'bg_annotate', held_bg_annotate)
+    yield release
+    release.set()
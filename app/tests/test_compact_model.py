@@ -0,0 +1,69 @@
+""" Tests of the compact response format (CompactEncoder): it expands to the full output format. """
+from typing import Dict
+
+import orjson
+
+from app.core.annotation_modul.datamodels.compact_model import CompactEncoder
+
+
+def decode_compact(compact: Dict) -> Dict:
+    """ Expands a document in the compact format (see CompactEncoder) to the full output format. """
+    strings = compact['strings']
+    columns = compact['words']
+
+    def word(index: int) -> Dict:
+        return {
+            'id': columns['id'][index],
+            'prev_word_id': columns['prev_word_id'][index],
+            'text': strings[columns['text'][index]],
+            'normalized_text': strings[columns['normalized_text'][index]],
+            'enriched_text': strings[columns['enriched_text'][index]],
+            'annotation_id': columns['annotation_id'][index],
+            'start_pos': columns['start_pos'][index],
+            'end_pos': columns['end_pos'][index]
+        }
+
+    def chapter(compact_chapter: Dict) -> Dict:
+        return {'paragraphs': [{'sentences': [{'text': '', 'words': [word(_) for _ in range(start, end)]}
+                                              for start, end in paragraph['sentences']]}
+                               for paragraph in compact_chapter['paragraphs']]}
+
+    def table(compact_table: Dict) -> Dict:
+        cells = [{'text': strings[_['text']], 'category': '', 'type': '', 'annotation_ids': _['annotation_ids']}
+                 for _ in compact_table['cells']]
+
+        def line(compact_line: Dict) -> Dict:
+            return {'cells': [cells[_] for _ in compact_line['cells']], 'type': compact_line['type']}
+
+        return {
+            'rows': [line(_) for _ in compact_table['rows']],
+            'columns': [line(_) for _ in compact_table['columns']],
+            'table_header': line(compact_table['table_header']),
+            'units': [strings[_] for _ in compact_table['units']]
+        }
+
+    annotations = compact['annotations']
+    knowledgeObjects = compact['knowledgeObjects']
+    abstract = compact['text']['abstract']
+    return {
+        'document_id': compact['document_id'],
+        'text': {'chapters': [chapter(_) for _ in compact['text']['chapters']],
+                 'abstract': chapter(abstract) if abstract is not None else None},
+        'tables': [table(_) for _ in compact['tables']],
+        'annotations': [{'id': id, 'words': [word(_) for _ in words], 'category': strings[category]}
+                        for id, category, words in zip(annotations['id'], annotations['category'],
+                                                       annotations['words'])],
+        'knowledgeObjects': [{'id': id, 'category': strings[category], 'labels': [strings[_] for _ in labels],
+                              'annotation_ids': annotation_ids}
+                             for id, category, labels, annotation_ids in
+                             zip(knowledgeObjects['id'], knowledgeObjects['category'], knowledgeObjects['labels'],
+                                 knowledgeObjects['annotation_ids'])],
+        'profile': compact['profile']
+    }
+
+
+def test_compact_format_round_trips(processed):
+    compact = orjson.loads(CompactEncoder().encode(processed))
+    assert compact['format'] == 'compact'
+    assert decode_compact(compact) == orjson.loads(processed.to_output_json())
+
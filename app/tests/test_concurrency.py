@@ -0,0 +1,14 @@
+""" Tests of the reentrant pipeline: documents annotated at the same time get the ids of a serial run. """
+from concurrent.futures import ThreadPoolExecutor
+
+from app.benchmarks.end_to_end import process_document
+from app.tests.utils import gazetteer_document
+
+
+def test_ids_are_stable_under_concurrency():
+    documents = [gazetteer_document(f'concurrent-{_}', seed=_ % 2) for _ in range(6)]
+    serial = [process_document(_).to_output_json() for _ in documents]
+    with ThreadPoolExecutor(max_workers=len(documents)) as executor:
+        concurrent = list(executor.map(lambda _: process_document(_).to_output_json(), documents))
+    assert concurrent == serial
+
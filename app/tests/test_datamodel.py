@@ -0,0 +1,47 @@
+""" Tests of the parsing of the request body (Document.from_json). """
+import pytest
+
+from app.core.schemas.datamodel import Document
+
+
+def create_json_document(**fields):
+    return {'id': 'test', 'text': {'chapters': []}, 'metadata': {}, 'tables': [], **fields}
+
+
+def test_valid_document_is_created():
+    document = Document.from_json(create_json_document())
+    assert document.id == 'test'
+    assert document.text == {'chapters': []}
+
+
+@pytest.mark.parametrize('fields', [
+    {'text': []},
+    {'text': {}},
+    {'text': {'chapters': {}}},
+    {'metadata': None},
+    {'metadata': []},
+    {'tables': {}},
+    {'tables': [1]},
+    {'id': 5},
+    {'id': None},
+    {'id': ['a']},
+    {'id': {'x': 1}},
+    {'text': {'chapters': [1]}},
+    {'text': {'chapters': [{'paragraphs': {}}]}},
+    {'text': {'chapters': [{'paragraphs': [1]}]}},
+    {'text': {'chapters': [{'paragraphs': [{'sentences': [1]}]}]}},
+    {'text': {'chapters': [{'paragraphs': [{'sentences': [{'text': 1}]}]}]}},
+    {'metadata': {'abstract': [1]}},
+    {'profile': 'unknown'},
+    {'ner_backend': 'unknown'}
+])
+def test_invalid_document_raises_value_error(fields):
+    with pytest.raises(ValueError):
+        Document.from_json(create_json_document(**fields))
+
+
+def test_missing_fields_raise_value_error():
+    json_document = create_json_document()
+    del json_document['metadata']
+    with pytest.raises(ValueError):
+        Document.from_json(json_document)
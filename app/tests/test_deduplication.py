@@ -0,0 +1,82 @@
+""" Tests of the deduplication of the submitted documents by the router: an identical document reuses the task of the
+first one as its alias. """
+import orjson
+
+from app.benchmarks.end_to_end import process_document
+from app.routers import annotation
+from app.tests.utils import gazetteer_document, submit, wait_for, get_results
+
+
+def test_identical_document_is_deduplicated(client):
+    document = gazetteer_document('dedup-a', seed=3)
+    submit(client, document)
+    submit(client, dict(document, id='dedup-b'))
+    wait_for(client, ['dedup-a', 'dedup-b'])
+
+    assert annotation.resolve_alias('dedup-b') == 'dedup-a'
+    assert annotation.get_aliases('dedup-a') == ['dedup-b']
+    assert 'dedup-b' not in annotation.finished_tasks_database
+    results = get_results(client, 'dedup-b')
+    assert results['document_id'] == 'dedup-b'
+    assert dict(results, document_id='dedup-a') == get_results(client, 'dedup-a')
+
+
+def test_changed_alias_is_processed_on_its_own(client):
+    document = gazetteer_document('alias-a', seed=4)
+    submit(client, document)
+    submit(client, dict(document, id='alias-b'))
+    wait_for(client, ['alias-a', 'alias-b'])
+
+    assert submit(client, gazetteer_document('alias-b', seed=5))['status'] == 'pending'
+    wait_for(client, ['alias-b'])
+    assert annotation.resolve_alias('alias-b') == 'alias-b'
+    assert get_results(client, 'alias-b') != dict(get_results(client, 'alias-a'), document_id='alias-b')
+
+
+def test_changed_document_hands_its_task_over_to_its_aliases(client, held_tasks):
+    document = gazetteer_document('primary', seed=9)
+    submit(client, document)
+    submit(client, dict(document, id='alias-1'))
+    submit(client, dict(document, id='alias-2'))
+    held_tasks.set()
+    wait_for(client, ['primary'])
+    previous_results = get_results(client, 'primary')
+    held_tasks.clear()
+
+    submit(client, gazetteer_document('primary', seed=10))
+    assert annotation.resolve_alias('alias-1') == 'alias-1'
+    assert annotation.resolve_alias('alias-2') == 'alias-1'
+    assert annotation.get_aliases('primary') == []
+    assert annotation.resolve_alias(submit(client, dict(document, id='alias-3'))['document_id']) == 'alias-1'
+
+    # The cancellation and the results of the new task do not reach the previous aliases
+    assert client.post('/annotation/cancel_task/', params={'document_id': 'primary'}).status_code == 200
+    held_tasks.set()
+    wait_for(client, ['primary'])
+    assert client.get('/annotation/get_task_status/', params={'document_id': 'primary'}).json()['status'] == \
+        'cancelled'
+    submit(client, gazetteer_document('primary', seed=10))
+    wait_for(client, ['primary'])
+    for alias in ['alias-1', 'alias-2', 'alias-3']:
+        assert client.get('/annotation/get_task_status/', params={'document_id': alias}).json()['status'] == \
+            'finished'
+        assert get_results(client, alias) == dict(previous_results, document_id=alias)
+    assert get_results(client, 'primary') != previous_results
+
+
+def test_cancelled_alias_does_not_cancel_its_task(client, held_tasks):
+    document = gazetteer_document('cancel-a', seed=6)
+    submit(client, document)
+    assert annotation.resolve_alias(submit(client, dict(document, id='cancel-b'))['document_id']) == 'cancel-a'
+    cancelled = client.post('/annotation/cancel_task/', params={'document_id': 'cancel-b'})
+    assert cancelled.status_code == 200, cancelled.text
+    assert cancelled.json()['status'] == 'cancelled'
+    assert 'cancel-b' not in annotation.document_aliases
+
+    held_tasks.set()
+    wait_for(client, ['cancel-a'])
+    assert client.get('/annotation/get_task_status/', params={'document_id': 'cancel-a'}).json()['status'] == \
+        'finished'
+    assert get_results(client, 'cancel-a') == orjson.loads(process_document(document).to_output_json())
+    assert client.get('/annotation/get_task_status/', params={'document_id': 'cancel-b'}).json()['status'] == \
+        'cancelled'
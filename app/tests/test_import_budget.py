@@ -0,0 +1,12 @@
+""" Tests of the import time of the modules of the service (see import_budget.py). """
+import pytest
+
+from app.core.config import IMPORT_BUDGETS
+from app.core.import_budget import measure_import
+
+
+@pytest.mark.parametrize('module,budget', list(IMPORT_BUDGETS.items()))
+def test_import_is_within_its_budget(module, budget):
+    seconds, imports, heavy_modules = measure_import(module)
+    assert heavy_modules == [], f"{module} imports {', '.join(heavy_modules)}"
+    assert seconds <= budget, f"{module} takes {seconds:.3f} s, the slowest imports: {imports}"
@@ -0,0 +1,24 @@
+""" Tests of the incremental annotation: a resubmitted document reuses the cached annotations of its unchanged
+sentences and has the output of a full run. """
+import orjson
+
+from app.benchmarks.end_to_end import process_document
+from app.core.annotation_modul.apis.annotation_cache import ANNOTATION_CACHES
+from app.tests.utils import gazetteer_document
+
+
+def test_incremental_run_equals_full_run():
+    document = gazetteer_document('incremental', incremental=True)
+    changed = orjson.loads(orjson.dumps(document))
+    changed['text']['chapters'][0]['paragraphs'][0]['sentences'][0]['text'] = \
+        'The Temperature was set to 120.5 °C for all samples.'
+    try:
+        process_document(document, keep_cache=True)
+        unchanged = process_document(document, keep_cache=True)
+        assert unchanged.to_output_json() == process_document(dict(document, incremental=False)).to_output_json()
+
+        resubmitted = process_document(changed, keep_cache=True)
+        assert resubmitted.to_output_json() == process_document(dict(changed, incremental=False)).to_output_json()
+    finally:
+        ANNOTATION_CACHES.pop('incremental', None)
+
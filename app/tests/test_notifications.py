@@ -0,0 +1,58 @@
+""" Tests of the callbacks: the check of the callback urls and the sending in the threads of the callbacks. """
+import threading
+
+import pytest
+
+from app.core.task_api import notifications
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://93.184.216.34/callback',
+    'http:///callback',
+    'http://127.0.0.1:8000/callback',
+    'http://10.0.0.5/callback',
+    'http://192.168.1.1/callback',
+    'http://169.254.169.254/latest/meta-data',
+    'http://[::1]/callback',
+    'http://[::ffff:127.0.0.1]/callback',
+    'http://localhost/callback'
+])
+def test_internal_callback_url_is_blocked(url):
+    with pytest.raises(ValueError):
+        notifications.check_callback_url(url)
+
+
+def test_public_callback_url_is_allowed():
+    notifications.check_callback_url('https://93.184.216.34/callback')
+
+
+def test_allowed_hosts_are_the_only_ones(monkeypatch):
+    monkeypatch.setattr(notifications, 'CALLBACK_ALLOWED_HOSTS', ['callbacks.internal'])
+    notifications.check_callback_url('http://callbacks.internal/callback')
+    with pytest.raises(ValueError):
+        notifications.check_callback_url('https://93.184.216.34/callback')
+
+
+def test_blocked_callback_is_not_sent(monkeypatch):
+    monkeypatch.setattr(notifications.requests, 'post', lambda *args, **kwargs: pytest.fail("The callback was sent"))
+    assert not notifications.send_callback('http://127.0.0.1/callback', 'blocked')
+
+
+def test_callback_is_sent_without_waiting(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    class Response:
+        status_code = 200
+
+    def post(url, json, **kwargs):
+        release.wait(10)
+        calls.append((url, json, kwargs.get('allow_redirects')))
+        return Response()
+
+    monkeypatch.setattr(notifications.requests, 'post', post)
+    future = notifications.submit_callback('https://93.184.216.34/callback', 'sent')
+    assert not future.done()
+    release.set()
+    assert future.result(10)
+    assert calls == [('https://93.184.216.34/callback', {'status': 'finished', 'document_id': 'sent'}, False)]
@@ -0,0 +1,9 @@
+""" Tests of the direct serializer of the output model (Document.to_output_json). """
+import orjson
+
+
+def test_output_json_equals_output_model(processed):
+    assert processed.to_output_json() == orjson.dumps(processed.to_output_model().dict())
+    assert processed.to_output_json('alias') == orjson.dumps(dict(processed.to_output_model().dict(),
+                                                                  document_id='alias'))
+
@@ -0,0 +1,76 @@
+""" Tests of the pipeline with the gazetteer backend (no model needed) on generated documents and of its router:
+the documents in flight, the prefilter and the sizes of the results. """
+import time
+
+import orjson
+import pytest
+
+from app.benchmarks.end_to_end import process_document
+from app.core.annotation_modul.apis import prefilter
+from app.core.annotation_modul.processing_context import ProcessingContext
+from app.core.metrics import RESULT_STORE_RETAINED_BYTES
+from app.routers import annotation
+from app.tests.utils import gazetteer_document, submit, wait_for, get_results
+
+
+def test_document_is_annotated(processed):
+    assert processed.annotations
+    assert processed.knowledgeObjects
+
+
+def test_changed_document_in_flight_is_refused(client, held_tasks):
+    document = gazetteer_document('in-flight', seed=7)
+    submit(client, document)
+    changed = gazetteer_document('in-flight', seed=8)
+    assert client.post('/annotation/extract_annotations', data=orjson.dumps(changed)).status_code == 409
+    assert submit(client, document)['status'] == 'pending'
+
+    held_tasks.set()
+    wait_for(client, ['in-flight'])
+    assert get_results(client, 'in-flight') == orjson.loads(process_document(document).to_output_json())
+    assert submit(client, changed)['status'] == 'pending'
+    wait_for(client, ['in-flight'])
+
+
+def test_renewed_context_keeps_the_settings_of_the_submission():
+    context = ProcessingContext('renewed', deadline=12.5)
+    context.profiling = True
+    context.start()
+    context.next_id('word')
+
+    renewed = context.renew()
+    assert (renewed.document_id, renewed.deadline, renewed.profiling) == ('renewed', 12.5, True)
+    assert renewed.started is None
+    assert renewed.peek_id('word') == ProcessingContext.FIRST_IDS['word']
+
+
+def test_gazetteer_backend_is_not_prefiltered(processed, monkeypatch):
+    monkeypatch.setattr(prefilter, 'NER_PREFILTER', 'on')
+    monkeypatch.setattr(prefilter.PREFILTER, 'is_candidate', lambda sentence: False)
+    assert process_document(gazetteer_document()).to_output_json() == processed.to_output_json()
+
+
+def test_result_sizes_are_estimated_when_asked_for(client):
+    submit(client, gazetteer_document('lazily-sized', seed=12))
+    wait_for(client, ['lazily-sized'])
+    annotation.RESULT_SIZE_EXECUTOR.submit(lambda: None).result()
+    assert 'lazily-sized' not in annotation.result_sizes_database
+
+    status = client.get('/annotation/get_task_status/', params={'document_id': 'lazily-sized', 'memory': True}).json()
+    assert status['memory']['retained_bytes'] == annotation.result_sizes_database['lazily-sized'] > 0
+
+
+def test_result_sizes_are_estimated_in_the_background(client, monkeypatch):
+    monkeypatch.setattr(annotation, 'MEMORY_ACCOUNTING', True)
+    submit(client, gazetteer_document('sized', seed=11))
+    wait_for(client, ['sized'])
+    end = time.monotonic() + 10
+    while 'sized' not in annotation.result_sizes_database:
+        assert time.monotonic() < end, "The size of the result was not estimated"
+        time.sleep(0.01)
+    assert annotation.result_sizes_database['sized'] > 0
+
+    # A scrape only sums the estimated sizes
+    monkeypatch.setattr(annotation, 'get_retained_size', lambda *args: pytest.fail("A result was walked"))
+    annotation.result_sizes_database.pop('sized')
+    assert RESULT_STORE_RETAINED_BYTES.get_values()[()] == sum(annotation.result_sizes_database.values())
@@ -0,0 +1,61 @@
+""" Tests of the scheduler with fake tasks that block until they are released. """
+import threading
+
+from app.core.task_api.scheduler import Scheduler
+
+LANES = {
+    'interactive': {'max_cost': 100, 'weight': 3, 'reserved_workers': 1},
+    'batch': {'max_cost': None, 'weight': 1}
+}
+
+
+class FakeTasks:
+
+    def __init__(self):
+        self.started = {}
+        self.release = threading.Event()
+
+    def submit(self, scheduler: Scheduler, document_id: str, cost: float) -> threading.Event:
+        self.started[document_id] = threading.Event()
+        scheduler.submit(document_id, cost, self.run, document_id)
+        return self.started[document_id]
+
+    def run(self, document_id: str) -> None:
+        self.started[document_id].set()
+        self.release.wait(10)
+
+
+def test_large_documents_leave_a_worker_to_the_interactive_lane():
+    scheduler = Scheduler(LANES, workers=2)
+    tasks = FakeTasks()
+    try:
+        first_batch = tasks.submit(scheduler, 'batch-1', 10000)
+        second_batch = tasks.submit(scheduler, 'batch-2', 10000)
+        assert first_batch.wait(5)
+        assert not second_batch.wait(0.2)
+        assert scheduler.in_flight('batch') == 1
+
+        assert tasks.submit(scheduler, 'interactive', 10).wait(5)
+        assert not second_batch.is_set()
+    finally:
+        tasks.release.set()
+    assert second_batch.wait(5)
+
+
+def test_interactive_lane_may_use_every_worker():
+    scheduler = Scheduler(LANES, workers=2)
+    tasks = FakeTasks()
+    try:
+        started = [tasks.submit(scheduler, f'interactive-{_}', 10) for _ in range(2)]
+        assert all([_.wait(5) for _ in started])
+        assert scheduler.in_flight('interactive') == 2
+    finally:
+        tasks.release.set()
+
+
+def test_single_worker_serves_every_lane():
+    scheduler = Scheduler(LANES, workers=1)
+    assert scheduler.get_lane_limit('batch') == 1
+    tasks = FakeTasks()
+    tasks.release.set()
+    assert tasks.submit(scheduler, 'batch', 10000).wait(5)
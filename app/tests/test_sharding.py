@@ -0,0 +1,49 @@
+""" Tests of the sharding: a document annotated in shards by worker processes has the same ids and output as a
+document annotated serially. """
+import logging
+
+import pytest
+
+from app.benchmarks.end_to_end import process_document
+from app.benchmarks.generator import generate_document
+from app.benchmarks.stub_model import stubbed_model
+from app.core.annotation_modul.apis import sharding_api
+from app.core.annotation_modul.apis.sharding_api import ShardingStrategy
+
+
+def enable_sharding(monkeypatch) -> None:
+    """ Shards every document with two worker processes. The workers are forked, so they have the stubbed model and
+    the tokenizer of the tests. """
+    monkeypatch.setattr(sharding_api, 'SHARD_WORKERS', 2)
+    monkeypatch.setattr(sharding_api, 'SHARDING_MIN_COST', 0)
+    monkeypatch.setattr(sharding_api, 'SHARD_START_METHOD', 'fork')
+
+
+@pytest.fixture()
+def shard_pool():
+    yield
+    if ShardingStrategy.POOL is not None:
+        ShardingStrategy.POOL.shutdown()
+        ShardingStrategy.POOL = None
+
+
+@pytest.mark.parametrize('backend', ['gazetteer', 'cascade'])
+def test_sharded_document_equals_serial_document(backend, shard_pool, monkeypatch, caplog):
+    # 4 chapters, the abstract and 2 tables
+    document = dict(generate_document('sharded', chapters=4, tables=2), ner_backend=backend, incremental=False)
+    with stubbed_model():
+        serial = process_document(document).to_output_json()
+        enable_sharding(monkeypatch)
+        with caplog.at_level(logging.INFO, logger=sharding_api.__name__):
+            sharded = process_document(document).to_output_json()
+
+    assert any(['in 7 shards' in _.getMessage() for _ in caplog.records])
+    assert sharded == serial
+
+
+def test_broken_pool_is_replaced(shard_pool, monkeypatch):
+    enable_sharding(monkeypatch)
+    pool = ShardingStrategy.get_pool()
+    ShardingStrategy.reset_pool(pool)
+    assert ShardingStrategy.POOL is None
+    assert ShardingStrategy.get_pool() is not pool
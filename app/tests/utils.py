@@ -0,0 +1,33 @@
+""" Helpers of the tests that submit generated documents with the gazetteer backend (no model needed) to the router. """
+import time
+from typing import Dict, List
+
+import orjson
+from fastapi.testclient import TestClient
+
+from app.benchmarks.generator import generate_document
+
+
+def gazetteer_document(document_id: str = 'test', seed: int = 0, incremental: bool = False) -> Dict:
+    return dict(generate_document(document_id, seed=seed), ner_backend='gazetteer', incremental=incremental)
+
+
+def submit(client: TestClient, document: Dict, **params) -> Dict:
+    response = client.post('/annotation/extract_annotations', data=orjson.dumps(document), params=params)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def wait_for(client: TestClient, document_ids: List[str], timeout: float = 60) -> None:
+    end = time.monotonic() + timeout
+    for document_id in document_ids:
+        while client.get('/annotation/get_task_status/', params={'document_id': document_id}).json()['status'] in \
+                ['pending', 'working']:
+            assert time.monotonic() < end, f"The task of {document_id} did not finish"
+            time.sleep(0.05)
+
+
+def get_results(client: TestClient, document_id: str) -> Dict:
+    response = client.get('/annotation/get_task_results/', params={'document_id': document_id})
+    assert response.status_code == 200, response.text
+    return response.json()
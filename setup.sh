@@ -12,11 +12,16 @@ pip3 instal -r /app/requirements.txt
 
 cp ./app/ /app
 
-# Starts the server as a gunicorn server under the ip-adress 0.0.0.0:80 with 4 workers
+# Compiles the resources (app/core/files) into the bundle the workers map into memory
+(cd / && python3 -m app.core.annotation_modul.resources)
+
+# Starts the server as a pre-forked gunicorn server under the ip-adress 0.0.0.0:80 with 4 workers
+# The master loads the models once, the workers share them (see app/gunicorn_conf.py)
 /usr/local/bin/gunicorn \
-  -b 0.0.0.0 80 \
+  -c /app/gunicorn_conf.py \
+  -b 0.0.0.0:80 \
   -w 4 \
-  -k uvicorn.works.UvicornWorker main:app \
+  main:app \
   --chdir /app
 
 